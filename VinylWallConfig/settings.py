@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'configurator.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -117,6 +118,15 @@ DATABASES = {
         'PORT': '5432',
     }
 }
+# A local SQLite database instead of Postgres, e.g. to run the tests and benchmarks offline
+if os.getenv("DB_SQLITE_PATH"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DB_SQLITE_PATH"),
+            "OPTIONS": {"timeout": 20},
+        }
+    }
 
 
 # Password validation
@@ -143,6 +153,24 @@ CHANNEL_LAYERS = {
     },
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+# Seconds a serialized shelf is kept in the cache. Entries are keyed on the shelf revision and never go stale.
+SHELF_CACHE_TIMEOUT = int(os.environ.get("SHELF_CACHE_TIMEOUT", default=3600))
+# Number of Spotify searches of the library search running in the background at the same time
+LIBRARY_SEARCH_WORKERS = int(os.environ.get("LIBRARY_SEARCH_WORKERS", default=4))
+# Seconds the results of a background search can be fetched after it finished
+LIBRARY_SEARCH_TIMEOUT = int(os.environ.get("LIBRARY_SEARCH_TIMEOUT", default=300))
+# Directory the resized album covers are stored in
+COVER_CACHE_ROOT = os.environ.get("COVER_CACHE_ROOT", default=os.path.join(BASE_DIR, "cover_cache"))
+# Whether covers are handed to nginx with X-Accel-Redirect instead of being sent by Django
+COVER_CACHE_X_ACCEL = bool(int(os.environ.get("COVER_CACHE_X_ACCEL", default=0)))
+# Number of covers downloaded at the same time by the background cover fetcher
+COVER_FETCH_WORKERS = int(os.environ.get("COVER_FETCH_WORKERS", default=4))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ConfiguratorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'configurator'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from configurator.metrics import install_query_counter
+
+        connection_created.connect(install_query_counter)
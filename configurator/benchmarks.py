@@ -0,0 +1,302 @@
+import asyncio
+import itertools
+import time
+import tracemalloc
+from typing import Callable, NamedTuple
+
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from configurator import dispatch, library_search
+from configurator.daemon_client import async_music_daemon, music_daemon
+from configurator.metrics import count_queries
+from configurator.models import Album, Device, Shelf, ShelfSpot, VWCSetting
+from configurator.tracing import summarize
+from helper_services.fake_music_daemon import FakeMusicDaemon
+
+
+class SyntheticLibrary(NamedTuple):
+    """
+    The size of the dataset generated by `create_library`.
+
+    Attributes:
+        albums (int): The number of albums in the library.
+        shelves (int): The number of shelves.
+        rows (int): The number of rows of every shelf.
+        cols (int): The number of columns of every shelf.
+    """
+    albums: int = 50000
+    shelves: int = 100
+    rows: int = 30
+    cols: int = 30
+
+
+BENCHMARKS: dict[str, Callable[[int, SyntheticLibrary], dict]] = {}
+
+# Upper bound for the 99th percentile of resolving a pressed key, in seconds.
+DISPATCH_P99_TARGET = 100e-6
+# The GPIO listener reports keys as bitmask over 8 pins.
+MAX_KEY = 2 ** 8 - 1
+# Latency injected into the fake daemon when benchmarking concurrent button presses, in seconds.
+BUTTON_DAEMON_LATENCY = 0.2
+# Concurrent button presses must all be answered within this multiple of the daemon latency.
+BUTTON_WALL_TARGET_FACTOR = 2
+# Edge lengths of the square shelves duplicated by the duplicate_shelf benchmark.
+DUPLICATE_SHELF_SIZES = (4, 16, 32)
+# Number of distinct artists of the synthetic library, every artist has albums / ARTISTS albums.
+ARTISTS = 500
+# Metrics compared by `compare_results`, the query counts are deterministic and may not grow at all.
+COMPARED_METRICS = ("queries", "peak_memory", "p50")
+
+
+def benchmark(name: str):
+    """
+    Register a function as benchmark, making it available to the `benchmark` management command.
+
+    The function receives the number of iterations and the size of the synthetic library and returns a dictionary of
+    results. A result dictionary may contain the key "passed" to report whether a latency target was met.
+
+    :param name: The name under which the benchmark is selected on the command line.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def time_calls(func: Callable[[], object], iterations: int,
+               settle: Callable[[], object] | None = None) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+        if settle is not None:
+            settle()
+    return samples
+
+
+def measure(func: Callable[[], object], iterations: int, settle: Callable[[], object] | None = None) -> dict:
+    """
+    Measure the wall time, the number of database queries and the peak memory of a call.
+
+    The call is made once to warm up caches, once to count its queries, once with tracemalloc to find the peak of the
+    memory allocated by it, and `iterations` times to measure its duration.
+
+    :param func: The function to measure, returning the response if it is a request.
+    :param iterations: The number of timed calls.
+    :param settle: Called after every call without being measured, e.g. to wait for work the call started in the
+        background.
+    :return: A dictionary with the duration summary (see `summarize`), the queries, the peak memory in bytes and the
+        status code of the response.
+    """
+    settle = settle or (lambda: None)
+    response = func()
+    settle()
+    with count_queries() as queries:
+        func()
+    settle()
+    tracemalloc.start()
+    try:
+        func()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    settle()
+    return {"duration": summarize(time_calls(func, iterations, settle)),
+            "queries": queries[0],
+            "peak_memory": peak_memory,
+            "status": getattr(response, "status_code", None)}
+
+
+def create_library(library: SyntheticLibrary) -> list[Shelf]:
+    """
+    Create a library of albums and shelves filled with them, the first shelf is the active one.
+
+    Albums are spread over `ARTISTS` artists, so searching an artist matches a realistic share of the library. Keys
+    are assigned to the first spots of every shelf as long as keys are available.
+
+    :param library: The size of the dataset.
+    :return: The created shelves.
+    """
+    albums = [Album(name=f"Album {index}", image_url=f"https://i.scdn.co/image/{index}",
+                    uri=f"spotify:album:synthetic-{index}", external_url="", href="", release_date="2020",
+                    artist=f"Artist {index % ARTISTS}", in_library=True)
+              for index in range(library.albums)]
+    Album._bulk_insert(albums)
+    shelves = Shelf.objects.bulk_create(Shelf(name=f"Wall {index}", active=index == 0)
+                                        for index in range(library.shelves))
+    positions = list(itertools.product(range(library.rows), range(library.cols)))
+    spots = []
+    for shelf_index, shelf in enumerate(shelves):
+        for index, (row, col) in enumerate(positions):
+            album = albums[(shelf_index * len(positions) + index) % len(albums)]
+            key = index + 1 if index < MAX_KEY else None
+            spots.append(ShelfSpot(row_index=row, col_index=col, shelf=shelf, playable=album, associated_key=key))
+    ShelfSpot.objects.bulk_create(spots, batch_size=1000)
+    return shelves
+
+
+def compare_results(previous: dict, current: dict, tolerance: float, path: str = "") -> list[tuple[str, float, float]]:
+    """
+    Find the metrics of the `COMPARED_METRICS` that got worse between two benchmark runs.
+
+    :param previous: The results of the earlier run, as returned by the benchmarks.
+    :param current: The results of the later run.
+    :param tolerance: The relative increase of durations and memory that is not reported, e.g. 0.2 for 20%.
+    :param path: The path of the results within the results of the runs, used in the returned paths.
+    :return: The path, the previous and the current value of every metric that got worse.
+    """
+    regressions = []
+    for key, value in current.items():
+        before = previous.get(key) if isinstance(previous, dict) else None
+        key_path = f"{path}.{key}" if path else key
+        if isinstance(value, dict):
+            regressions += compare_results(before or {}, value, tolerance, key_path)
+        elif key in COMPARED_METRICS and isinstance(before, (int, float)) and isinstance(value, (int, float)):
+            allowed = before if key == "queries" else before * (1 + tolerance)
+            if value > allowed:
+                regressions.append((key_path, before, value))
+    return regressions
+
+
+def create_wall(name: str, rows: int, cols: int, active: bool = False) -> Shelf:
+    """
+    Create a shelf filled with newly created albums, assigning keys to its spots as long as keys are available.
+
+    :param name: The name of the shelf.
+    :param rows: The number of rows of the wall.
+    :param cols: The number of columns of the wall.
+    :param active: Whether the shelf is the active one.
+    :return: The created shelf.
+    """
+    shelf = Shelf.objects.create(name=name, active=active)
+    spots = []
+    for index, (row, col) in enumerate(itertools.product(range(rows), range(cols))):
+        album = Album.objects.create(name=f"{name} {row}/{col}", image=b"", image_url="",
+                                     uri=f"spotify:album:{name}-{row}-{col}", external_url="", href="",
+                                     json_response="{}", release_date="2020", artist=f"Artist {index}")
+        key = index + 1 if index < MAX_KEY else None
+        spots.append(ShelfSpot(row_index=row, col_index=col, shelf=shelf, playable=album, associated_key=key))
+    ShelfSpot.objects.bulk_create(spots)
+    return shelf
+
+
+@benchmark("dispatch")
+def bench_dispatch(iterations: int, library: SyntheticLibrary) -> dict:
+    Device.objects.create(device_id="benchmark", device_name="Benchmark", device_type="Computer", active=True)
+    create_wall("Dispatch", 16, 16, active=True)
+    keys = itertools.cycle(range(1, MAX_KEY + 1))
+
+    rebuild = summarize(time_calls(dispatch.rebuild, max(iterations // 100, 1)))
+    lookup = summarize(time_calls(lambda: dispatch.lookup(next(keys)), iterations))
+    return {"rebuild": rebuild,
+            "lookup": lookup,
+            "target_p99": DISPATCH_P99_TARGET,
+            "passed": lookup["p99"] <= DISPATCH_P99_TARGET}
+
+
+@benchmark("button_concurrency")
+def bench_button_concurrency(iterations: int, library: SyntheticLibrary) -> dict:
+    VWCSetting.objects.create(setting_name="listening_shelfspot")
+    Device.objects.create(device_id="benchmark", device_name="Benchmark", device_type="Computer", active=True)
+    create_wall("Buttons", 4, 4, active=True)
+    dispatch.rebuild()
+    presses = async_music_daemon.POOL_SIZE
+    client = AsyncClient()
+
+    async def press(key):
+        start = time.perf_counter()
+        response = await client.post(reverse("configurator:handle_button"), {"key": key},
+                                     content_type="application/json")
+        return time.perf_counter() - start, response.status_code
+
+    async def burst():
+        # the first press sets up the connection pool of the event loop
+        await press(1)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(press(i % 16 + 1) for i in range(presses)))
+        return results, time.perf_counter() - start
+
+    base_url = async_music_daemon.base_url
+    with FakeMusicDaemon() as fake:
+        fake.latency = BUTTON_DAEMON_LATENCY
+        async_music_daemon.base_url = fake.url
+        try:
+            results, wall = asyncio.run(burst())
+        finally:
+            async_music_daemon.base_url = base_url
+
+    target_wall = BUTTON_DAEMON_LATENCY * BUTTON_WALL_TARGET_FACTOR
+    return {"presses": presses,
+            "daemon_latency": BUTTON_DAEMON_LATENCY,
+            "press": summarize([duration for duration, _ in results]),
+            "wall": wall,
+            "target_wall": target_wall,
+            "passed": wall <= target_wall and all(status == 200 for _, status in results)}
+
+
+@benchmark("duplicate_shelf")
+def bench_duplicate_shelf(iterations: int, library: SyntheticLibrary) -> dict:
+    repetitions = max(iterations // 1000, 1)
+    results = {}
+    for size in DUPLICATE_SHELF_SIZES:
+        shelf = create_wall(f"Duplicate {size}", size, size)
+        with CaptureQueriesContext(connection) as queries:
+            samples = time_calls(lambda: Shelf.duplicate(shelf, with_keys=True), repetitions)
+        results[f"{size}x{size}"] = {"spots": size * size,
+                                     "queries": len(queries) // repetitions,
+                                     "duration": summarize(samples)}
+    # every copy adds a name to resolve, the query count must neither depend on them nor on the size of the shelf
+    query_counts = {result["queries"] for result in results.values()}
+    return {"shelves": results,
+            "passed": len(query_counts) == 1}
+
+
+@benchmark("endpoints")
+def bench_endpoints(iterations: int, library: SyntheticLibrary) -> dict:
+    start = time.perf_counter()
+    shelves = create_library(library)
+    setup_duration = time.perf_counter() - start
+    VWCSetting.objects.create(setting_name="listening_shelfspot")
+    Device.objects.create(device_id="benchmark", device_name="Benchmark", device_type="Computer", active=True)
+    # the spots were bulk created without rebuilding the dispatch table
+    dispatch.invalidate()
+    repetitions = max(iterations // 200, 5)
+    client = Client()
+    async_client = AsyncClient()
+    # one event loop for all presses, so the connections to the daemon are reused like in the server
+    loop = asyncio.new_event_loop()
+
+    def press():
+        return loop.run_until_complete(async_client.post(reverse("configurator:handle_button"), {"key": 5},
+                                                         content_type="application/json"))
+
+    requests = {
+        "shelf_json": lambda: client.get(reverse("configurator:shelf_json", args=(shelves[-1].id,))),
+        "active_shelf_json": lambda: client.get(reverse("configurator:active_shelf")),
+        "playable_library": lambda: client.get(reverse("configurator:album_library")),
+        # on the loop of the presses, which runs the Spotify searches started in the background
+        "playable_library_search": lambda: loop.run_until_complete(
+            async_client.get(reverse("configurator:album_library"), {"search_txt": "Artist 7"})),
+        "pick_shelf_json": lambda: client.get(reverse("configurator:pick_shelf_json")),
+        "duplicate_shelf": lambda: client.get(reverse("configurator:duplicate_shelf", args=(shelves[-1].id,))),
+        "handle_button": press,
+    }
+    base_urls = music_daemon.base_url, async_music_daemon.base_url
+    with FakeMusicDaemon() as fake:
+        music_daemon.base_url = async_music_daemon.base_url = fake.url
+        try:
+            # the answer is measured, not the Spotify search it starts, which must not overlap with the next one
+            settles = {"playable_library_search": lambda: loop.run_until_complete(library_search.wait_for_searches())}
+            results = {name: measure(request, repetitions, settles.get(name)) for name, request in requests.items()}
+        finally:
+            music_daemon.base_url, async_music_daemon.base_url = base_urls
+            loop.run_until_complete(async_music_daemon.aclose())
+            loop.close()
+    return {"library": library._asdict(),
+            "setup_duration": setup_duration,
+            "endpoints": results,
+            "passed": all(result["status"] == 200 for result in results.values())}
@@ -0,0 +1,55 @@
+from typing import Iterable
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from configurator.models import ShelfSpot
+
+# The group of the consumers waiting for a button press to assign a key to a shelf spot
+KEY_ASSIGNMENT_GROUP = "key_assignment"
+
+
+def shelf_group(shelf_id: int) -> str:
+    return f"shelf_{shelf_id}"
+
+
+def publish_shelf_change(shelf_id: int, change: str, **data):
+    """
+    Send a change of a shelf to the consumers subscribed to it, once the current transaction is committed.
+
+    :param shelf_id: The id of the changed shelf.
+    :param change: The kind of change, e.g. "spots_changed".
+    :param data: The JSON serializable details of the change.
+    """
+    event = {"type": "shelf.change", "change": change, "shelf_id": int(shelf_id), **data}
+    transaction.on_commit(lambda: async_to_sync(get_channel_layer().group_send)(shelf_group(shelf_id), event))
+
+
+def spots_changed(shelf_id: int, revision: int, spots: Iterable[ShelfSpot], removed_spot_ids: Iterable[int] = ()):
+    """
+    Publish added or modified spots. Their playables should be loaded already, to avoid a query per spot.
+
+    Clients missing a revision between the last one they know and the published one fetch the changes since.
+    """
+    publish_shelf_change(shelf_id, "spots_changed", revision=revision, spots=[spot.to_dict() for spot in spots],
+                         removed=list(removed_spot_ids))
+
+
+def spot_removed(shelf_id: int, revision: int, spot_id: int):
+    publish_shelf_change(shelf_id, "spot_removed", revision=revision, spot_id=spot_id)
+
+
+def shelf_activated(shelf_id: int, active: bool):
+    publish_shelf_change(shelf_id, "shelf_activated", active=active)
+
+
+def key_assigned(shelfspot_id: int, key: int):
+    """
+    Notify the waiting configure consumers that a key was assigned to a shelf spot.
+
+    :param shelfspot_id: The id of the shelf spot the key was assigned to.
+    :param key: The assigned key.
+    """
+    async_to_sync(get_channel_layer().group_send)(
+        KEY_ASSIGNMENT_GROUP, {"type": "key.assigned", "shelfspot_id": shelfspot_id, "key": key})
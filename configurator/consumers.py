@@ -1,52 +1,174 @@
+import asyncio
 import json
-import time
 from pprint import pprint
 
-from channels.generic.websocket import WebsocketConsumer
-from configurator.models import VWCSetting, ShelfSpot
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer, AsyncJsonWebsocketConsumer
+from django.core.cache import cache
+from django.http import Http404
 
+from configurator import library_search, broadcasts, dispatch
+from configurator.metrics import WEBSOCKET_SESSIONS, WEBSOCKET_SESSIONS_OPENED
+from configurator.models import ShelfSpot
+from configurator.tracing import new_trace_id
 
-class ConfigureConsumer(WebsocketConsumer):
-    def connect(self):
-        self.accept()
 
-    def disconnect(self, close_code):
-        VWCSetting.reset_listening_shelfspot()
+class SessionMetricsMixin:
+    """
+    Counts the open websocket sessions of a consumer in `metrics.WEBSOCKET_SESSIONS`.
+    """
+    async def __call__(self, scope, receive, send):
+        consumer = type(self).__name__
+        WEBSOCKET_SESSIONS_OPENED.labels(consumer).inc()
+        sessions = WEBSOCKET_SESSIONS.labels(consumer)
+        sessions.inc()
+        try:
+            return await super().__call__(scope, receive, send)
+        finally:
+            sessions.dec()
 
-    def receive(self, text_data):
+
+class ConfigureConsumer(SessionMetricsMixin, AsyncWebsocketConsumer):
+    """
+    Assigns the next pressed key to the shelf spot selected by the client.
+
+    After a spot is selected, a countdown is sent every second while waiting for the `key.assigned` event that
+    `assign_from_key` sends when the key arrives. The success message is sent as soon as the event is received.
+    """
+    # Seconds to wait for a button press after a spot was selected
+    DURATION = 10
+
+    async def connect(self):
+        self.shelfspot_id = None
+        self.assigned = asyncio.Event()
+        self.listening_task: asyncio.Task | None = None
+        await self.channel_layer.group_add(broadcasts.KEY_ASSIGNMENT_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(broadcasts.KEY_ASSIGNMENT_GROUP, self.channel_name)
+        if self.listening_task is not None and not self.listening_task.done():
+            self.listening_task.cancel()
+            await database_sync_to_async(dispatch.reset_listening_shelfspot)()
+
+    async def receive(self, text_data):
         pprint(text_data)
         text_data_json = json.loads(text_data)
         shelfspot_id = text_data_json["shelfspot_id"]
-        shelfspot: ShelfSpot = ShelfSpot.objects.filter(id=shelfspot_id).first()
-        VWCSetting.set_listening_shelfspot(shelfspot_id)
-        DURATION = 10
-        for i in range(DURATION + 1):
-            if VWCSetting.get_listening_shelfspot() == shelfspot_id:
-                message = f"{DURATION-i}"
-
-                self.send(text_data=json.dumps({"message": message,
-                                                "states": {
-                                                    shelfspot_id: 0
-                                                },
-                                                "last_message": False,
-                                                "source_shelfspot_id": shelfspot_id}))
-            else:
-                message = "Success"
-                self.send(text_data=json.dumps({"message": message,
-                                                "states": {
-                                                    neighbouring_shelfspot.id: 1 - (neighbouring_shelfspot.associated_key is None) * 2
-                                                    for neighbouring_shelfspot in shelfspot.shelf.shelfspot_set.all()
-                                                },
-                                                "last_message": True,
-                                                "source_shelfspot_id": shelfspot_id}))
-                break
-            time.sleep(1)
+        shelf_id = await ShelfSpot.objects.filter(id=shelfspot_id).values_list("shelf_id", flat=True).afirst()
+        if shelf_id is None:
+            return
+        if self.listening_task is not None:
+            self.listening_task.cancel()
+        self.shelfspot_id = shelfspot_id
+        self.assigned = asyncio.Event()
+        await database_sync_to_async(dispatch.set_listening_shelfspot)(shelfspot_id)
+        # waiting happens in a task, so the consumer keeps receiving events in the meantime
+        self.listening_task = asyncio.create_task(self.wait_for_key(shelfspot_id, shelf_id, self.assigned))
+
+    async def key_assigned(self, event):
+        if event["shelfspot_id"] == self.shelfspot_id:
+            self.assigned.set()
+
+    async def wait_for_key(self, shelfspot_id: int, shelf_id: int, assigned: asyncio.Event):
+        for remaining in range(self.DURATION, -1, -1):
+            await self.send_state(f"{remaining}", {shelfspot_id: 0}, False, shelfspot_id)
+            try:
+                await asyncio.wait_for(assigned.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            await self.send_state("Success", await self.key_states(shelf_id), True, shelfspot_id)
+            return
+        await self.send_state("Did not receive any button input", await self.key_states(shelf_id), True,
+                              shelfspot_id)
+        await database_sync_to_async(dispatch.reset_listening_shelfspot)()
+
+    async def send_state(self, message: str, states: dict, last_message: bool, shelfspot_id: int):
+        await self.send(text_data=json.dumps({"message": message,
+                                              "states": states,
+                                              "last_message": last_message,
+                                              "source_shelfspot_id": shelfspot_id}))
+
+    @staticmethod
+    async def key_states(shelf_id: int) -> dict:
+        """
+        :return: 1 for every spot of the shelf with an associated key, -1 for every spot without one.
+        """
+        return {spot_id: 1 - (key is None) * 2 async for spot_id, key in
+                ShelfSpot.objects.filter(shelf_id=shelf_id).values_list("id", "associated_key")}
+
+
+class LibrarySearchConsumer(SessionMetricsMixin, AsyncJsonWebsocketConsumer):
+    """
+    Sends the albums found by a background library search once, then closes the connection.
+
+    The search is identified by the token returned with the local results. If the search already finished when the
+    client connects, the stored result is sent right away.
+    """
+    async def connect(self):
+        self.token = self.scope["url_route"]["kwargs"]["token"]
+        self.sent = False
+        await self.channel_layer.group_add(library_search.group_name(self.token), self.channel_name)
+        await self.accept()
+        result = await cache.aget(library_search.result_key(self.token))
+        if result is None:
+            await self.send_result({"done": True, "album_list": [], "error": "Unknown search token"})
+        elif result["done"]:
+            await self.send_result(result)
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(library_search.group_name(self.token), self.channel_name)
+
+    async def search_results(self, event):
+        await self.send_result({key: value for key, value in event.items() if key != "type"})
+
+    async def send_result(self, result):
+        if self.sent:
+            return
+        self.sent = True
+        await self.send_json(result)
+        await self.close()
+
+
+class ShelfConsumer(SessionMetricsMixin, AsyncJsonWebsocketConsumer):
+    """
+    Forwards the changes of a shelf to a client displaying it, as published by `configurator.broadcasts`.
+    """
+    async def connect(self):
+        self.group_name = broadcasts.shelf_group(self.scope["url_route"]["kwargs"]["shelf_id"])
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def shelf_change(self, event):
+        await self.send_json({key: value for key, value in event.items() if key != "type"})
+
+
+class ButtonConsumer(SessionMetricsMixin, AsyncJsonWebsocketConsumer):
+    """
+    Ingress of the GPIO listener, receiving the pressed keys over a single persistent connection.
+
+    Every message {"id": 1, "key": 5} is handled like a POST to `handle_button` and answered with the status and the
+    content of its response, e.g. {"id": 1, "status": 200, "trace_id": ..., "selected_playable": ..., "device": ...}.
+    The optional fields "trace_id" and "queued" of a message continue the trace started by the listener. Presses are
+    handled in the order they arrive.
+    """
+    async def receive_json(self, content, **kwargs):
+        from configurator.views import press_key
+
+        message_id = content.get("id") if isinstance(content, dict) else None
+        try:
+            key = int(content["key"])
+        except (KeyError, TypeError, ValueError):
+            await self.send_json({"id": message_id, "status": 400, "error": "Expected a message with an integer key"})
+            return
+        trace_id = content.get("trace_id") or new_trace_id()
+        try:
+            response = await press_key(key, trace_id, content.get("queued"))
+        except Http404 as e:
+            await self.send_json({"id": message_id, "status": 404, "trace_id": trace_id, "error": str(e)})
         else:
-            self.send(text_data=json.dumps({"message": "Did not receive any button input",
-                                            "states": {
-                                                    neighbouring_shelfspot.id: 1 - (neighbouring_shelfspot.associated_key is None) * 2
-                                                    for neighbouring_shelfspot in shelfspot.shelf.shelfspot_set.all()
-                                                },
-                                            "last_message": True,
-                                            "source_shelfspot_id": shelfspot_id}))
-        VWCSetting.reset_listening_shelfspot()
+            await self.send_json({"id": message_id, "status": response.status_code, "trace_id": trace_id,
+                                  **json.loads(response.content)})
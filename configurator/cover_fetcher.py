@@ -0,0 +1,152 @@
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+import requests
+from django.db import close_old_connections, DatabaseError
+from django.utils import timezone
+
+from configurator.covers import cache_image_url, CoverError
+from configurator.models import CoverFetchTask
+from VinylWallConfig.settings import COVER_FETCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Downloads of a cover are given up after this many failures
+MAX_ATTEMPTS = 5
+# Seconds before the first retry of a failed download, doubled with every further failure
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+# Seconds between checks for due retries while no new covers are enqueued
+POLL_INTERVAL = 30
+
+
+def retry_delay(attempts: int) -> datetime.timedelta:
+    return datetime.timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def enqueue(image_urls: Iterable[str]):
+    """
+    Persist covers to be downloaded by the cover fetcher. Covers already waiting are not enqueued again.
+
+    :param image_urls: The URLs of the covers, URLs not pointing to a remote image are skipped.
+    """
+    tasks = [CoverFetchTask(image_url=url) for url in set(image_urls) if url.startswith("http")]
+    if tasks:
+        CoverFetchTask.objects.bulk_create(tasks, ignore_conflicts=True, batch_size=500)
+        cover_fetcher.wake()
+
+
+class CoverFetcher:
+    """
+    Downloads the covers of the persisted CoverFetchTasks with a bounded number of threads.
+
+    Only as many tasks are taken from the database as there are idle threads, so a large backlog stays in the
+    database instead of piling up in memory. Every URL is downloaded by at most one thread at a time. Failed downloads
+    are retried with exponential backoff until MAX_ATTEMPTS is reached.
+
+    Attributes:
+        workers (int): The maximum number of concurrent downloads.
+    """
+    def __init__(self, workers: int = COVER_FETCH_WORKERS):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cover-fetcher")
+        self._in_flight: set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        # sessions are not thread-safe, every thread keeps its own connections to the CDN
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _fetch(self, task_id: int, image_url: str):
+        close_old_connections()
+        try:
+            cache_image_url(image_url, self._session())
+        except Exception as e:
+            if not isinstance(e, (CoverError, requests.RequestException)):
+                # e.g. a full cover cache, retried with backoff like failed downloads instead of right away
+                logger.exception("Caching the cover %s failed", image_url)
+            task = CoverFetchTask.objects.filter(pk=task_id).first()
+            if task is not None:
+                task.attempts += 1
+                task.next_attempt_at = timezone.now() + retry_delay(task.attempts)
+                task.last_error = str(e)[:512]
+                task.save(update_fields=["attempts", "next_attempt_at", "last_error"])
+        else:
+            CoverFetchTask.objects.filter(pk=task_id).delete()
+        finally:
+            with self._lock:
+                self._in_flight.discard(image_url)
+            close_old_connections()
+            self._wake.set()
+
+    def run_pending(self) -> int:
+        """
+        Start downloading due covers, as many as there are idle threads.
+
+        :return: The number of started downloads.
+        """
+        with self._lock:
+            idle = self.workers - len(self._in_flight)
+            busy = list(self._in_flight)
+        if idle <= 0:
+            return 0
+        due = (CoverFetchTask.objects
+               .filter(attempts__lt=MAX_ATTEMPTS, next_attempt_at__lte=timezone.now())
+               .exclude(image_url__in=busy)
+               .order_by("next_attempt_at", "id")
+               .values_list("id", "image_url")[:idle])
+        started = 0
+        for task_id, image_url in due:
+            with self._lock:
+                self._in_flight.add(image_url)
+            self._executor.submit(self._fetch, task_id, image_url)
+            started += 1
+        return started
+
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._in_flight)
+
+    def drain(self):
+        """
+        Download covers until no task is due and no download is running, blocking the calling thread.
+        """
+        while self.run_pending() or self.busy():
+            self._wake.wait(timeout=POLL_INTERVAL)
+            self._wake.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=POLL_INTERVAL)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.run_pending()
+            except DatabaseError:
+                # the database is unavailable for now, the tasks are picked up again after the next wake up
+                pass
+
+    def start(self):
+        """
+        Start processing the persisted tasks in a background thread, including the ones left from before a restart.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="cover-fetcher", daemon=True)
+        self._thread.start()
+        self.wake()
+
+
+cover_fetcher = CoverFetcher()
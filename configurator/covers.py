@@ -0,0 +1,123 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+from collections import defaultdict
+
+import requests
+from django.urls import reverse
+from PIL import Image
+
+from configurator.models import Playable, Shelf, ShelfSpot
+from VinylWallConfig.settings import COVER_CACHE_ROOT
+
+# Longest edge in pixels of the resized variants stored for every cover
+VARIANTS = {
+    "thumb": 160,
+    "texture": 512,
+}
+JPEG_QUALITY = 85
+# (connect, read) timeouts in seconds for downloading a cover from the Spotify CDN
+DOWNLOAD_TIMEOUT = (3, 15)
+# The internal nginx location mapped onto COVER_CACHE_ROOT
+X_ACCEL_PREFIX = "/cover_cache/"
+# Cover URLs contain the hash of the image, so they can be cached for a year
+MAX_AGE = 365 * 24 * 60 * 60
+HASH_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class CoverError(Exception):
+    """
+    Raised when a cover can not be downloaded or is not a readable image.
+    """
+
+
+def cover_relpath(variant: str, cover_hash: str) -> str:
+    return f"{variant}/{cover_hash[:2]}/{cover_hash}.jpg"
+
+
+def cover_path(variant: str, cover_hash: str) -> str:
+    return os.path.join(COVER_CACHE_ROOT, cover_relpath(variant, cover_hash))
+
+
+def cover_url(variant: str, cover_hash: str) -> str:
+    return reverse("configurator:album_cover", args=(variant, cover_hash))
+
+
+def _write_variant(image: Image.Image, variant: str, cover_hash: str):
+    path = cover_path(variant, cover_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    resized = image.copy()
+    resized.thumbnail((VARIANTS[variant], VARIANTS[variant]), Image.Resampling.LANCZOS)
+    # write to a temporary file first, so a concurrently served variant is never incomplete
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            resized.save(f, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def store_cover(data: bytes) -> str:
+    """
+    Store the resized variants of a cover image, addressed by the hash of the original image.
+
+    Variants that are already stored are not written again, so covers shared by several playables are kept once.
+
+    :param data: The original image, in any format Pillow can read.
+    :return: The hash identifying the cover.
+    :raises CoverError: If the data is not a readable image.
+    """
+    cover_hash = hashlib.sha256(data).hexdigest()
+    missing = [variant for variant in VARIANTS if not os.path.exists(cover_path(variant, cover_hash))]
+    if missing:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image = image.convert("RGB")
+                for variant in missing:
+                    _write_variant(image, variant, cover_hash)
+        except (OSError, Image.DecompressionBombError) as e:
+            raise CoverError(f"Invalid cover image: {e}") from e
+    return cover_hash
+
+
+def cache_image_url(image_url: str, session: requests.Session | None = None) -> str:
+    """
+    Download a cover and store it in the cover cache for all playables using it.
+
+    The shelves showing these playables are invalidated, so they are served with the local cover URLs.
+
+    :param image_url: The URL of the cover on the Spotify CDN.
+    :param session: The session to download with, allowing connections to the CDN to be reused.
+    :return: The hash identifying the cover.
+    :raises CoverError: If the CDN does not return an image.
+    :raises requests.RequestException: If the CDN can not be reached.
+    """
+    response = (session or requests).get(image_url, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code != 200:
+        raise CoverError(f"Downloading {image_url} returned status code {response.status_code}")
+    cover_hash = store_cover(response.content)
+
+    playable_ids = list(Playable.objects.filter(image_url=image_url).values_list("id", flat=True))
+    Playable.objects.filter(pk__in=playable_ids).update(cover_hash=cover_hash)
+    spots_by_shelf = defaultdict(list)
+    for shelf_id, spot_id in ShelfSpot.objects.filter(playable_id__in=playable_ids).values_list("shelf_id", "id"):
+        spots_by_shelf[shelf_id].append(spot_id)
+    for shelf_id, spot_ids in spots_by_shelf.items():
+        Shelf.record_change(shelf_id, changed_spot_ids=spot_ids)
+    return cover_hash
+
+
+def cache_cover(playable: Playable, session: requests.Session | None = None) -> str:
+    """
+    Download the cover of a playable, see `cache_image_url`.
+
+    :param playable: The playable, only its image_url is used.
+    :param session: The session to download with.
+    :return: The hash identifying the cover.
+    """
+    playable.cover_hash = cache_image_url(playable.image_url, session)
+    return playable.cover_hash
@@ -0,0 +1,192 @@
+import asyncio
+import time
+import weakref
+from typing import AsyncGenerator
+from urllib.parse import quote
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from configurator.metrics import observe_daemon_call
+from configurator.tracing import TRACE_HEADER, parse_server_timing
+from VinylWallConfig.settings import MUSIC_DAEMON_PATH
+
+
+class MusicDaemonError(requests.RequestException):
+    """
+    Raised when the music daemon answers with an unexpected status code.
+
+    Attributes:
+        status_code (int): The status code returned by the daemon.
+    """
+    def __init__(self, status_code: int, *args, **kwargs):
+        super().__init__(f"Music daemon returned status code {status_code}", *args, **kwargs)
+        self.status_code = status_code
+
+
+class MusicDaemonClient:
+    """
+    Client for the music daemon (helper_services/spotipy_daemon.py).
+
+    All calls share one session, so connections to the daemon are kept alive and reused. Every endpoint has its own
+    (connect, read) timeout and idempotent requests are retried a bounded number of times.
+
+    Attributes:
+        base_url (str): The URL the daemon is reachable at, e.g. "http://localhost:8082".
+    """
+    # (connect, read) timeouts in seconds
+    TIMEOUTS = {
+        "is_logged_in": (1, 5),
+        "auth_url": (1, 5),
+        "apply_code": (1, 10),
+        "devices": (1, 10),
+        "search_albums": (1, 15),
+        "play": (1, 15),
+    }
+    RETRIES = Retry(total=2, backoff_factor=0.1, status_forcelist=(502, 503, 504),
+                    allowed_methods=frozenset({"GET"}), raise_on_status=False)
+    POOL_SIZE = 10
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE, max_retries=self.RETRIES)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, endpoint: str, method: str, path: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.TIMEOUTS[endpoint], **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            observe_daemon_call(endpoint, status, time.perf_counter() - start)
+
+    def _request_ok(self, endpoint: str, method: str, path: str, **kwargs) -> requests.Response:
+        response = self._request(endpoint, method, path, **kwargs)
+        if response.status_code != 200:
+            raise MusicDaemonError(response.status_code, response=response)
+        return response
+
+    def is_logged_in(self) -> bool:
+        return self._request("is_logged_in", "GET", "/isLoggedIn").status_code == 200
+
+    def auth_url(self) -> str:
+        return self._request_ok("auth_url", "GET", "/auth_url").text
+
+    def apply_code(self, code: str):
+        """
+        Hand the code of the Spotify authorization flow to the daemon.
+
+        :param code: The code from the redirect URL of the authorization flow.
+        :raises MusicDaemonError: If the daemon rejects the code.
+        """
+        self._request_ok("apply_code", "GET", "/", params={"code": code})
+
+    def devices(self) -> list[dict]:
+        return self._request_ok("devices", "GET", "/devices").json()
+
+    def search_albums(self, query: str) -> list[dict]:
+        return self._request_ok("search_albums", "GET", "/search_album/" + quote(query, safe="")).json()
+
+    def play(self, device_id: str, playable_uri: str):
+        """
+        Start playback of a playable on a device.
+
+        :param device_id: The Spotify id of the device.
+        :param playable_uri: The URI of the album or playlist.
+        :raises MusicDaemonError: If the daemon fails to start the playback.
+        """
+        self._request_ok("play", "POST", "/play", json={"device": device_id, "playable_uri": playable_uri})
+
+
+class AsyncMusicDaemonClient:
+    """
+    Non-blocking client for the latency sensitive calls to the music daemon, used by the async button path.
+
+    Connections are pooled and kept alive per event loop, since they can not be shared between loops. The pool of a
+    loop is closed when the loop shuts down its async generators, which `asyncio.run` and `async_to_sync` do before
+    closing it. Loops closed without doing so have to call `aclose` first.
+
+    Attributes:
+        base_url (str): The URL the daemon is reachable at, e.g. "http://localhost:8082".
+    """
+    TIMEOUTS = MusicDaemonClient.TIMEOUTS
+    CONNECT_RETRIES = 2
+    POOL_SIZE = MusicDaemonClient.POOL_SIZE
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = \
+            weakref.WeakKeyDictionary()
+        self._closers: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGenerator] = \
+            weakref.WeakKeyDictionary()
+
+    async def _client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.POOL_SIZE, max_keepalive_connections=self.POOL_SIZE)
+            transport = httpx.AsyncHTTPTransport(retries=self.CONNECT_RETRIES, limits=limits)
+            client = httpx.AsyncClient(transport=transport)
+            self._clients[loop] = client
+            # a started async generator is finalized by the loop on shutdown
+            closer = self._close_on_shutdown(client)
+            await anext(closer)
+            self._closers[loop] = closer
+        return client
+
+    @staticmethod
+    async def _close_on_shutdown(client: httpx.AsyncClient):
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    async def aclose(self):
+        """
+        Close the connections of the running event loop, e.g. before closing the loop.
+        """
+        loop = asyncio.get_running_loop()
+        self._clients.pop(loop, None)
+        closer = self._closers.pop(loop, None)
+        if closer is not None:
+            await closer.aclose()
+
+    def _timeout(self, endpoint: str) -> httpx.Timeout:
+        connect, read = self.TIMEOUTS[endpoint]
+        return httpx.Timeout(read, connect=connect)
+
+    async def play(self, device_id: str, playable_uri: str, trace_id: str | None = None) -> dict[str, float]:
+        """
+        Start playback of a playable on a device without blocking the event loop.
+
+        :param device_id: The Spotify id of the device.
+        :param playable_uri: The URI of the album or playlist.
+        :param trace_id: The trace of the button press, passed on to the daemon.
+        :return: The durations of the stages of the daemon in seconds, as reported in its Server-Timing header.
+        :raises MusicDaemonError: If the daemon fails to start the playback.
+        :raises httpx.HTTPError: If the daemon can not be reached.
+        """
+        headers = {TRACE_HEADER: trace_id} if trace_id is not None else None
+        client = await self._client()
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await client.post(self.base_url + "/play",
+                                         json={"device": device_id, "playable_uri": playable_uri},
+                                         headers=headers, timeout=self._timeout("play"))
+            status = response.status_code
+        finally:
+            observe_daemon_call("play", status, time.perf_counter() - start)
+        if response.status_code != 200:
+            raise MusicDaemonError(response.status_code)
+        return parse_server_timing(response.headers.get("Server-Timing", ""))
+
+
+music_daemon = MusicDaemonClient(MUSIC_DAEMON_PATH)
+async_music_daemon = AsyncMusicDaemonClient(MUSIC_DAEMON_PATH)
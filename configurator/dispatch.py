@@ -0,0 +1,136 @@
+import threading
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+
+from configurator.models import Device, ShelfSpot, VWCSetting
+
+
+class Dispatch(NamedTuple):
+    """
+    The target of a button press.
+
+    Attributes:
+        playable_uri (str): The URI of the playable associated with the pressed key on the active shelf.
+        device_id (str | None): The Spotify id of the active device, None if no device is active.
+    """
+    playable_uri: str
+    device_id: str | None
+
+
+_lock = threading.Lock()
+_table: dict[int, Dispatch] | None = None
+# The shelf spot waiting for a key to be assigned, loaded with the first table and then kept up to date by
+# `set_listening_shelfspot`
+_listening_shelfspot: int | None = None
+_listening_loaded = False
+
+
+def build_table() -> dict[int, Dispatch]:
+    """
+    Build the mapping of key bitmasks to their dispatch target for the active shelf.
+
+    :return: A dictionary mapping every assigned key of the active shelf to a Dispatch.
+    """
+    device_id = Device.objects.filter(active=True).values_list("device_id", flat=True).first()
+    assigned_spots = (ShelfSpot.objects
+                      .filter(shelf__active=True, associated_key__isnull=False, playable__isnull=False)
+                      .values_list("associated_key", "playable__uri"))
+    return {key: Dispatch(uri, device_id) for key, uri in assigned_spots}
+
+
+def rebuild():
+    """
+    Rebuild the dispatch table from the database, loading the shelf spot waiting for a key as well the first time.
+
+    Has to be called whenever the active shelf, the active device or the key assignments or playables of the active
+    shelf change. The table lives in the memory of the current process only.
+
+    :return: The new dispatch table.
+    """
+    global _table, _listening_shelfspot, _listening_loaded
+    table = build_table()
+    if not _listening_loaded:
+        listening_shelfspot = (VWCSetting.objects.filter(setting_name="listening_shelfspot")
+                               .values_list("value_int", flat=True).first())
+    with _lock:
+        _table = table
+        if not _listening_loaded:
+            _listening_shelfspot = listening_shelfspot
+            _listening_loaded = True
+    return table
+
+
+def invalidate():
+    """
+    Drop the dispatch table and the shelf spot waiting for a key, both are loaded again with the next lookup.
+
+    :return: None
+    """
+    global _table, _listening_loaded
+    with _lock:
+        _table = None
+        _listening_loaded = False
+
+
+def set_listening_shelfspot(shelfspot_id: int | None):
+    """
+    Store the shelf spot the next pressed key is assigned to, in the database and next to the dispatch table.
+
+    :param shelfspot_id: The id of the shelf spot, None to play the pressed keys again.
+    :return: None
+    """
+    global _listening_shelfspot, _listening_loaded
+    VWCSetting.set_listening_shelfspot(shelfspot_id)
+    with _lock:
+        _listening_shelfspot = shelfspot_id
+        _listening_loaded = True
+
+
+def reset_listening_shelfspot():
+    set_listening_shelfspot(None)
+
+
+def listening_shelfspot() -> int | None:
+    """
+    :return: The id of the shelf spot waiting for a key, without any database round trip unless the table has not
+        been built yet.
+    """
+    if _table is None:
+        rebuild()
+    return _listening_shelfspot
+
+
+async def alistening_shelfspot() -> int | None:
+    """
+    Async variant of `listening_shelfspot`, building the table in a worker thread if necessary.
+    """
+    if _table is None:
+        await sync_to_async(rebuild)()
+    return _listening_shelfspot
+
+
+def lookup(key: int) -> Dispatch | None:
+    """
+    Resolve a pressed key without any database round trip, unless the table has not been built yet.
+
+    :param key: The key bitmask sent by the button listener.
+    :return: The Dispatch for the key or None if the key is not assigned on the active shelf.
+    """
+    table = _table
+    if table is None:
+        table = rebuild()
+    return table.get(key)
+
+
+async def alookup(key: int) -> Dispatch | None:
+    """
+    Async variant of `lookup`, building the table in a worker thread if necessary.
+
+    :param key: The key bitmask sent by the button listener.
+    :return: The Dispatch for the key or None if the key is not assigned on the active shelf.
+    """
+    table = _table
+    if table is None:
+        table = await sync_to_async(rebuild)()
+    return table.get(key)
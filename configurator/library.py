@@ -0,0 +1,98 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import Q, QuerySet
+
+from configurator import cover_fetcher
+from configurator.daemon_client import music_daemon
+from configurator.models import Playable, Album
+
+PAGE_LIMIT = 20
+# The placeholder playable put on empty shelf spots, it is never part of the library.
+DUMMY_PLAYABLE_ID = 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def library_queryset(search_txt: str = "") -> QuerySet:
+    """
+    Return the playables of the library matching a search, in the order they are presented.
+
+    Without search text, only playables in the library are returned, ordered by the time they were added. With a
+    search text, all playables whose name, artist, owner or description contains the text are returned, the ones in
+    the library first. Every playable is contained at most once, independent of how many of its fields match.
+
+    :param search_txt: The text to search for, may be empty.
+    :return: A queryset of playables ordered by (in_library descending, created_at, id).
+    """
+    playables = Playable.objects.exclude(pk=DUMMY_PLAYABLE_ID)
+    if search_txt == "":
+        playables = playables.filter(in_library=True)
+    else:
+        playables = playables.filter(Q(name__icontains=search_txt) |
+                                     Q(album__artist__icontains=search_txt) |
+                                     Q(playlist__owner__icontains=search_txt) |
+                                     Q(playlist__description__icontains=search_txt))
+    return (playables
+            .only("id", "name", "image_url", "cover_hash", "in_library", "created_at")
+            .order_by("-in_library", "created_at", "id"))
+
+
+def encode_cursor(playable: Playable) -> str:
+    position = [playable.in_library, playable.created_at.isoformat(), playable.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Q:
+    """
+    Translate a cursor into the condition selecting all playables following the position it marks.
+
+    :param cursor: A cursor as created by `encode_cursor`.
+    :return: A Q object matching the playables ordered after the cursor position.
+    :raises InvalidCursor: If the cursor is malformed.
+    """
+    try:
+        in_library, created_at, playable_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = datetime.datetime.fromisoformat(created_at)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+    after = Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=playable_id)
+    if in_library:
+        return Q(in_library=False) | Q(after, in_library=True)
+    return Q(after, in_library=False)
+
+
+def library_page(search_txt: str, cursor: str = "", limit: int = PAGE_LIMIT) -> tuple[list[Playable], str | None]:
+    """
+    Return a single page of the library using keyset pagination.
+
+    :param search_txt: The text to search for, may be empty.
+    :param cursor: The cursor returned with the previous page, empty for the first page.
+    :param limit: The maximum number of playables on the page.
+    :return: The playables of the page and the cursor of the next page, None if this is the last page.
+    :raises InvalidCursor: If the cursor is malformed.
+    """
+    playables = library_queryset(search_txt)
+    if cursor:
+        playables = playables.filter(decode_cursor(cursor))
+    page = list(playables[:limit + 1])
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
+
+
+def add_albums_from_daemon(search_txt: str) -> list[Album]:
+    """
+    Search Spotify for albums, store the ones not known yet and enqueue their covers for download, together with the
+    changed covers of known albums.
+
+    :param search_txt: The text to search for.
+    :return: The newly created albums.
+    """
+    created, changed_covers = Album.upsert_from_json(music_daemon.search_albums(search_txt))
+    cover_fetcher.enqueue(album.image_url for album in created + changed_covers)
+    return created
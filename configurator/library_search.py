@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from configurator.library import library_queryset, add_albums_from_daemon
+from VinylWallConfig.settings import LIBRARY_SEARCH_TIMEOUT, LIBRARY_SEARCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Spotify searches run in threads, so they block neither the event loop nor the response of the search request.
+_executor = ThreadPoolExecutor(max_workers=LIBRARY_SEARCH_WORKERS, thread_name_prefix="library-search")
+# References to the running searches, tasks are only weakly referenced by the event loop.
+_searches: set[asyncio.Task] = set()
+
+
+def group_name(token: str) -> str:
+    return f"library_search_{token}"
+
+
+def result_key(token: str) -> str:
+    return f"library_search:{token}"
+
+
+def fetch_new_albums(search_txt: str) -> list[dict]:
+    """
+    Search Spotify for albums and store the ones not known yet.
+
+    Runs in a worker thread, so it manages its own database connection like a request would.
+
+    :param search_txt: The text to search for.
+    :return: The serialized new albums that match the search like the local results do.
+    """
+    close_old_connections()
+    try:
+        created = add_albums_from_daemon(search_txt)
+        matching = library_queryset(search_txt).filter(pk__in=[album.pk for album in created])
+        return [playable.to_dict() for playable in matching]
+    finally:
+        close_old_connections()
+
+
+async def _remote_search(token: str, search_txt: str):
+    loop = asyncio.get_running_loop()
+    try:
+        album_list = await loop.run_in_executor(_executor, fetch_new_albums, search_txt)
+        result = {"done": True, "album_list": album_list}
+    except requests.RequestException as e:
+        result = {"done": True, "album_list": [], "error": str(e)}
+    except Exception as e:
+        # e.g. a locked database or an unexpected answer of the daemon, the clients must not wait for the search forever
+        logger.exception("Searching Spotify for %r failed", search_txt)
+        result = {"done": True, "album_list": [], "error": str(e) or type(e).__name__}
+    await cache.aset(result_key(token), result, LIBRARY_SEARCH_TIMEOUT)
+    await get_channel_layer().group_send(group_name(token), {"type": "search.results", **result})
+
+
+def start_remote_search(search_txt: str) -> str:
+    """
+    Start searching Spotify in the background, must be called from within the event loop serving the requests.
+
+    Once the search finished, the new albums are sent to the websocket consumers of the group of the returned token
+    and kept for `LIBRARY_SEARCH_TIMEOUT` seconds to be fetched with the token.
+
+    :param search_txt: The text to search for.
+    :return: The token identifying the search.
+    """
+    token = secrets.token_hex(16)
+    cache.set(result_key(token), {"done": False, "album_list": []}, LIBRARY_SEARCH_TIMEOUT)
+    task = asyncio.get_running_loop().create_task(_remote_search(token, search_txt))
+    _searches.add(task)
+    task.add_done_callback(_searches.discard)
+    return token
+
+
+async def wait_for_searches():
+    """
+    Wait until all running background searches finished.
+    """
+    while _searches:
+        await asyncio.gather(*_searches)
+
+
+def get_result(token: str) -> dict | None:
+    return cache.get(result_key(token))
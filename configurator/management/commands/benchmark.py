@@ -0,0 +1,93 @@
+import datetime
+import json
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test.utils import (setup_databases, teardown_databases, setup_test_environment,
+                               teardown_test_environment)
+
+from configurator import dispatch
+from configurator.benchmarks import BENCHMARKS, SyntheticLibrary, compare_results
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Run benchmarks of the hot paths against a throwaway test database. "
+            "Fails if a benchmark misses its latency target or got worse than the results it is compared to.")
+
+    def add_arguments(self, parser):
+        library = SyntheticLibrary()
+        parser.add_argument("names", nargs="*",
+                            help=f"The benchmarks to run, all if omitted. One of: {', '.join(sorted(BENCHMARKS))}")
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--albums", type=int, default=library.albums,
+                            help="The number of albums of the synthetic library.")
+        parser.add_argument("--shelves", type=int, default=library.shelves,
+                            help="The number of shelves of the synthetic library.")
+        parser.add_argument("--wall-size", type=int, default=library.rows,
+                            help="The number of rows and columns of the shelves of the synthetic library.")
+        parser.add_argument("--output",
+                            help="Store the results as JSON in this file, e.g. benchmark_results/main.json.")
+        parser.add_argument("--compare", help="Compare the results with the ones stored by an earlier run.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="The relative increase of durations and memory tolerated by --compare.")
+
+    def handle(self, *args, **options):
+        names = options["names"] or sorted(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        previous = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+        library = SyntheticLibrary(options["albums"], options["shelves"], options["wall_size"], options["wall_size"])
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        results = {}
+        try:
+            for name in names:
+                results[name] = BENCHMARKS[name](options["iterations"], library)
+                # every benchmark starts with an empty database
+                call_command("flush", interactive=False, verbosity=0)
+                dispatch.invalidate()
+            vendor = connection.vendor
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        run = {"commit": current_commit(),
+               "created_at": datetime.datetime.now(datetime.timezone.utc),
+               "database": vendor,
+               "python": platform.python_version(),
+               "iterations": options["iterations"],
+               "results": results}
+        output = json.dumps(run, indent=2, cls=DjangoJSONEncoder)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+
+        failed = [name for name, result in results.items() if not result.get("passed", True)]
+        if failed:
+            raise CommandError(f"Latency target missed: {', '.join(failed)}")
+        if previous is not None:
+            regressions = compare_results(previous["results"], results, options["tolerance"])
+            for path, before, after in regressions:
+                self.stderr.write(f"{path}: {before:g} -> {after:g}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} metrics got worse than in {options['compare']}")
+            self.stdout.write(f"No regressions compared to {options['compare']}", self.style.SUCCESS)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from configurator import cover_fetcher
+from configurator.cover_fetcher import CoverFetcher, MAX_ATTEMPTS
+from configurator.models import Playable, CoverFetchTask
+from VinylWallConfig.settings import COVER_FETCH_WORKERS
+
+
+class Command(BaseCommand):
+    help = ("Download the covers of all playables that are not in the cover cache yet, "
+            "together with the covers waiting in the queue of the cover fetcher.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=COVER_FETCH_WORKERS,
+                            help="The number of covers downloaded at the same time.")
+        parser.add_argument("--retry-failed", action="store_true",
+                            help="Also retry covers whose downloads were given up.")
+
+    def handle(self, *args, **options):
+        missing = (Playable.objects.filter(cover_hash="", image_url__startswith="http")
+                   .values_list("image_url", flat=True).distinct())
+        cover_fetcher.enqueue(missing.iterator())
+        if options["retry_failed"]:
+            CoverFetchTask.objects.filter(attempts__gte=MAX_ATTEMPTS).update(attempts=0)
+
+        pending = CoverFetchTask.objects.count()
+        self.stdout.write(f"Downloading {pending} covers with {options['workers']} workers.")
+        CoverFetcher(workers=options["workers"]).drain()
+
+        failed = CoverFetchTask.objects.count()
+        self.stdout.write(f"Cached {pending - failed} covers, {failed} failed or are waiting for a retry.")
@@ -0,0 +1,27 @@
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from VinylWallConfig.settings import BASE_DIR
+
+INIT_FIXTURE = BASE_DIR / "configurator" / "fixtures" / "init.json"
+
+
+class Command(BaseCommand):
+    help = ("Create the objects of the init fixture that do not exist yet. Unlike loaddata, existing objects are kept "
+            "as they are, so it is safe to run on every start.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fixture", default=str(INIT_FIXTURE), help="The JSON fixture to load.")
+
+    def handle(self, *args, **options):
+        created = 0
+        with open(options["fixture"]) as f, transaction.atomic():
+            for deserialized in serializers.deserialize("json", f):
+                obj = deserialized.object
+                # Overwriting e.g. the revision of a shelf would clash with its logged changes
+                if type(obj)._base_manager.filter(pk=obj.pk).exists():
+                    continue
+                deserialized.save()
+                created += 1
+        self.stdout.write(f"Created {created} objects of {options['fixture']}.")
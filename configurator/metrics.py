@@ -0,0 +1,107 @@
+import contextlib
+import contextvars
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from helper_services.metrics import Registry
+
+# Upper bounds of the buckets of the number of database queries of a request
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+registry = Registry()
+REQUESTS = registry.counter("vwc_http_requests", "HTTP requests handled by Django", ("view", "method", "status"))
+REQUEST_DURATION = registry.histogram("vwc_http_request_duration_seconds", "Duration of the HTTP requests", ("view",))
+REQUEST_QUERIES = registry.histogram("vwc_http_request_db_queries", "Database queries of the HTTP requests", ("view",),
+                                     buckets=QUERY_BUCKETS)
+DAEMON_CALLS = registry.counter("vwc_daemon_calls", "Calls of the music daemon, status is error if it was unreachable",
+                                ("endpoint", "status"))
+DAEMON_CALL_DURATION = registry.histogram("vwc_daemon_call_duration_seconds",
+                                          "Duration of the calls of the music daemon", ("endpoint",))
+WEBSOCKET_SESSIONS = registry.gauge("vwc_websocket_sessions", "Open websocket sessions", ("consumer",))
+WEBSOCKET_SESSIONS_OPENED = registry.counter("vwc_websocket_sessions_opened", "Opened websocket sessions",
+                                             ("consumer",))
+
+# The query counters of the enclosing `count_queries` blocks. Counters are lists, so they are shared with the threads
+# of sync_to_async, which run in copies of the context.
+_query_counters: contextvars.ContextVar[tuple[list[int], ...]] = contextvars.ContextVar("query_counters", default=())
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the queries of the enclosing `count_queries` blocks, installed on every
+    connection by `install_query_counter`.
+    """
+    for queries in _query_counters.get():
+        queries[0] += 1
+    return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Count the database queries of the enclosed block, including the ones run by sync_to_async and on other
+    connections.
+
+    :return: A list holding the number of queries so far.
+    """
+    queries = [0]
+    token = _query_counters.set(_query_counters.get() + (queries,))
+    try:
+        yield queries
+    finally:
+        _query_counters.reset(token)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Receiver of `connection_created`."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def observe_daemon_call(endpoint: str, status: int | str, duration: float):
+    """
+    :param endpoint: The name of the endpoint of the daemon, e.g. "play".
+    :param status: The status code of the answer, "error" if the daemon could not be reached.
+    :param duration: The duration of the call in seconds.
+    """
+    DAEMON_CALLS.labels(endpoint, status).inc()
+    DAEMON_CALL_DURATION.labels(endpoint).observe(duration)
+
+
+class MetricsMiddleware:
+    """
+    Counts the requests per view, method and status and observes their duration and number of database queries.
+
+    Views are labelled by their URL name, so the number of label values is bounded by the URL patterns.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with count_queries() as queries:
+            response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    @staticmethod
+    def _observe(request, response, duration: float, queries: int):
+        view = getattr(request.resolver_match, "view_name", None) or "unmatched"
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_DURATION.labels(view).observe(duration)
+        REQUEST_QUERIES.labels(view).observe(queries)
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configurator', '0006_alter_vwcsetting_value_str'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shelf',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
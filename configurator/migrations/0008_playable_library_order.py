@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configurator', '0007_shelf_revision'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playable',
+            index=models.Index(fields=['-in_library', 'created_at', 'id'], name='playable_library_order'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:27
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def deduplicate_playables(apps, schema_editor):
+    """
+    Merge playables sharing a URI into the oldest one, repointing the shelf spots of the removed copies.
+    """
+    Playable = apps.get_model("configurator", "Playable")
+    ShelfSpot = apps.get_model("configurator", "ShelfSpot")
+    duplicates = (Playable.objects.order_by().values("uri")
+                  .annotate(keep_id=Min("id"), copies=Count("id"))
+                  .filter(copies__gt=1))
+    for duplicate in duplicates:
+        copies = Playable.objects.filter(uri=duplicate["uri"]).exclude(pk=duplicate["keep_id"])
+        ShelfSpot.objects.filter(playable__in=copies).update(playable_id=duplicate["keep_id"])
+        if copies.filter(in_library=True).exists():
+            Playable.objects.filter(pk=duplicate["keep_id"]).update(in_library=True)
+        copies.delete()
+
+
+def deduplicate_devices(apps, schema_editor):
+    """
+    Keep a single device per Spotify device id, preferring the active one and otherwise the oldest one.
+    """
+    Device = apps.get_model("configurator", "Device")
+    seen = set()
+    for device in Device.objects.order_by("device_id", "-active", "id"):
+        if device.device_id in seen:
+            device.delete()
+        else:
+            seen.add(device.device_id)
+
+
+class Migration(migrations.Migration):
+    # The deduplication commits before the unique constraints are added. On PostgreSQL, altering a table with pending
+    # deferred foreign key checks of the deleted rows fails.
+    atomic = False
+
+    dependencies = [
+        ('configurator', '0008_playable_library_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_devices, migrations.RunPython.noop, atomic=True),
+        migrations.RunPython(deduplicate_playables, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='device',
+            name='device_id',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='playable',
+            name='uri',
+            field=models.CharField(max_length=512, unique=True),
+        ),
+    ]
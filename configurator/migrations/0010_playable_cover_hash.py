@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configurator', '0009_unique_playable_uri_device_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playable',
+            name='cover_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
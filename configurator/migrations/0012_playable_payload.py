@@ -0,0 +1,74 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:35
+
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def move_payloads(apps, schema_editor):
+    """
+    Copy the JSON responses (compressed) and images of all playables into their payloads.
+    """
+    Playable = apps.get_model("configurator", "Playable")
+    PlayablePayload = apps.get_model("configurator", "PlayablePayload")
+    payloads = []
+    for playable_id, json_response, image in (Playable.objects.order_by("id")
+                                              .values_list("id", "json_response", "image")
+                                              .iterator(chunk_size=BATCH_SIZE)):
+        payloads.append(PlayablePayload(playable_id=playable_id,
+                                        json_response_z=zlib.compress(json_response.encode()) if json_response else b"",
+                                        image=bytes(image or b"")))
+        if len(payloads) >= BATCH_SIZE:
+            PlayablePayload.objects.bulk_create(payloads)
+            payloads = []
+    PlayablePayload.objects.bulk_create(payloads)
+
+
+def restore_payloads(apps, schema_editor):
+    Playable = apps.get_model("configurator", "Playable")
+    PlayablePayload = apps.get_model("configurator", "PlayablePayload")
+    for payload in PlayablePayload.objects.iterator(chunk_size=BATCH_SIZE):
+        json_response = zlib.decompress(payload.json_response_z).decode() if payload.json_response_z else ""
+        Playable.objects.filter(pk=payload.playable_id).update(json_response=json_response,
+                                                               image=bytes(payload.image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configurator', '0011_cover_fetch_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayablePayload',
+            fields=[
+                ('playable', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='configurator.playable')),
+                ('json_response_z', models.BinaryField(default=b'')),
+                ('image', models.BinaryField(default=b'')),
+            ],
+        ),
+        migrations.RunPython(move_payloads, restore_payloads),
+        # defaults allow the columns to be added back to existing rows when migrating backwards
+        migrations.AlterField(
+            model_name='playable',
+            name='image',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AlterField(
+            model_name='playable',
+            name='json_response',
+            field=models.CharField(default='', max_length=32768),
+        ),
+        migrations.RemoveField(
+            model_name='playable',
+            name='image',
+        ),
+        migrations.RemoveField(
+            model_name='playable',
+            name='json_response',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configurator', '0012_playable_payload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShelfChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField()),
+                ('changed_spots', models.JSONField(default=list)),
+                ('removed_spots', models.JSONField(default=list)),
+                ('shelf', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='configurator.shelf')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shelfchange',
+            constraint=models.UniqueConstraint(fields=('shelf', 'revision'), name='shelf_change_revision'),
+        ),
+    ]
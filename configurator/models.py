@@ -1,9 +1,13 @@
 import datetime
 import json
+import re
+import zlib
+from typing import Iterable
 
 import requests
-from django.db import models
+from django.db import models, transaction, connection, IntegrityError
 from django.db.models import CheckConstraint, Q, F
+from django.utils import timezone
 
 
 # Create your models here.
@@ -25,7 +29,7 @@ class Device(models.Model):
         activate(): Activates the device.
         deactivate(): Deactivates the device.
     """
-    device_id = models.CharField(max_length=64)
+    device_id = models.CharField(max_length=64, unique=True)
     active = models.BooleanField(default=False)
     device_name = models.CharField(max_length=256)
     device_type = models.CharField(max_length=256)
@@ -77,6 +81,37 @@ class Device(models.Model):
             device.save()
         return device
 
+    @staticmethod
+    def upsert_from_json(json_dicts):
+        """
+        Insert new devices and refresh the name and type of known ones, using a constant number of queries.
+
+        :param json_dicts: A list of dictionaries containing the device details as returned by the daemon.
+        :return: The newly created Device objects.
+        """
+        devices = {device.device_id: device for device in map(Device.from_json, json_dicts)}
+        try:
+            with transaction.atomic():
+                return Device._upsert(devices)
+        except IntegrityError:
+            # A concurrent request inserted some of the devices in the meantime, they are refreshed instead
+            with transaction.atomic():
+                return Device._upsert(devices)
+
+    @staticmethod
+    def _upsert(devices):
+        devices = dict(devices)
+        fields = ["device_name", "device_type"]
+        stale = []
+        for known in Device.objects.filter(device_id__in=devices.keys()):
+            fresh = devices.pop(known.device_id)
+            if any(getattr(known, field) != getattr(fresh, field) for field in fields):
+                for field in fields:
+                    setattr(known, field, getattr(fresh, field))
+                stale.append(known)
+        Device.objects.bulk_update(stale, fields)
+        return Device.objects.bulk_create(list(devices.values()))
+
     def activate(self):
         """
         Activate the Device.
@@ -144,36 +179,86 @@ class Playable(models.Model):
 
     Attributes:
         name (str): The name of the playable.
-        image (bytes): The binary data of the image.
+        image (bytes): The binary data of the image, stored in the PlayablePayload and loaded on first access.
         image_url (str): The URL of the image.
         uri (str): The URI of the playable.
         external_url (str): The external URL of the playable.
         href (str): The href of the playable.
         created_at (datetime): The datetime when the playable was created.
         updated_at (datetime): The datetime when the playable was last updated.
-        json_response (str): The JSON response related to the playable.
+        json_response (str): The JSON response related to the playable, stored in the PlayablePayload and loaded on
+            first access.
         in_library (bool): Indicates whether the playable is in the library or not.
+        cover_hash (str): The hash of the cover in the local cover cache, empty if it is not cached yet.
 
     Methods:
         __str__(): Returns a string representation of the playable.
 
     """
     name = models.CharField(max_length=256)
-    image = models.BinaryField()
     image_url = models.CharField(max_length=512)
-    uri = models.CharField(max_length=512)
+    uri = models.CharField(max_length=512, unique=True)
     external_url = models.CharField(max_length=512)
     href = models.CharField(max_length=512)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    json_response = models.CharField(max_length=1024 * 32)
     in_library = models.BooleanField(default=False)
+    cover_hash = models.CharField(max_length=64, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-in_library", "created_at", "id"], name="playable_library_order"),
+        ]
 
     def __str__(self):
         return str(type(self).name) + " " + str(self.name)
 
+    def _get_payload_value(self, name):
+        changes = self.__dict__.get("_payload_changes", {})
+        if name in changes:
+            return changes[name]
+        if self.pk is None:
+            return PlayablePayload.DEFAULTS[name]
+        try:
+            return getattr(self.payload, name)
+        except PlayablePayload.DoesNotExist:
+            return PlayablePayload.DEFAULTS[name]
+
+    def _set_payload_value(self, name, value):
+        self.__dict__.setdefault("_payload_changes", {})[name] = value
+
+    @property
+    def json_response(self) -> str:
+        return self._get_payload_value("json_response")
+
+    @json_response.setter
+    def json_response(self, value: str):
+        self._set_payload_value("json_response", value)
+
+    @property
+    def image(self) -> bytes:
+        return self._get_payload_value("image")
+
+    @image.setter
+    def image(self, value: bytes):
+        self._set_payload_value("image", value)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        changes = self.__dict__.pop("_payload_changes", None)
+        if changes:
+            self._state.fields_cache.pop("payload", None)
+            PlayablePayload.objects.update_or_create(playable_id=self.pk, defaults=changes)
+
     def to_dict(self):
-        return {"id": self.id, "name": self.name, "image_url": self.image_url, "in_library": self.in_library}
+        if self.cover_hash:
+            from configurator.covers import cover_url
+            image_url = cover_url("texture", self.cover_hash)
+            thumbnail_url = cover_url("thumb", self.cover_hash)
+        else:
+            image_url = thumbnail_url = self.image_url
+        return {"id": self.id, "name": self.name, "image_url": image_url, "thumbnail_url": thumbnail_url,
+                "in_library": self.in_library}
 
     def __hash__(self):
         return hash(self.id)
@@ -181,6 +266,39 @@ class Playable(models.Model):
     def __eq__(self, other):
         return self.id == other.id
 
+class PlayablePayload(models.Model):
+    """
+    The rarely needed, large data of a playable, kept out of the playable table so listing playables stays cheap.
+
+    Attributes:
+        playable (Playable): The playable the data belongs to.
+        json_response_z (bytes): The zlib compressed JSON response of the Spotify API.
+        image (bytes): The binary data of the image.
+    """
+    DEFAULTS = {"json_response": "", "image": b""}
+
+    playable = models.OneToOneField(Playable, on_delete=models.CASCADE, primary_key=True, related_name="payload")
+    json_response_z = models.BinaryField(default=b"")
+    image = models.BinaryField(default=b"")
+
+    def __str__(self):
+        return f"Payload of playable {self.playable_id}"
+
+    @staticmethod
+    def compress(json_response: str) -> bytes:
+        return zlib.compress(json_response.encode())
+
+    @property
+    def json_response(self) -> str:
+        if not self.json_response_z:
+            return ""
+        return zlib.decompress(self.json_response_z).decode()
+
+    @json_response.setter
+    def json_response(self, value: str):
+        self.json_response_z = self.compress(value)
+
+
 class Album(Playable):
     """
     Represents an album with its attributes and methods.
@@ -248,6 +366,97 @@ class Album(Playable):
             album.save()
         return album
 
+    # Fields refreshed when a known album is found again, together with its JSON response
+    REFRESHED_FIELDS = ["name", "image_url", "external_url", "href", "release_date", "artist"]
+
+    @staticmethod
+    def upsert_from_json(json_dicts):
+        """
+        Insert new albums and refresh the metadata of known ones, using a constant number of queries.
+
+        Known albums are looked up by their URI in a single query. New albums are inserted with one multi-row INSERT
+        per table, stale ones are refreshed with a bulk update. The JSON responses of both are written with a single
+        upsert of their payloads. The shelves showing stale albums get a new revision with a single update. Stale
+        albums with a new image URL lose their cached cover.
+
+        :param json_dicts: A list of dictionaries as accepted by `Album.from_json`.
+        :return: The newly created Album objects and the known ones whose cover changed, both need their cover
+            downloaded.
+        """
+        albums = {album.uri: album for album in map(Album.from_json, json_dicts)}
+        try:
+            with transaction.atomic():
+                return Album._upsert(albums)
+        except IntegrityError:
+            # A concurrent search inserted some of the albums in the meantime, they are refreshed instead
+            with transaction.atomic():
+                return Album._upsert(albums)
+
+    @staticmethod
+    def _upsert(albums):
+        albums = dict(albums)
+        stale = []
+        changed_covers = []
+        now = timezone.now()
+        for known in Album.objects.filter(uri__in=albums.keys()):
+            fresh = albums.pop(known.uri)
+            if any(getattr(known, field) != getattr(fresh, field) for field in Album.REFRESHED_FIELDS):
+                if known.image_url != fresh.image_url:
+                    known.cover_hash = ""
+                    changed_covers.append(known)
+                for field in Album.REFRESHED_FIELDS:
+                    setattr(known, field, getattr(fresh, field))
+                known.json_response = fresh.json_response
+                known.updated_at = now
+                stale.append(known)
+        if stale:
+            Album.objects.bulk_update(stale, Album.REFRESHED_FIELDS + ["cover_hash", "updated_at"])
+            # like Shelf.bump_revision, for all shelves showing one of the albums
+            (Shelf.objects
+             .filter(pk__in=ShelfSpot.objects.filter(playable_id__in=[album.pk for album in stale]).values("shelf_id"))
+             .update(revision=F("revision") + 1, updated_at=now))
+
+        new_albums = list(albums.values())
+        if new_albums:
+            Album._bulk_insert(new_albums)
+
+        payloads = [PlayablePayload(playable_id=album.pk,
+                                    json_response_z=PlayablePayload.compress(album.json_response))
+                    for album in stale + new_albums]
+        PlayablePayload.objects.bulk_create(payloads, update_conflicts=True, unique_fields=["playable"],
+                                            update_fields=["json_response_z"])
+        for album in stale + new_albums:
+            album.__dict__.pop("_payload_changes", None)
+        return new_albums, changed_covers
+
+    @staticmethod
+    def _bulk_insert(albums, batch_size=300):
+        """
+        Insert albums including their playable rows, which `bulk_create` does not support for multi-table inheritance.
+        """
+        playable_fields = [f.attname for f in Playable._meta.concrete_fields if not f.primary_key]
+        playables = Playable.objects.bulk_create(
+            [Playable(**{field: getattr(album, field) for field in playable_fields}) for album in albums],
+            batch_size=batch_size)
+        for album, playable in zip(albums, playables):
+            for field in playable_fields:
+                setattr(album, field, getattr(playable, field))
+            album.id = album.playable_ptr_id = playable.id
+            album._state.adding = False
+
+        album_fields = [f for f in Album._meta.local_concrete_fields]
+        quote_name = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for start in range(0, len(albums), batch_size):
+                batch = albums[start:start + batch_size]
+                row_placeholder = "(" + ", ".join(["%s"] * len(album_fields)) + ")"
+                cursor.execute(
+                    f"INSERT INTO {quote_name(Album._meta.db_table)} "
+                    f"({', '.join(quote_name(f.column) for f in album_fields)}) "
+                    f"VALUES {', '.join([row_placeholder] * len(batch))}",
+                    [f.get_db_prep_save(getattr(album, f.attname), connection)
+                     for album in batch for f in album_fields])
+
 
 class Playlist(Playable):
     owner = models.CharField(max_length=256)
@@ -271,16 +480,79 @@ class Shelf(models.Model):
         active (bool): The status of the shelf.
         created_at (datetime): The date and time when the shelf was created.
         updated_at (datetime): The date and time when the shelf was last updated.
+        revision (int): Counter that is increased whenever the serialized representation of the shelf changes.
     """
     name = models.CharField(max_length=128)
     active = models.BooleanField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    revision = models.PositiveIntegerField(default=0)
 
     def to_dict(self):
-        return {"shelf_id": self.id, "name": self.name, "active": self.active,
-                "updated_at": self.updated_at,
-                'spot_matrix': generate_spot_matrix(self.shelfspot_set.all())}
+        from configurator.serializers import serialize_shelf
+        return serialize_shelf(self)
+
+    @staticmethod
+    def bump_revision(*shelf_ids):
+        """
+        Increase the revision of the given shelves, invalidating all cached representations of them.
+
+        :param shelf_ids: The ids of the shelves that changed.
+        :return: None
+        """
+        Shelf.objects.filter(pk__in=shelf_ids).update(revision=F("revision") + 1, updated_at=timezone.now())
+
+    @staticmethod
+    def duplicate(shelf: "Shelf", with_keys: bool = False) -> "Shelf":
+        """
+        Copy a shelf with all its spots. The copy is inactive and named like the original with the next free
+        "(n)" suffix, e.g. "Wall (2)" for "Wall" and "Wall (3)" for "Wall (2)".
+
+        Costs a constant number of queries, independent of the number of spots and of the copies made before.
+
+        :param shelf: The shelf to copy.
+        :param with_keys: Whether the copied spots keep the keys assigned to them.
+        :return: The new shelf.
+        """
+        match = re.search(r" ?\((\d+)\)$", shelf.name)
+        base_name = shelf.name[:match.start()] if match else shelf.name
+        ctd = int(match.group(1)) + 1 if match else 2
+        copy_name = re.compile(re.escape(base_name) + r" \((\d+)\)")
+        taken = {int(name_match.group(1))
+                 for name in Shelf.objects.filter(name__startswith=f"{base_name} (").values_list("name", flat=True)
+                 if (name_match := copy_name.fullmatch(name))}
+        while ctd in taken:
+            ctd += 1
+
+        with transaction.atomic():
+            new_shelf = Shelf.objects.create(name=f"{base_name} ({ctd})", active=False)
+            ShelfSpot._copy_spots(shelf.id, new_shelf.id, with_keys)
+        return new_shelf
+
+    @staticmethod
+    def record_change(shelf_id: int, changed_spot_ids: Iterable[int] = (), removed_spot_ids: Iterable[int] = ()) -> int:
+        """
+        Increase the revision of a shelf whose changes are limited to individual spots, and log which spots changed.
+
+        Clients knowing an older revision can then fetch only the spots changed since, see `serialize_shelf_delta`.
+        Changes to anything else of a shelf must use `bump_revision`, which forces clients to refetch the whole shelf.
+
+        :param shelf_id: The id of the changed shelf.
+        :param changed_spot_ids: The ids of the added or modified spots.
+        :param removed_spot_ids: The ids of the deleted spots.
+        :return: The new revision of the shelf.
+        """
+        with transaction.atomic():
+            Shelf.bump_revision(shelf_id)
+            # the updated row stays locked until the end of the transaction, so no other change can interleave
+            revision = Shelf.objects.filter(pk=shelf_id).values_list("revision", flat=True).get()
+            ShelfChange.objects.create(shelf_id=shelf_id, revision=revision, changed_spots=list(changed_spot_ids),
+                                       removed_spots=list(removed_spot_ids))
+            if revision % ShelfChange.KEEP_REVISIONS == 0:
+                (ShelfChange.objects.filter(shelf_id=shelf_id, revision__lte=revision - ShelfChange.KEEP_REVISIONS)
+                 .delete())
+        return revision
+
 
 class ShelfSpot(models.Model):
     """
@@ -319,11 +591,52 @@ class ShelfSpot(models.Model):
     def __str__(self):
         return f"Spot ({self.col_index}, {self.row_index}) [{self.playable.name[:20]}]"
 
+    @staticmethod
+    def _copy_spots(from_shelf_id: int, to_shelf_id: int, with_keys: bool):
+        """
+        Copy all spots of a shelf to another one with a single INSERT ... SELECT, the spots never leave the database.
+        `bulk_create` would need several queries for large shelves on backends limiting the number of parameters.
+        """
+        quote_name = connection.ops.quote_name
+        table = quote_name(ShelfSpot._meta.db_table)
+        now = ShelfSpot._meta.get_field("created_at").get_db_prep_save(timezone.now(), connection)
+        key = quote_name("associated_key") if with_keys else "NULL"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({quote_name('row_index')}, {quote_name('col_index')}, {quote_name('shelf_id')}, "
+                f"{quote_name('playable_id')}, {quote_name('associated_key')}, {quote_name('created_at')}, "
+                f"{quote_name('updated_at')}) "
+                f"SELECT {quote_name('row_index')}, {quote_name('col_index')}, %s, {quote_name('playable_id')}, {key}, "
+                f"%s, %s FROM {table} WHERE {quote_name('shelf_id')} = %s ORDER BY {quote_name('id')}",
+                [to_shelf_id, now, now, from_shelf_id])
+
     def to_dict(self):
-        return {"id": self.id, "row": self.row_index, "col": self.col_index, "playable": self.playable.to_dict(),
+        playable = self.playable.to_dict() if self.playable_id is not None else None
+        return {"id": self.id, "row": self.row_index, "col": self.col_index, "playable": playable,
                 "associated_key": self.associated_key}
 
 
+class ShelfChange(models.Model):
+    """
+    The spots changed by one revision of a shelf, written by `Shelf.record_change`.
+
+    At least the last `KEEP_REVISIONS` changes of every shelf are kept, older ones are deleted every `KEEP_REVISIONS`
+    revisions. Revisions without a change, because they were made by `Shelf.bump_revision` or are too old, can not be
+    sent as delta.
+    """
+    KEEP_REVISIONS = 256
+
+    shelf = models.ForeignKey(Shelf, on_delete=models.CASCADE)
+    revision = models.PositiveIntegerField()
+    changed_spots = models.JSONField(default=list)
+    removed_spots = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shelf", "revision"], name="shelf_change_revision"),
+        ]
+
+
 class VWCSetting(models.Model):
     setting_name = models.CharField(max_length=128)
     value_str = models.CharField(max_length=1024, null=True, unique=True)
@@ -346,6 +659,11 @@ class VWCSetting(models.Model):
         v = vs[0]
         return v.value_int
 
+    @staticmethod
+    async def aget_listening_shelfspot() -> int | None:
+        v = await VWCSetting.objects.filter(setting_name="listening_shelfspot").afirst()
+        return v.value_int
+
     @staticmethod
     def set_listening_shelfspot(val):
         vs = VWCSetting.objects.filter(setting_name="listening_shelfspot").all()
@@ -356,3 +674,32 @@ class VWCSetting(models.Model):
     @staticmethod
     def reset_listening_shelfspot():
         VWCSetting.set_listening_shelfspot(None)
+
+
+class CoverFetchTask(models.Model):
+    """
+    A cover waiting to be downloaded into the cover cache, persisted so pending downloads survive restarts.
+
+    There is one task per image URL, no matter how many playables share the cover. A task is deleted once the cover
+    is cached.
+
+    Attributes:
+        image_url (str): The URL of the cover.
+        attempts (int): The number of failed downloads.
+        next_attempt_at (datetime): The earliest time of the next download.
+        last_error (str): The reason the last download failed.
+        created_at (datetime): The datetime when the task was created.
+    """
+    image_url = models.CharField(max_length=512, unique=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=512, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["next_attempt_at"], name="cover_fetch_due"),
+        ]
+
+    def __str__(self):
+        return f"CoverFetchTask {self.image_url} ({self.attempts} attempts)"
@@ -4,4 +4,11 @@ from . import consumers
 
 websocket_urlpatterns = [
     path(r"ws/configure/<int:shelf_id>/", consumers.ConfigureConsumer.as_asgi()),
-]
\ No newline at end of file
+    path(r"ws/library_search/<slug:token>/", consumers.LibrarySearchConsumer.as_asgi()),
+    path(r"ws/shelf/<int:shelf_id>/", consumers.ShelfConsumer.as_asgi()),
+]
+
+# Not used by browsers but by the GPIO listener on the internal network, so not behind the origin validation
+button_urlpatterns = [
+    path(r"ws/buttons/", consumers.ButtonConsumer.as_asgi()),
+]
@@ -0,0 +1,78 @@
+from typing import Iterable
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from configurator.models import Shelf, ShelfSpot, ShelfChange, generate_spot_matrix
+
+
+def spot_queryset():
+    """
+    Return the queryset used to load the spots of shelves for serialization.
+
+    Every spot is joined with its playable, so a whole spot matrix is fetched by a single query. The large data of the
+    playables lives in PlayablePayload and is not joined.
+
+    :return: A queryset of ShelfSpot objects ordered by their primary key.
+    """
+    return (ShelfSpot.objects
+            .select_related("playable")
+            .order_by("id"))
+
+
+def shelf_to_dict(shelf: Shelf, spot_list: Iterable[ShelfSpot]) -> dict:
+    return {"shelf_id": shelf.id, "name": shelf.name, "active": shelf.active,
+            "updated_at": shelf.updated_at, "revision": shelf.revision,
+            'spot_matrix': generate_spot_matrix(spot_list)}
+
+
+def serialize_shelf(shelf: Shelf) -> dict:
+    """
+    Serialize a single shelf including its spot matrix.
+
+    Costs exactly one query, independent of the number of spots on the shelf.
+
+    :param shelf: The shelf to serialize.
+    :return: A dictionary representation of the shelf.
+    """
+    return shelf_to_dict(shelf, spot_queryset().filter(shelf_id=shelf.id))
+
+
+def serialize_shelf_delta(shelf: Shelf, since: int) -> dict | None:
+    """
+    Serialize the changes of a shelf since an older revision of it.
+
+    The added or modified spots are sent like in the spot matrix, of the removed spots only their ids. Costs at most two
+    queries, independent of the size of the shelf.
+
+    :param shelf: The shelf to serialize, with its current revision.
+    :param since: The revision of the shelf known to the client.
+    :return: A dictionary with the changes, or None if they are not known and the whole shelf has to be sent.
+    """
+    if since > shelf.revision:
+        return None
+    changes = list(ShelfChange.objects.filter(shelf_id=shelf.id, revision__gt=since, revision__lte=shelf.revision)
+                   .order_by("revision"))
+    if len(changes) != shelf.revision - since:
+        return None
+    changed, removed = set(), set()
+    for change in changes:
+        changed.update(change.changed_spots)
+        changed.difference_update(change.removed_spots)
+        removed.update(change.removed_spots)
+    spots = spot_queryset().filter(shelf_id=shelf.id, pk__in=changed) if changed else []
+    return {"shelf_id": shelf.id, "revision": shelf.revision, "since": since,
+            "spots": [spot.to_dict() for spot in spots], "removed": sorted(removed)}
+
+
+def serialize_shelves(shelves: Iterable[Shelf]) -> list[dict]:
+    """
+    Serialize several shelves including their spot matrices.
+
+    The spots of all shelves are prefetched in one additional query, independent of the number of shelves and spots.
+
+    :param shelves: The shelves to serialize.
+    :return: A list of dictionary representations, in the order of the given shelves.
+    """
+    shelves = list(shelves)
+    prefetch_related_objects(shelves, Prefetch("shelfspot_set", queryset=spot_queryset()))
+    return [shelf_to_dict(shelf, shelf.shelfspot_set.all()) for shelf in shelves]
@@ -0,0 +1,137 @@
+from typing import NamedTuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from configurator.library import DUMMY_PLAYABLE_ID
+from configurator.models import Playable, Shelf, ShelfSpot
+
+OPERATIONS = ("add", "remove", "set", "assign_key")
+
+
+class BatchError(ValueError):
+    """
+    A batch contains an invalid operation, none of its operations was applied.
+    """
+    def __init__(self, index: int, message: str):
+        super().__init__(f"Operation {index}: {message}")
+        self.index = index
+
+
+class BatchResult(NamedTuple):
+    """
+    The outcome of an applied batch.
+
+    Attributes:
+        revision (int): The revision of the shelf after the batch.
+        changed_spot_ids (list[int]): The ids of the added or modified spots.
+        removed_spot_ids (list[int]): The ids of the deleted spots.
+    """
+    revision: int
+    changed_spot_ids: list[int]
+    removed_spot_ids: list[int]
+
+
+def _position(index: int, operation: dict) -> tuple[int, int]:
+    try:
+        return int(operation["row"]), int(operation["col"])
+    except (KeyError, TypeError, ValueError):
+        raise BatchError(index, "row and col have to be integers")
+
+
+def _int_field(index: int, operation: dict, name: str) -> int:
+    try:
+        return int(operation[name])
+    except (KeyError, TypeError, ValueError):
+        raise BatchError(index, f"{name} has to be an integer")
+
+
+def apply_batch(shelf_id: int, operations: list[dict]) -> BatchResult:
+    """
+    Apply a list of edits to the spots of a shelf in a single transaction.
+
+    Spots are addressed by their row and column, so spots added by the batch can be edited by later operations.
+    The operations are applied in order:
+
+    - {"op": "add", "row": 0, "col": 0}: add an empty spot.
+    - {"op": "remove", "row": 0, "col": 0}: delete a spot.
+    - {"op": "set", "row": 0, "col": 0, "playable_id": 5}: place a playable on a spot, adding it to the library.
+    - {"op": "assign_key", "row": 0, "col": 0, "key": 3}: assign a key to a spot, removing it from the other spots of
+      the shelf. A key of null removes the key of the spot.
+
+    The edits are computed in memory and written with one bulk query per kind of change, so the number of queries does
+    not depend on the number of operations.
+
+    :param shelf_id: The id of the shelf to edit.
+    :param operations: The operations to apply.
+    :return: The new revision of the shelf and the ids of the changed and removed spots.
+    :raises BatchError: If an operation is invalid, nothing is changed in that case.
+    :raises Shelf.DoesNotExist: If the shelf does not exist.
+    """
+    if not isinstance(operations, list):
+        raise BatchError(0, "operations have to be a list")
+    with transaction.atomic():
+        # serializes concurrent batches of the same shelf
+        shelf = Shelf.objects.select_for_update().only("id", "revision").get(pk=shelf_id)
+        spots = {(spot.row_index, spot.col_index): spot for spot in ShelfSpot.objects.filter(shelf_id=shelf_id)}
+        removed_ids = set()
+        changed = {}
+        playable_ids = {}
+
+        for index, operation in enumerate(operations):
+            op = operation.get("op") if isinstance(operation, dict) else None
+            if op not in OPERATIONS:
+                raise BatchError(index, f"op has to be one of {', '.join(OPERATIONS)}")
+            position = _position(index, operation)
+            if op == "add":
+                if position in spots:
+                    raise BatchError(index, f"spot {position} exists already")
+                spot = ShelfSpot(row_index=position[0], col_index=position[1], shelf_id=shelf_id,
+                                 playable_id=DUMMY_PLAYABLE_ID)
+                spots[position] = spot
+                changed[id(spot)] = spot
+                continue
+            if position not in spots:
+                raise BatchError(index, f"spot {position} does not exist")
+            if op == "remove":
+                spot = spots.pop(position)
+                changed.pop(id(spot), None)
+                if spot.pk is not None:
+                    removed_ids.add(spot.pk)
+            elif op == "set":
+                spot = spots[position]
+                spot.playable_id = _int_field(index, operation, "playable_id")
+                playable_ids.setdefault(spot.playable_id, index)
+                changed[id(spot)] = spot
+            else:
+                key = None if operation.get("key") is None else _int_field(index, operation, "key")
+                if key is not None:
+                    for other in spots.values():
+                        if other.associated_key == key:
+                            other.associated_key = None
+                            changed[id(other)] = other
+                spot = spots[position]
+                spot.associated_key = key
+                changed[id(spot)] = spot
+
+        existing = set(Playable.objects.filter(pk__in=playable_ids).values_list("id", flat=True))
+        for playable_id, index in playable_ids.items():
+            if playable_id not in existing:
+                raise BatchError(index, f"playable {playable_id} does not exist")
+
+        now = timezone.now()
+        created = [spot for spot in changed.values() if spot.pk is None]
+        updated = [spot for spot in changed.values() if spot.pk is not None]
+        for spot in updated:
+            spot.updated_at = now
+        if removed_ids:
+            ShelfSpot.objects.filter(pk__in=removed_ids).delete()
+        ShelfSpot.objects.bulk_create(created)
+        ShelfSpot.objects.bulk_update(updated, ["playable", "associated_key", "updated_at"])
+        Playable.objects.filter(pk__in=existing).update(in_library=True)
+
+        if not changed and not removed_ids:
+            return BatchResult(shelf.revision, [], [])
+        changed_ids = sorted(spot.pk for spot in changed.values())
+        revision = Shelf.record_change(shelf_id, changed_spot_ids=changed_ids, removed_spot_ids=sorted(removed_ids))
+    return BatchResult(revision, changed_ids, sorted(removed_ids))
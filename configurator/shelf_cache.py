@@ -0,0 +1,40 @@
+import datetime
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from VinylWallConfig.settings import SHELF_CACHE_TIMEOUT
+from configurator.models import Shelf
+from configurator.serializers import serialize_shelf
+
+
+def _version(revision: int, updated_at: datetime.datetime) -> str:
+    # Revisions alone repeat if a shelf is restored, e.g. from a backup, the time of the last change does not
+    return f"{revision}-{round(updated_at.timestamp() * 1_000_000)}"
+
+
+def shelf_etag(shelf_id: int, revision: int, updated_at: datetime.datetime) -> str:
+    return f'"shelf-{shelf_id}-{_version(revision, updated_at)}"'
+
+
+def cache_key(shelf_id: int, revision: int, updated_at: datetime.datetime) -> str:
+    return f"shelf_json:{shelf_id}:{_version(revision, updated_at)}"
+
+
+def get_shelf_payload(shelf: Shelf) -> str:
+    """
+    Return the serialized JSON payload of a shelf, served from the cache if possible.
+
+    Entries are keyed on the revision and the time of the last change of the shelf, so bumping the revision via
+    `Shelf.bump_revision` invalidates them without touching the cache. Outdated entries simply expire.
+
+    :param shelf: The shelf to serialize.
+    :return: The JSON encoded shelf.
+    """
+    key = cache_key(shelf.id, shelf.revision, shelf.updated_at)
+    payload = cache.get(key)
+    if payload is None:
+        payload = json.dumps(serialize_shelf(shelf), cls=DjangoJSONEncoder)
+        cache.set(key, payload, SHELF_CACHE_TIMEOUT)
+    return payload
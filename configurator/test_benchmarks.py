@@ -0,0 +1,36 @@
+from django.test import SimpleTestCase, TransactionTestCase
+
+from configurator import dispatch
+from configurator.benchmarks import SyntheticLibrary, bench_endpoints, compare_results
+from configurator.models import Album, ShelfSpot
+
+
+class TestCompareResults(SimpleTestCase):
+
+    def test_regressions(self):
+        previous = {"endpoints": {"shelf_json": {"queries": 2, "peak_memory": 1000, "duration": {"p50": 0.01}}}}
+        current = {"endpoints": {"shelf_json": {"queries": 3, "peak_memory": 1100, "duration": {"p50": 0.02}},
+                                 "new_endpoint": {"queries": 9}}}
+        self.assertEqual(compare_results(previous, current, tolerance=0.2),
+                         [("endpoints.shelf_json.queries", 2, 3), ("endpoints.shelf_json.duration.p50", 0.01, 0.02)])
+        self.assertEqual(compare_results(previous, previous, tolerance=0), [])
+
+
+class TestEndpointsBenchmark(TransactionTestCase):
+
+    def tearDown(self):
+        dispatch.invalidate()
+
+    def test_small_library(self):
+        result = bench_endpoints(0, SyntheticLibrary(albums=40, shelves=3, rows=4, cols=5))
+        self.assertTrue(result["passed"])
+        self.assertEqual(Album.objects.filter(name__startswith="Album ").count(), 40)
+        self.assertEqual(ShelfSpot.objects.filter(shelf__name="Wall 0").count(), 20)
+        self.assertEqual(set(result["endpoints"]), {"shelf_json", "active_shelf_json", "playable_library",
+                                                    "playable_library_search", "pick_shelf_json", "duplicate_shelf",
+                                                    "handle_button"})
+        for name, endpoint in result["endpoints"].items():
+            # presses are resolved from the memory of the process
+            self.assertEqual(endpoint["queries"] == 0, name == "handle_button")
+            self.assertGreater(endpoint["peak_memory"], 0)
+            self.assertEqual(endpoint["duration"]["iterations"], 5)
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from configurator import dispatch
+from configurator.consumers import ConfigureConsumer
+from configurator.daemon_client import async_music_daemon
+from configurator.models import Album, Device, Shelf, VWCSetting
+from configurator.routing import websocket_urlpatterns, button_urlpatterns
+from configurator.test_serializers import create_shelf
+from configurator.views import assign_from_key
+
+
+class TestConfigureConsumer(TransactionTestCase):
+
+    def setUp(self):
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        self.shelf = create_shelf("Wall", 2, 2)
+        self.spot = self.shelf.shelfspot_set.order_by("id").first()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/configure/{self.shelf.id}/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_to(text_data=json.dumps({"shelfspot_id": self.spot.id}))
+        message = json.loads(await communicator.receive_from())
+        self.assertEqual(message["message"], f"{ConfigureConsumer.DURATION}")
+        self.assertFalse(message["last_message"])
+        return communicator
+
+    async def test_key_assignment_acknowledged_immediately(self):
+        communicator = await self.connect()
+        self.assertEqual(await VWCSetting.aget_listening_shelfspot(), self.spot.id)
+
+        start = time.perf_counter()
+        await sync_to_async(assign_from_key)(7)
+        message = json.loads(await communicator.receive_from())
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(message["message"], "Success")
+        self.assertTrue(message["last_message"])
+        self.assertEqual(message["states"][str(self.spot.id)], 1)
+        self.assertEqual(list(message["states"].values()).count(-1), 3)
+        self.assertIsNone(await VWCSetting.aget_listening_shelfspot())
+        await communicator.disconnect()
+
+    async def test_timeout(self):
+        with mock.patch.object(ConfigureConsumer, "DURATION", 1):
+            communicator = await self.connect()
+            self.assertEqual(json.loads(await communicator.receive_from(timeout=2))["message"], "0")
+            message = json.loads(await communicator.receive_from(timeout=2))
+        self.assertEqual(message["message"], "Did not receive any button input")
+        self.assertTrue(message["last_message"])
+        self.assertIsNone(await VWCSetting.aget_listening_shelfspot())
+        await communicator.disconnect()
+
+    async def test_disconnect_stops_listening(self):
+        communicator = await self.connect()
+        await communicator.disconnect()
+        await asyncio.sleep(0)
+        self.assertIsNone(await VWCSetting.aget_listening_shelfspot())
+
+
+class TestShelfConsumer(TransactionTestCase):
+
+    def setUp(self):
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        self.shelf = create_shelf("Wall", 2, 2, active=True)
+        self.spot = self.shelf.shelfspot_set.order_by("id").first()
+
+    async def connect(self, shelf_id):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/shelf/{shelf_id}/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_set_playable(self):
+        album = await Album.objects.filter(name="Wall 1/1").aget()
+        communicator = await self.connect(self.shelf.id)
+        await sync_to_async(self.client.post)(reverse("configurator:set_playable"),
+                                              {"playable_id": album.id, "shelfspot_id": self.spot.id})
+        message = await communicator.receive_json_from()
+        self.assertEqual(message["change"], "spots_changed")
+        self.assertEqual(message["shelf_id"], self.shelf.id)
+        self.assertEqual([spot["id"] for spot in message["spots"]], [self.spot.id])
+        self.assertEqual(message["spots"][0]["playable"]["name"], "Wall 1/1")
+        await communicator.disconnect()
+
+    async def test_remove_shelfspot(self):
+        communicator = await self.connect(self.shelf.id)
+        await sync_to_async(self.client.post)("/api/shelf/remove/",
+                                              {"row_id": 0, "col_id": 0, "shelf_id": self.shelf.id})
+        message = await communicator.receive_json_from()
+        self.assertEqual(message, {"change": "spot_removed", "shelf_id": self.shelf.id, "revision": 1,
+                                   "spot_id": self.spot.id})
+        await communicator.disconnect()
+
+    async def test_assign_from_key_sends_former_key_holders(self):
+        former = await self.shelf.shelfspot_set.order_by("-id").afirst()
+        former.associated_key = 7
+        await former.asave()
+        await sync_to_async(dispatch.set_listening_shelfspot)(self.spot.id)
+        communicator = await self.connect(self.shelf.id)
+        await sync_to_async(assign_from_key)(7)
+        message = await communicator.receive_json_from()
+        keys = {spot["id"]: spot["associated_key"] for spot in message["spots"]}
+        self.assertEqual(keys, {former.id: None, self.spot.id: 7})
+        await communicator.disconnect()
+
+    async def test_only_subscribed_shelf_notified(self):
+        other = await sync_to_async(create_shelf)("Other", 1, 1)
+        communicator = await self.connect(self.shelf.id)
+        other_communicator = await self.connect(other.id)
+        await sync_to_async(self.client.get)(reverse("configurator:activate_shelf", args=(other.id,)))
+        self.assertEqual(await communicator.receive_json_from(),
+                         {"change": "shelf_activated", "shelf_id": self.shelf.id, "active": False})
+        self.assertEqual(await other_communicator.receive_json_from(),
+                         {"change": "shelf_activated", "shelf_id": other.id, "active": True})
+        self.assertTrue(await communicator.receive_nothing())
+        self.assertFalse(await Shelf.objects.filter(pk=self.shelf.id, active=True).aexists())
+        await communicator.disconnect()
+        await other_communicator.disconnect()
+
+
+class TestButtonConsumer(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        Device.objects.create(device_id="dev", device_name="Speaker", device_type="Speaker", active=True)
+        self.shelf = create_shelf("Wall", 2, 2, active=True)
+        self.spot = self.shelf.shelfspot_set.order_by("id").first()
+        self.spot.associated_key = 5
+        self.spot.save()
+        dispatch.invalidate()
+        dispatch.rebuild()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(button_urlpatterns), "/ws/buttons/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_presses_over_one_connection(self):
+        communicator = await self.connect()
+        with mock.patch.object(async_music_daemon, "play", return_value={}) as play:
+            await communicator.send_json_to({"id": 1, "key": 5, "trace_id": "abc"})
+            self.assertEqual(await communicator.receive_json_from(),
+                             {"id": 1, "status": 200, "trace_id": "abc", "selected_playable": "spotify:album:Wall-0-0",
+                              "device": "dev"})
+            await communicator.send_json_to({"id": 2, "key": 6})
+            answer = await communicator.receive_json_from()
+            self.assertEqual((answer["id"], answer["status"]), (2, 404))
+            await communicator.send_json_to({"id": 3})
+            self.assertEqual((await communicator.receive_json_from())["status"], 400)
+        play.assert_awaited_once_with("dev", "spotify:album:Wall-0-0", trace_id="abc")
+        await communicator.disconnect()
+
+    async def test_assigns_key_while_listening(self):
+        other = await self.shelf.shelfspot_set.order_by("-id").afirst()
+        await sync_to_async(dispatch.set_listening_shelfspot)(other.id)
+        communicator = await self.connect()
+        await communicator.send_json_to({"id": 1, "key": 5})
+        answer = await communicator.receive_json_from()
+        self.assertEqual((answer["status"], answer["key"]), (200, 5))
+        await other.arefresh_from_db()
+        self.assertEqual(other.associated_key, 5)
+        await communicator.disconnect()
@@ -0,0 +1,104 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from configurator import cover_fetcher
+from configurator.cover_fetcher import CoverFetcher, enqueue, MAX_ATTEMPTS
+from configurator.covers import CoverError
+from configurator.library import add_albums_from_daemon
+from configurator.models import CoverFetchTask
+from helper_services.fake_music_daemon import fake_album
+
+
+class FakeDownloads:
+    """
+    Stands in for `cache_image_url`, recording the downloads and how many of them ran at the same time.
+    """
+    def __init__(self, duration=0.02, failing=()):
+        self.duration = duration
+        self.failing = set(failing)
+        self.downloaded = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, image_url, session=None):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.duration)
+        with self.lock:
+            self.running -= 1
+            self.downloaded.append(image_url)
+        if image_url in self.failing:
+            raise CoverError("Not found")
+        return "0" * 64
+
+
+# Downloads run in the threads of the fetcher with their own database connections.
+@skipUnlessDBFeature("test_db_allows_multiple_connections")
+class TestCoverFetcher(TransactionTestCase):
+
+    def download_with(self, downloads):
+        patcher = mock.patch.object(cover_fetcher, "cache_image_url", downloads)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueue_deduplicates(self):
+        enqueue(["https://example.com/a.jpg", "https://example.com/a.jpg", "/static/configurator/dummy.png"])
+        enqueue(["https://example.com/a.jpg", "https://example.com/b.jpg"])
+        self.assertEqual(sorted(CoverFetchTask.objects.values_list("image_url", flat=True)),
+                         ["https://example.com/a.jpg", "https://example.com/b.jpg"])
+
+    def test_drain_bounded_concurrency(self):
+        downloads = FakeDownloads()
+        self.download_with(downloads)
+        urls = [f"https://example.com/{i}.jpg" for i in range(20)]
+        enqueue(urls)
+
+        CoverFetcher(workers=3).drain()
+        self.assertEqual(sorted(downloads.downloaded), sorted(urls))
+        self.assertLessEqual(downloads.max_running, 3)
+        self.assertGreater(downloads.max_running, 1)
+        self.assertFalse(CoverFetchTask.objects.exists())
+
+    def test_failed_download_backs_off(self):
+        downloads = FakeDownloads(failing={"https://example.com/missing.jpg"})
+        self.download_with(downloads)
+        enqueue(["https://example.com/missing.jpg", "https://example.com/ok.jpg"])
+
+        fetcher = CoverFetcher(workers=2)
+        fetcher.drain()
+        task = CoverFetchTask.objects.get()
+        self.assertEqual(task.image_url, "https://example.com/missing.jpg")
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.last_error, "Not found")
+        self.assertGreater(task.next_attempt_at, timezone.now())
+
+        # not due yet
+        fetcher.drain()
+        self.assertEqual(len(downloads.downloaded), 2)
+
+        # due, but given up after too many attempts
+        CoverFetchTask.objects.update(next_attempt_at=timezone.now(), attempts=MAX_ATTEMPTS)
+        fetcher.drain()
+        self.assertEqual(len(downloads.downloaded), 2)
+
+    def test_unexpected_error_backs_off(self):
+        self.download_with(mock.Mock(side_effect=PermissionError("Permission denied")))
+        enqueue(["https://example.com/a.jpg"])
+
+        with self.assertLogs("configurator.cover_fetcher"):
+            CoverFetcher(workers=1).drain()
+        task = CoverFetchTask.objects.get()
+        self.assertEqual((task.attempts, task.last_error), (1, "Permission denied"))
+        self.assertGreater(task.next_attempt_at, timezone.now())
+
+    def test_albums_from_daemon_enqueued(self):
+        with mock.patch("configurator.library.music_daemon.search_albums",
+                        return_value=[fake_album("queen", i) for i in range(3)]):
+            add_albums_from_daemon("queen")
+        self.assertEqual(CoverFetchTask.objects.count(), 3)
@@ -0,0 +1,111 @@
+import io
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+
+from configurator import covers
+from configurator.covers import store_cover, cache_cover, cover_path, CoverError
+from configurator.models import Shelf, ShelfSpot
+from configurator.test_library import create_album
+
+
+def create_image(width=640, height=480, color="red") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class CoverCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        patcher = mock.patch.object(covers, "COVER_CACHE_ROOT", cache_root.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestStoreCover(CoverCacheTestCase):
+
+    def test_variants_resized(self):
+        cover_hash = store_cover(create_image())
+        for variant, size in covers.VARIANTS.items():
+            with Image.open(cover_path(variant, cover_hash)) as image:
+                self.assertEqual(image.format, "JPEG")
+                self.assertEqual(image.size, (size, size * 3 // 4))
+
+    def test_content_addressed(self):
+        self.assertEqual(store_cover(create_image()), store_cover(create_image()))
+        self.assertNotEqual(store_cover(create_image()), store_cover(create_image(color="blue")))
+
+    def test_invalid_image(self):
+        with self.assertRaises(CoverError):
+            store_cover(b"not an image")
+
+
+class TestCacheCover(CoverCacheTestCase):
+
+    def test_cache_cover(self):
+        album = create_album("Album")
+        album.image_url = "https://example.com/cover.jpg"
+        album.save()
+        shelf = Shelf.objects.create(name="Shelf", active=False)
+        ShelfSpot.objects.create(row_index=0, col_index=0, shelf=shelf, playable=album)
+        session = mock.Mock()
+        session.get.return_value = mock.Mock(status_code=200, content=create_image())
+
+        cover_hash = cache_cover(album, session)
+        session.get.assert_called_once_with("https://example.com/cover.jpg", timeout=covers.DOWNLOAD_TIMEOUT)
+        album.refresh_from_db()
+        self.assertEqual(album.cover_hash, cover_hash)
+        self.assertEqual(album.to_dict()["image_url"], f"/api/cover/texture/{cover_hash}.jpg")
+        self.assertEqual(album.to_dict()["thumbnail_url"], f"/api/cover/thumb/{cover_hash}.jpg")
+        shelf.refresh_from_db()
+        self.assertEqual(shelf.revision, 1)
+
+    def test_download_failed(self):
+        album = create_album("Album")
+        session = mock.Mock()
+        session.get.return_value = mock.Mock(status_code=404)
+        with self.assertRaises(CoverError):
+            cache_cover(album, session)
+        album.refresh_from_db()
+        self.assertEqual(album.cover_hash, "")
+
+    def test_uncached_falls_back_to_cdn(self):
+        album = create_album("Album")
+        album.image_url = "https://example.com/cover.jpg"
+        self.assertEqual(album.to_dict()["image_url"], "https://example.com/cover.jpg")
+        self.assertEqual(album.to_dict()["thumbnail_url"], "https://example.com/cover.jpg")
+
+
+class TestAlbumCoverView(CoverCacheTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cover_hash = store_cover(create_image())
+        self.url = reverse("configurator:album_cover", args=("thumb", self.cover_hash))
+
+    def test_served_immutable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", response["Cache-Control"])
+        with open(cover_path("thumb", self.cover_hash), "rb") as f:
+            self.assertEqual(b"".join(response.streaming_content), f.read())
+
+    def test_x_accel_redirect(self):
+        with mock.patch("configurator.views.COVER_CACHE_X_ACCEL", True):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"],
+                         f"/cover_cache/thumb/{self.cover_hash[:2]}/{self.cover_hash}.jpg")
+        self.assertEqual(response.content, b"")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_unknown_cover(self):
+        for variant, cover_hash in [("thumb", "0" * 64), ("original", self.cover_hash), ("thumb", "abc")]:
+            response = self.client.get(reverse("configurator:album_cover", args=(variant, cover_hash)))
+            self.assertEqual(response.status_code, 404)
@@ -0,0 +1,173 @@
+import asyncio
+from unittest import mock
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from configurator import dispatch, tracing
+from configurator.daemon_client import MusicDaemonClient, MusicDaemonError, music_daemon, async_music_daemon
+from configurator.library import add_albums_from_daemon
+from configurator.models import Album, Device, Playable, VWCSetting
+from configurator.test_serializers import create_shelf
+from helper_services.fake_music_daemon import FakeMusicDaemon
+
+
+class TestMusicDaemonClient(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeMusicDaemon().start()
+        cls.client_ = MusicDaemonClient(cls.fake.url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.fake.logged_in = True
+        self.fake.plays.clear()
+
+    def test_devices(self):
+        self.assertEqual([d["id"] for d in self.client_.devices()], ["fake-speaker", "fake-computer"])
+
+    def test_search_albums_quotes_query(self):
+        albums = self.client_.search_albums("AC/DC & more")
+        self.assertEqual(len(albums), 50)
+        self.assertEqual(albums[0]["name"], "AC/DC & more Album 0")
+
+    def test_play(self):
+        self.client_.play("fake-speaker", "spotify:album:1")
+        self.assertEqual(self.fake.plays, [{"device": "fake-speaker", "playable_uri": "spotify:album:1"}])
+
+    def test_login(self):
+        self.fake.logged_in = False
+        self.assertFalse(self.client_.is_logged_in())
+        self.assertTrue(self.client_.auth_url().startswith("https://"))
+        self.client_.apply_code("abc")
+        self.assertTrue(self.client_.is_logged_in())
+
+    def test_apply_code_rejected(self):
+        with self.assertRaises(MusicDaemonError) as cm:
+            self.client_.apply_code("")
+        self.assertEqual(cm.exception.status_code, 400)
+
+    def test_connection_reused(self):
+        client = MusicDaemonClient(self.fake.url)
+        connections = self.fake.connections
+        for _ in range(5):
+            client.devices()
+        self.assertEqual(self.fake.connections - connections, 1)
+
+
+class TestViewsWithFakeDaemon(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeMusicDaemon().start()
+        cls.base_urls = [mock.patch.object(music_daemon, "base_url", cls.fake.url),
+                         mock.patch.object(async_music_daemon, "base_url", cls.fake.url)]
+        for base_url in cls.base_urls:
+            base_url.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for base_url in cls.base_urls:
+            base_url.stop()
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        dispatch.invalidate()
+        cache.clear()
+        self.fake.plays.clear()
+
+    def test_devices(self):
+        response = self.client.get(reverse("configurator:devices"))
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(Device.objects.count(), 2)
+
+    def test_album_search(self):
+        Album.objects.create(id=1, name="DUMMY", image=b"", image_url="", uri="spotify:album:", external_url="",
+                             href="", json_response="{}", release_date="", artist="")
+        add_albums_from_daemon("Queen")
+        self.assertEqual(Playable.objects.filter(name__startswith="Queen Album").count(), 50)
+
+    def test_handle_button_plays(self):
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        Device.objects.create(device_id="fake-speaker", device_name="Speaker", device_type="Speaker", active=True)
+        shelf = create_shelf("Wall", 1, 1, active=True)
+        shelf.shelfspot_set.update(associated_key=3)
+
+        response = self.client.post(reverse("configurator:handle_button"), {"key": 3},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.fake.plays, [{"device": "fake-speaker", "playable_uri": "spotify:album:Wall-0-0"}])
+
+    def test_async_connections_closed_with_loop(self):
+        async def play():
+            await async_music_daemon.play("fake-speaker", "spotify:album:a")
+            return await async_music_daemon._client()
+
+        client = asyncio.run(play())
+        self.assertTrue(client.is_closed)
+
+        async def play_and_close():
+            client = await play()
+            await async_music_daemon.aclose()
+            self.assertTrue(client.is_closed)
+            # the next call opens new connections
+            self.assertIsNot(await async_music_daemon._client(), client)
+
+        asyncio.run(play_and_close())
+
+    def test_handle_button_resent_press_plays_once(self):
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        Device.objects.create(device_id="fake-speaker", device_name="Speaker", device_type="Speaker", active=True)
+        shelf = create_shelf("Wall", 1, 1, active=True)
+        shelf.shelfspot_set.update(associated_key=3)
+
+        for _ in range(2):
+            response = self.client.post(reverse("configurator:handle_button"), {"key": 3},
+                                        content_type="application/json", headers={"X-Trace-Id": "resent"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["device"], "fake-speaker")
+        self.assertEqual(len(self.fake.plays), 1)
+
+    def test_handle_button_traced(self):
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        Device.objects.create(device_id="fake-speaker", device_name="Speaker", device_type="Speaker", active=True)
+        shelf = create_shelf("Wall", 1, 1, active=True)
+        shelf.shelfspot_set.update(associated_key=3)
+        tracing.collector.clear()
+
+        self.client.post(reverse("configurator:handle_button"), {"key": 3}, content_type="application/json",
+                         headers={"X-Trace-Id": "abc", "X-Trace-Queued": "0.25"})
+        spans = self.client.get(reverse("configurator:press_traces"), {"trace_id": "abc"}).json()["spans"]
+        self.assertEqual(set(spans), {"listener.queue", "press", "dispatch.lookup", "daemon.play", "daemon.shuffle",
+                                      "daemon.start_playback"})
+        self.assertEqual(spans["listener.queue"], 0.25)
+        self.assertLessEqual(spans["daemon.play"], spans["press"])
+        stages = self.client.get(reverse("configurator:press_traces")).json()["stages"]
+        self.assertEqual(stages["press"]["iterations"], 1)
+        self.assertEqual(set(stages["press"]), {"iterations", "mean", "p50", "p95", "p99", "max"})
+
+    def test_handle_button_daemon_failure(self):
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        Device.objects.create(device_id="fake-speaker", device_name="Speaker", device_type="Speaker", active=True)
+        shelf = create_shelf("Wall", 1, 1, active=True)
+        shelf.shelfspot_set.update(associated_key=3)
+
+        with mock.patch.object(async_music_daemon, "base_url", "http://127.0.0.1:9"):
+            response = self.client.post(reverse("configurator:handle_button"), {"key": 3},
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 424)
+
+    def test_login_rejected_code(self):
+        response = self.client.get(reverse("configurator:login"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("400", str(list(get_messages(response.wsgi_request))[0]))
@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from configurator import dispatch, views
+from configurator.daemon_client import async_music_daemon
+from configurator.models import Device, VWCSetting
+from configurator.test_serializers import create_shelf
+
+
+class TestDispatchTable(TestCase):
+
+    def setUp(self):
+        dispatch.invalidate()
+        cache.clear()
+        VWCSetting.objects.create(setting_name="listening_shelfspot")
+        self.device = Device.objects.create(device_id="dev", device_name="Speaker", device_type="Speaker", active=True)
+        self.shelf = create_shelf("Wall", 2, 2, active=True)
+        self.spot = self.shelf.shelfspot_set.order_by("id").first()
+        self.spot.associated_key = 5
+        self.spot.save()
+
+    def test_lookup_without_queries(self):
+        dispatch.rebuild()
+        with self.assertNumQueries(0):
+            target = dispatch.lookup(5)
+        self.assertEqual(target, dispatch.Dispatch(self.spot.playable.uri, "dev"))
+        self.assertIsNone(dispatch.lookup(6))
+
+    def test_only_active_shelf(self):
+        other = create_shelf("Other", 1, 1)
+        other.shelfspot_set.update(associated_key=6)
+        dispatch.rebuild()
+        self.assertIsNone(dispatch.lookup(6))
+
+        self.client.get(reverse("configurator:activate_shelf", args=(other.id,)))
+        self.assertEqual(dispatch.lookup(6).playable_uri, "spotify:album:Other-0-0")
+        self.assertIsNone(dispatch.lookup(5))
+
+    def test_activate_device_rebuilds(self):
+        dispatch.rebuild()
+        Device.objects.create(device_id="other", device_name="Phone", device_type="Smartphone")
+        self.client.post(reverse("configurator:activate_device"), {"device_id": "other"})
+        self.assertEqual(dispatch.lookup(5).device_id, "other")
+
+    def test_listening_shelfspot_in_memory(self):
+        dispatch.rebuild()
+        with self.assertNumQueries(0):
+            self.assertIsNone(dispatch.listening_shelfspot())
+        dispatch.set_listening_shelfspot(self.spot.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(dispatch.listening_shelfspot(), self.spot.id)
+        # kept across rebuilds and loaded from the database after invalidating
+        dispatch.rebuild()
+        self.assertEqual(dispatch.listening_shelfspot(), self.spot.id)
+        dispatch.invalidate()
+        self.assertEqual(dispatch.listening_shelfspot(), self.spot.id)
+        self.assertEqual(VWCSetting.get_listening_shelfspot(), self.spot.id)
+
+    def test_handle_button_plays_from_table(self):
+        dispatch.rebuild()
+        with mock.patch.object(async_music_daemon, "play", return_value={}) as post, self.assertNumQueries(0):
+            response = self.client.post(reverse("configurator:handle_button"), {"key": 5},
+                                        content_type="application/json", headers={"X-Trace-Id": "abc"})
+        self.assertEqual(response.json(), {"selected_playable": self.spot.playable.uri, "device": "dev"})
+        self.assertEqual(response.headers["X-Trace-Id"], "abc")
+        post.assert_awaited_once_with("dev", self.spot.playable.uri, trace_id="abc")
+
+    def test_handle_button_press_still_handled(self):
+        dispatch.rebuild()
+        cache.add("press_answer:abc", views.PRESS_PENDING)
+        with mock.patch.object(async_music_daemon, "play", return_value={}) as post:
+            response = self.client.post(reverse("configurator:handle_button"), {"key": 5},
+                                        content_type="application/json", headers={"X-Trace-Id": "abc"})
+        self.assertEqual(response.status_code, 409)
+        post.assert_not_called()
+
+    def test_handle_button_unknown_key(self):
+        with mock.patch.object(async_music_daemon, "play") as post:
+            response = self.client.post(reverse("configurator:handle_button"), {"key": 7},
+                                        content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        post.assert_not_called()
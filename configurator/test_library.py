@@ -0,0 +1,81 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+
+from configurator.library import library_page, library_queryset, DUMMY_PLAYABLE_ID
+from configurator.models import Album, Playlist
+
+
+def create_album(name, artist="Artist", in_library=False, **kwargs):
+    return Album.objects.create(**kwargs, name=name, image=b"", image_url="", uri=f"spotify:album:{name}", external_url="",
+                                href="", json_response="{}", release_date="2020", artist=artist,
+                                in_library=in_library)
+
+
+class TestLibrary(TestCase):
+
+    def setUp(self):
+        self.dummy = create_album("DUMMY", artist="", in_library=True, id=DUMMY_PLAYABLE_ID)
+
+    def test_without_search(self):
+        first = create_album("First", in_library=True)
+        create_album("Not in library")
+        second = create_album("Second", in_library=True)
+        self.assertEqual(list(library_queryset()), [first, second])
+
+    def test_search_matches_once_in_library_first(self):
+        outside = create_album("Queen Live", artist="Queen")
+        inside = create_album("Greatest Hits", artist="Queen", in_library=True)
+        playlist = Playlist.objects.create(name="Mix", image=b"", image_url="", uri="spotify:playlist:mix",
+                                           external_url="", href="", json_response="{}", owner="me",
+                                           description="best of queen", public=True)
+        create_album("Other", artist="Other")
+        self.assertEqual(list(library_queryset("queen")), [inside, outside, playlist])
+
+    def test_cursor_pagination(self):
+        albums = [create_album(f"Album {i}", in_library=i % 3 == 0) for i in range(25)]
+        expected = list(library_queryset("Album"))
+        self.assertEqual(set(expected), set(albums))
+
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                page, cursor = library_page("Album", cursor, limit=7)
+            self.assertLessEqual(len(page), 7)
+            seen += page
+        self.assertEqual(seen, expected)
+
+
+@mock.patch("configurator.library_search.start_remote_search", return_value="token")
+class TestPlayableLibraryView(TestCase):
+
+    def setUp(self):
+        create_album("DUMMY", artist="", in_library=True, id=DUMMY_PLAYABLE_ID)
+        for i in range(30):
+            create_album(f"Album {i}", in_library=True)
+
+    def test_cursor_mode(self, start_remote_search):
+        url = reverse("configurator:album_library")
+        first = self.client.get(url, {"cursor": ""}).json()
+        self.assertEqual(len(first["album_list"]), 20)
+        second = self.client.get(url, {"cursor": first["next_cursor"]}).json()
+        self.assertEqual([a["name"] for a in second["album_list"]], [f"Album {i}" for i in range(20, 30)])
+        self.assertIsNone(second["next_cursor"])
+        start_remote_search.assert_not_called()
+
+    def test_invalid_cursor(self, start_remote_search):
+        response = self.client.get(reverse("configurator:album_library"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_legacy_page_mode(self, start_remote_search):
+        data = self.client.get(reverse("configurator:album_library"), {"page": 2, "search_txt": "Album"}).json()
+        self.assertEqual((data["page"], data["max_page"], len(data["album_list"])), (2, 2, 30))
+        self.assertIsNone(data["search_token"])
+        start_remote_search.assert_not_called()
+
+    def test_first_page_starts_remote_search(self, start_remote_search):
+        data = self.client.get(reverse("configurator:album_library"), {"search_txt": "Album"}).json()
+        self.assertEqual((data["page"], len(data["album_list"]), data["search_token"]), (1, 20, "token"))
+        start_remote_search.assert_called_once_with("Album")
@@ -0,0 +1,110 @@
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, AsyncClient
+from django.urls import reverse
+
+from configurator import library_search
+from configurator.daemon_client import music_daemon
+from configurator.library import DUMMY_PLAYABLE_ID
+from configurator.routing import websocket_urlpatterns
+from configurator.test_library import create_album
+from helper_services.fake_music_daemon import FakeMusicDaemon
+
+
+# The Spotify search runs in a worker thread with its own database connection, so the data has to be committed.
+class TestLibrarySearch(TransactionTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeMusicDaemon().start()
+        cls.base_url = mock.patch.object(music_daemon, "base_url", cls.fake.url)
+        cls.base_url.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.base_url.stop()
+        cls.fake.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        create_album("DUMMY", artist="", in_library=True, id=DUMMY_PLAYABLE_ID)
+        self.local = create_album("Queen Local", artist="Queen", in_library=True)
+        self.fake.search_limit = 5
+        self.fake.latency = 0.0
+
+    async def search(self, search_txt):
+        response = await AsyncClient().get(reverse("configurator:album_library_search"), {"search_txt": search_txt})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_local_results_before_remote(self):
+        self.fake.latency = 0.3
+        data = await self.search("Queen")
+        self.assertEqual([album["id"] for album in data["album_list"]], [self.local.id])
+        self.assertEqual(library_search.get_result(data["search_token"])["done"], False)
+
+        await library_search.wait_for_searches()
+        response = await AsyncClient().get(reverse("configurator:album_library_search_result",
+                                                   args=(data["search_token"],)))
+        result = response.json()
+        self.assertTrue(result["done"])
+        self.assertEqual(sorted(album["name"] for album in result["album_list"]),
+                         [f"Queen Album {i}" for i in range(5)])
+
+        # known albums are part of the local results of the next search and not sent again
+        data = await self.search("Queen")
+        self.assertEqual(len(data["album_list"]), 6)
+        await library_search.wait_for_searches()
+        self.assertEqual(library_search.get_result(data["search_token"])["album_list"], [])
+
+    async def test_library_answers_locally(self):
+        self.fake.latency = 0.3
+        response = await AsyncClient().get(reverse("configurator:album_library"), {"search_txt": "Queen"})
+        data = response.json()
+        self.assertEqual([album["id"] for album in data["album_list"]], [self.local.id])
+        self.assertEqual(library_search.get_result(data["search_token"])["done"], False)
+
+        await library_search.wait_for_searches()
+        self.assertEqual(len(library_search.get_result(data["search_token"])["album_list"]), 5)
+
+    async def test_results_pushed_over_websocket(self):
+        self.fake.latency = 0.2
+        data = await self.search("Queen")
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns),
+                                             f"/ws/library_search/{data['search_token']}/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        message = await communicator.receive_json_from(timeout=5)
+        self.assertTrue(message["done"])
+        self.assertEqual(len(message["album_list"]), 5)
+        self.assertEqual((await communicator.receive_output())["type"], "websocket.close")
+
+    async def test_finished_result_sent_on_connect(self):
+        data = await self.search("Queen")
+        await library_search.wait_for_searches()
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns),
+                                             f"/ws/library_search/{data['search_token']}/")
+        await communicator.connect()
+        message = await communicator.receive_json_from()
+        self.assertEqual(len(message["album_list"]), 5)
+        await communicator.disconnect()
+
+    async def test_failed_search_finishes(self):
+        with (mock.patch.object(library_search, "add_albums_from_daemon", side_effect=KeyError("images")),
+              self.assertLogs("configurator.library_search")):
+            data = await self.search("Queen")
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns),
+                                                 f"/ws/library_search/{data['search_token']}/")
+            await communicator.connect()
+            message = await communicator.receive_json_from(timeout=5)
+        self.assertTrue(message["done"])
+        self.assertEqual(message["error"], "'images'")
+        self.assertEqual(library_search.get_result(data["search_token"])["error"], "'images'")
+        await communicator.disconnect()
+
+    def test_unknown_token(self):
+        response = self.client.get(reverse("configurator:album_library_search_result", args=("unknown",)))
+        self.assertEqual(response.status_code, 404)
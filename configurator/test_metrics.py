@@ -0,0 +1,59 @@
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from configurator import dispatch
+
+from configurator.metrics import REQUEST_QUERIES, REQUESTS, WEBSOCKET_SESSIONS
+from configurator.models import VWCSetting
+from configurator.routing import button_urlpatterns
+from configurator.test_serializers import create_shelf
+
+
+class TestMetrics(TestCase):
+
+    def test_request_metrics(self):
+        shelf = create_shelf("Wall", 2, 2)
+        requests = REQUESTS.labels("configurator:shelf_json", "GET", 200).value
+        queries = REQUEST_QUERIES.labels("configurator:shelf_json")
+        queries_sum = queries.sum
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("configurator:shelf_json", args=(shelf.id,)))
+        self.assertEqual(REQUESTS.labels("configurator:shelf_json", "GET", 200).value, requests + 1)
+        self.assertEqual(queries.sum - queries_sum, len(context.captured_queries))
+
+    def test_metrics_endpoint(self):
+        self.client.get("/metrics")
+        response = self.client.get(reverse("configurator:metrics"))
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        text = response.content.decode()
+        self.assertIn('vwc_http_requests_total{view="configurator:metrics",method="GET",status="200"}', text)
+        self.assertIn("# TYPE vwc_http_request_duration_seconds histogram", text)
+        self.assertIn("# TYPE vwc_daemon_calls counter", text)
+
+
+class TestWebsocketSessionMetrics(TransactionTestCase):
+
+    async def test_queries_of_async_view(self):
+        await VWCSetting.objects.acreate(setting_name="listening_shelfspot")
+        dispatch.invalidate()
+        queries = REQUEST_QUERIES.labels("configurator:handle_button")
+        count, queries_sum = sum(queries.counts), queries.sum
+        response = await AsyncClient().post(reverse("configurator:handle_button"), {"key": 7},
+                                            content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(sum(queries.counts), count + 1)
+        # the dispatch table is built in a worker thread
+        self.assertGreater(queries.sum, queries_sum)
+
+    async def test_open_sessions(self):
+        sessions = WEBSOCKET_SESSIONS.labels("ButtonConsumer")
+        open_sessions = sessions.value
+        communicator = WebsocketCommunicator(URLRouter(button_urlpatterns), "/ws/buttons/")
+        await communicator.connect()
+        self.assertEqual(sessions.value, open_sessions + 1)
+        await communicator.disconnect()
+        self.assertEqual(sessions.value, open_sessions)
@@ -1,5 +1,10 @@
+import io
+import json
+
+from django.core.management import call_command
 from django.test import TestCase
-from configurator.models import Device
+from configurator.models import Device, Album, ShelfSpot, Shelf, Playable, PlayablePayload
+from helper_services.fake_music_daemon import DEVICES, fake_album
 
 
 class TestDevice(TestCase):
@@ -25,3 +30,139 @@ class TestDevice(TestCase):
         device.deactivate()
         self.assertFalse(device.active)
 
+
+class TestUpsertFromJson(TestCase):
+
+    def test_albums_inserted_with_constant_queries(self):
+        results = [fake_album("queen", i) for i in range(50)]
+        with self.assertNumQueries(6):
+            created, changed_covers = Album.upsert_from_json(results)
+        self.assertEqual(len(created), 50)
+        self.assertEqual(Album.objects.count(), 50)
+        album = Album.objects.get(uri="spotify:album:queen-3")
+        self.assertEqual(album.artist, "queen Artist 3")
+        self.assertEqual(album.pk, created[3].pk)
+        self.assertEqual(changed_covers, [])
+
+    def test_known_albums_refreshed(self):
+        results = [fake_album("queen", i) for i in range(10)]
+        Album.upsert_from_json(results[:5])
+        shelf = Shelf.objects.create(name="Shelf", active=False)
+        spot = ShelfSpot.objects.create(row_index=0, col_index=0, shelf=shelf,
+                                        playable=Album.objects.get(uri="spotify:album:queen-0"))
+        Album.objects.filter(uri__in=["spotify:album:queen-0", "spotify:album:queen-1"]).update(cover_hash="0" * 64)
+        results[0]["name"] = "Renamed"
+        results[1]["images"] = [{"url": "https://i.scdn.co/image/new", "height": 640, "width": 640}]
+
+        with self.assertNumQueries(10):
+            created, changed_covers = Album.upsert_from_json(results)
+        self.assertEqual([album.uri for album in created], [r["uri"] for r in results[5:]])
+        self.assertEqual([album.uri for album in changed_covers], ["spotify:album:queen-1"])
+        self.assertEqual(Album.objects.count(), 10)
+        spot.refresh_from_db()
+        self.assertEqual(spot.playable.name, "Renamed")
+        self.assertEqual(spot.playable.cover_hash, "0" * 64)
+        self.assertEqual(json.loads(spot.playable.json_response)["name"], "Renamed")
+        self.assertEqual(Album.objects.get(uri="spotify:album:queen-1").cover_hash, "")
+        # the cached representations of the shelf are outdated
+        self.assertEqual(Shelf.objects.get(pk=shelf.pk).revision, 1)
+
+    def test_devices(self):
+        Device.objects.create(device_id=DEVICES[0]["id"], device_name="Old name", device_type="Speaker", active=True)
+        created = Device.upsert_from_json(DEVICES)
+        self.assertEqual([device.device_id for device in created], [DEVICES[1]["id"]])
+        known = Device.objects.get(device_id=DEVICES[0]["id"])
+        self.assertEqual(known.device_name, DEVICES[0]["name"])
+        self.assertTrue(known.active)
+        self.assertEqual(Device.upsert_from_json(DEVICES), [])
+        self.assertEqual(Device.objects.count(), 2)
+
+
+class TestPlayablePayload(TestCase):
+
+    def test_payload_loaded_on_demand(self):
+        json_response = json.dumps(fake_album("queen", 0))
+        Album.from_json(json_response, save=True)
+        payload = PlayablePayload.objects.get()
+        self.assertLess(len(payload.json_response_z), len(json_response))
+
+        with self.assertNumQueries(1):
+            playable = Playable.objects.get()
+            playable.to_dict()
+        with self.assertNumQueries(1):
+            self.assertEqual(playable.json_response, json_response)
+            self.assertEqual(playable.image, b"")
+
+    def test_payload_updated_on_save(self):
+        album = Album.from_json(fake_album("queen", 0), save=True)
+        album = Album.objects.get(pk=album.pk)
+        album.json_response = "{}"
+        album.save()
+        self.assertEqual(Album.objects.get(pk=album.pk).json_response, "{}")
+        self.assertEqual(PlayablePayload.objects.count(), 1)
+
+    def test_missing_payload(self):
+        album = Album.objects.create(name="No payload", image_url="", uri="spotify:album:none", external_url="",
+                                     href="", release_date="2020", artist="Artist")
+        self.assertEqual(Album.objects.get(pk=album.pk).json_response, "")
+
+
+class TestDuplicateShelf(TestCase):
+
+    def setUp(self):
+        self.shelf = Shelf.objects.create(name="Wall", active=True)
+        self.album = Album.objects.create(name="Album", image=b"", image_url="", uri="spotify:album:a",
+                                          external_url="", href="", json_response="{}", release_date="2020",
+                                          artist="Artist")
+        ShelfSpot.objects.bulk_create(ShelfSpot(row_index=row, col_index=col, shelf=self.shelf, playable=self.album,
+                                                associated_key=row * 10 + col)
+                                      for row in range(10) for col in range(10))
+
+    def test_copies_spots_with_constant_queries(self):
+        with self.assertNumQueries(5):
+            copy = Shelf.duplicate(self.shelf)
+        self.assertFalse(copy.active)
+        spots = list(copy.shelfspot_set.order_by("row_index", "col_index")
+                     .values_list("row_index", "col_index", "playable_id", "associated_key"))
+        self.assertEqual(len(spots), 100)
+        self.assertEqual(spots[-1], (9, 9, self.album.id, None))
+        self.assertEqual(self.shelf.shelfspot_set.count(), 100)
+
+    def test_with_keys(self):
+        copy = Shelf.duplicate(self.shelf, with_keys=True)
+        self.assertEqual(sorted(copy.shelfspot_set.values_list("associated_key", flat=True)), list(range(100)))
+
+    def test_next_free_suffix(self):
+        Shelf.objects.bulk_create(Shelf(name=name, active=False) for name in ["Wall (2)", "Wall (3)", "Wall (5)",
+                                                                               "Wall (4) old", "Wallpaper (4)"])
+        with self.assertNumQueries(5):
+            self.assertEqual(Shelf.duplicate(self.shelf).name, "Wall (4)")
+        self.assertEqual(Shelf.duplicate(self.shelf).name, "Wall (6)")
+        self.assertEqual(Shelf.duplicate(Shelf.objects.get(name="Wall (5)")).name, "Wall (7)")
+        self.assertEqual(Shelf.duplicate(Shelf(name="Other", active=False)).name, "Other (2)")
+
+
+class TestLoadInitData(TestCase):
+
+    def load(self):
+        call_command("loadinitdata", stdout=io.StringIO())
+
+    def test_reload_keeps_edited_shelf(self):
+        self.load()
+        spot = ShelfSpot.objects.get(pk=1)
+        spot.associated_key = 7
+        spot.save()
+        Shelf.record_change(1, changed_spot_ids=[spot.id])
+        Shelf.record_change(1, changed_spot_ids=[spot.id])
+
+        self.load()
+        self.assertEqual(Shelf.objects.get(pk=1).revision, 2)
+        self.assertEqual(ShelfSpot.objects.get(pk=1).associated_key, 7)
+        self.assertEqual(Shelf.record_change(1, changed_spot_ids=[spot.id]), 3)
+
+    def test_creates_missing_objects(self):
+        self.load()
+        Shelf.objects.filter(pk=1).delete()
+        self.load()
+        self.assertEqual(Shelf.objects.get(pk=1).shelfspot_set.get().playable_id, 1)
+        self.assertEqual(Album.objects.get(pk=1).name, "DUMMY")
@@ -0,0 +1,142 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from configurator.library import DUMMY_PLAYABLE_ID
+from configurator.models import Album, Shelf, ShelfSpot, ShelfChange
+from configurator.serializers import serialize_shelf, serialize_shelves
+from configurator.test_library import create_album
+
+
+def create_shelf(name, rows, cols, active=False):
+    shelf = Shelf.objects.create(name=name, active=active)
+    spots = []
+    for row in range(rows):
+        for col in range(cols):
+            album = Album.objects.create(name=f"{name} {row}/{col}", image=b"", image_url="https://example.com/img",
+                                         uri=f"spotify:album:{name}-{row}-{col}", external_url="", href="",
+                                         json_response="{}", release_date="2020", artist="Artist")
+            spots.append(ShelfSpot(row_index=row, col_index=col, shelf=shelf, playable=album))
+    ShelfSpot.objects.bulk_create(spots)
+    return shelf
+
+
+class TestShelfSerialization(TestCase):
+
+    def test_serialize_shelf_single_query(self):
+        shelf = create_shelf("Large", 20, 20)
+        with self.assertNumQueries(1):
+            data = serialize_shelf(shelf)
+        self.assertEqual(len(data["spot_matrix"]), 400)
+        self.assertEqual(data["spot_matrix"][0]["playable"]["name"], "Large 0/0")
+
+    def test_serialize_shelf_matches_to_dict(self):
+        shelf = create_shelf("Small", 2, 3)
+        self.assertEqual(serialize_shelf(shelf), shelf.to_dict())
+
+    def test_serialize_empty_spot(self):
+        shelf = Shelf.objects.create(name="Empty", active=False)
+        ShelfSpot.objects.create(row_index=0, col_index=0, shelf=shelf, playable=None)
+        self.assertIsNone(serialize_shelf(shelf)["spot_matrix"][0]["playable"])
+
+    def test_serialize_shelves_constant_queries(self):
+        shelves = [create_shelf(f"Shelf{i}", 5, 5) for i in range(3)]
+        with self.assertNumQueries(1):
+            data = serialize_shelves(shelves)
+        self.assertEqual([len(d["spot_matrix"]) for d in data], [25, 25, 25])
+
+
+class TestShelfEndpointQueryBudget(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_shelf_json(self):
+        shelf = create_shelf("Large", 20, 20)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("configurator:shelf_json", args=(shelf.id,)))
+        self.assertEqual(len(response.json()["spot_matrix"]), 400)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("configurator:shelf_json", args=(shelf.id,)))
+
+    def test_active_shelf_json(self):
+        create_shelf("Inactive", 3, 3)
+        create_shelf("Active", 10, 10, active=True)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("configurator:active_shelf"))
+        self.assertEqual(response.json()["name"], "Active")
+
+    def test_pick_shelf_json(self):
+        for i in range(3):
+            create_shelf(f"Shelf{i}", 4, 4, active=(i == 0))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("configurator:pick_shelf_json"))
+        data = response.json()["data"]
+        self.assertEqual(data[0]["name"], "Shelf0")
+        self.assertEqual(len(data), 2)
+
+    def test_set_playable(self):
+        shelf = create_shelf("Large", 10, 10)
+        spot = shelf.shelfspot_set.order_by("id").first()
+        album = Album.objects.create(name="New", image=b"", image_url="", uri="spotify:album:new", external_url="",
+                                     href="", json_response="{}", release_date="2020", artist="Artist")
+        with self.assertNumQueries(13):
+            response = self.client.post(reverse("configurator:set_playable"),
+                                        {"playable_id": album.id, "shelfspot_id": spot.id})
+        self.assertEqual(response.json()["spot_matrix"][0]["playable"]["name"], "New")
+
+    def test_set_playable_delta(self):
+        shelf = create_shelf("Large", 10, 10)
+        spot = shelf.shelfspot_set.order_by("id").first()
+        with self.assertNumQueries(14):
+            response = self.client.post(reverse("configurator:set_playable") + "?since=0",
+                                        {"playable_id": spot.playable_id + 1, "shelfspot_id": spot.id})
+        self.assertEqual(response.json()["revision"], 1)
+        self.assertEqual(len(response.json()["spots"]), 1)
+
+
+class TestShelfDelta(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_album("DUMMY", artist="", in_library=True, id=DUMMY_PLAYABLE_ID)
+        self.shelf = create_shelf("Wall", 2, 2)
+        self.spots = list(self.shelf.shelfspot_set.order_by("id"))
+        self.url = reverse("configurator:shelf_json", args=(self.shelf.id,))
+
+    def test_full_response_has_revision(self):
+        self.assertEqual(self.client.get(self.url).json()["revision"], 0)
+
+    def test_mutations_since_revision(self):
+        self.client.get(reverse("configurator:remove_playable", args=(self.spots[0].id,)))
+        self.client.post("/api/shelf/add/", {"row_id": 2, "col_id": 0, "shelf_id": self.shelf.id})
+        response = self.client.post("/api/shelf/remove/?since=1", {"row_id": 1, "col_id": 1,
+                                                                    "shelf_id": self.shelf.id})
+        delta = response.json()
+        self.assertEqual((delta["since"], delta["revision"]), (1, 3))
+        self.assertEqual([spot["row"] for spot in delta["spots"]], [2])
+        self.assertEqual(delta["removed"], [self.spots[3].id])
+
+        delta = self.client.get(self.url, {"since": 0}).json()
+        self.assertEqual([spot["id"] for spot in delta["spots"]], [self.spots[0].id, delta["spots"][1]["id"]])
+        self.assertEqual(delta["spots"][0]["playable"]["name"], "DUMMY")
+        self.assertEqual(self.client.get(self.url, {"since": 3}).json()["spots"], [])
+
+    def test_unknown_changes_send_whole_shelf(self):
+        Shelf.bump_revision(self.shelf.id)
+        response = self.client.get(reverse("configurator:remove_playable", args=(self.spots[0].id,)), {"since": 0})
+        self.assertEqual(response.json()["revision"], 2)
+        self.assertEqual(len(response.json()["spot_matrix"]), 4)
+        self.assertEqual(len(self.client.get(self.url, {"since": 1}).json()["spots"]), 1)
+        self.assertIn("spot_matrix", self.client.get(self.url, {"since": 5}).json())
+
+    def test_old_changes_pruned(self):
+        keep = ShelfChange.KEEP_REVISIONS
+        for _ in range(2 * keep - 1):
+            Shelf.record_change(self.shelf.id, changed_spot_ids=[self.spots[0].id])
+        Shelf.record_change(self.shelf.id, removed_spot_ids=[self.spots[1].id])
+        self.assertEqual(ShelfChange.objects.filter(shelf=self.shelf).count(), keep)
+        self.assertIn("spot_matrix", self.client.get(self.url, {"since": keep - 1}).json())
+        delta = self.client.get(self.url, {"since": keep}).json()
+        self.assertEqual(([spot["id"] for spot in delta["spots"]], delta["removed"]),
+                         ([self.spots[0].id], [self.spots[1].id]))
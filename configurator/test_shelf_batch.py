@@ -0,0 +1,85 @@
+import json
+
+from django.test import TestCase
+from django.urls import reverse
+
+from configurator import dispatch
+from configurator.library import DUMMY_PLAYABLE_ID
+from configurator.models import Shelf, ShelfSpot, Playable
+from configurator.shelf_batch import apply_batch, BatchError
+from configurator.test_library import create_album
+from configurator.test_serializers import create_shelf
+
+
+class TestShelfBatch(TestCase):
+
+    def setUp(self):
+        create_album("DUMMY", artist="", in_library=True, id=DUMMY_PLAYABLE_ID)
+        self.shelf = create_shelf("Wall", 2, 2, active=True)
+        self.albums = [create_album(f"New {i}") for i in range(3)]
+        self.url = reverse("configurator:batch_edit_shelf", args=(self.shelf.id,))
+
+    def post(self, operations, **params):
+        url = self.url + ("?since=" + str(params["since"]) if "since" in params else "")
+        return self.client.post(url, json.dumps({"operations": operations}), content_type="application/json")
+
+    def spot(self, row, col) -> ShelfSpot:
+        return ShelfSpot.objects.get(shelf=self.shelf, row_index=row, col_index=col)
+
+    def test_layout_wall(self):
+        operations = []
+        for row in range(2, 12):
+            for col in range(10):
+                operations.append({"op": "add", "row": row, "col": col})
+                operations.append({"op": "set", "row": row, "col": col, "playable_id": self.albums[col % 3].id})
+        with self.assertNumQueries(17):
+            response = self.post(operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["spot_matrix"]), 104)
+        self.assertEqual(response.json()["revision"], 1)
+        self.assertEqual(self.spot(11, 9).playable_id, self.albums[0].id)
+        self.assertTrue(all(Playable.objects.filter(pk__in=[a.id for a in self.albums])
+                            .values_list("in_library", flat=True)))
+
+    def test_operations_in_order(self):
+        removed = self.spot(1, 1)
+        response = self.post([
+            {"op": "assign_key", "row": 0, "col": 0, "key": 3},
+            {"op": "remove", "row": 1, "col": 1},
+            {"op": "add", "row": 1, "col": 1},
+            {"op": "assign_key", "row": 1, "col": 1, "key": 3},
+            {"op": "add", "row": 5, "col": 5},
+            {"op": "remove", "row": 5, "col": 5},
+        ], since=0)
+        delta = response.json()
+        self.assertEqual(delta["removed"], [removed.id])
+        self.assertEqual([(spot["row"], spot["col"], spot["associated_key"]) for spot in delta["spots"]],
+                         [(0, 0, None), (1, 1, 3)])
+        self.assertIsNone(self.spot(0, 0).associated_key)
+        self.assertEqual(dispatch.lookup(3).playable_uri, "spotify:album:DUMMY")
+
+    def test_invalid_operation_changes_nothing(self):
+        operations = [{"op": "set", "row": 0, "col": 0, "playable_id": self.albums[0].id},
+                      {"op": "add", "row": 0, "col": 1}]
+        response = self.post(operations)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["operation"], 1)
+        self.assertNotEqual(self.spot(0, 0).playable_id, self.albums[0].id)
+        self.assertEqual(Shelf.objects.get(pk=self.shelf.id).revision, 0)
+
+        for operations in ([{"op": "move", "row": 0, "col": 0}], [{"op": "remove", "row": 0}],
+                           [{"op": "remove", "row": 9, "col": 9}],
+                           [{"op": "set", "row": 0, "col": 0, "playable_id": 999}]):
+            with self.assertRaises(BatchError):
+                apply_batch(self.shelf.id, operations)
+        self.assertEqual(self.post({"op": "add"}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, "[]", content_type="application/json").status_code, 400)
+
+    def test_unknown_shelf(self):
+        response = self.client.post(reverse("configurator:batch_edit_shelf", args=(999,)),
+                                    json.dumps({"operations": []}), content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_batch_keeps_revision(self):
+        self.assertEqual(self.post([], since=0).json(), {"shelf_id": self.shelf.id, "revision": 0, "since": 0,
+                                                          "spots": [], "removed": []})
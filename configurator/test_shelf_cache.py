@@ -0,0 +1,71 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from configurator.library import DUMMY_PLAYABLE_ID
+from configurator.models import Album, Shelf, ShelfChange, ShelfSpot
+from configurator.shelf_cache import shelf_etag
+from configurator.test_library import create_album
+from configurator.test_serializers import create_shelf
+
+
+class TestShelfJsonCache(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        create_album("DUMMY", artist="", in_library=True, id=DUMMY_PLAYABLE_ID)
+        self.shelf = create_shelf("Wall", 2, 2, active=True)
+        self.url = reverse("configurator:shelf_json", args=(self.shelf.id,))
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get(self.url)
+        etag = shelf_etag(self.shelf.id, 0, self.shelf.updated_at)
+        self.assertEqual(response["ETag"], etag)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_restored_revision_not_modified_only_if_unchanged(self):
+        Shelf.record_change(self.shelf.id)
+        etag = self.client.get(self.url)["ETag"]
+        # e.g. restoring a backup: the revision goes back and the shelf changes differently afterwards
+        ShelfChange.objects.all().delete()
+        Shelf.objects.filter(pk=self.shelf.id).update(revision=0)
+        Shelf.record_change(self.shelf.id)
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["revision"], 1)
+
+    def test_active_shelf_not_modified(self):
+        etag = self.client.get(reverse("configurator:active_shelf"))["ETag"]
+        response = self.client.get(reverse("configurator:active_shelf"), headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_mutation_invalidates(self):
+        etag = self.client.get(self.url)["ETag"]
+        spot = self.shelf.shelfspot_set.order_by("id").first()
+        album = Album.objects.create(name="New", image=b"", image_url="", uri="spotify:album:new", external_url="",
+                                     href="", json_response="{}", release_date="2020", artist="Artist")
+        self.client.post(reverse("configurator:set_playable"), {"playable_id": album.id, "shelfspot_id": spot.id})
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["spot_matrix"][0]["playable"]["name"], "New")
+
+    def test_activate_shelf_invalidates(self):
+        other = Shelf.objects.create(name="Other", active=False)
+        etag = self.client.get(self.url)["ETag"]
+        self.client.get(reverse("configurator:activate_shelf", args=(other.id,)))
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["active"])
+
+    def test_remove_playable_invalidates(self):
+        spot: ShelfSpot = self.shelf.shelfspot_set.order_by("id").last()
+        self.client.get(self.url)
+        self.client.get(reverse("configurator:remove_playable", args=(spot.id,)))
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["spot_matrix"][-1]["playable"]["name"], "DUMMY")
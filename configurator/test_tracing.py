@@ -0,0 +1,31 @@
+from django.test import SimpleTestCase
+
+from configurator.tracing import SpanCollector, parse_server_timing, summarize
+
+
+class TestTracing(SimpleTestCase):
+
+    def test_summarize(self):
+        summary = summarize([i / 100 for i in range(1, 101)])
+        self.assertEqual(summary["iterations"], 100)
+        self.assertAlmostEqual(summary["p50"], 0.505)
+        self.assertAlmostEqual(summary["p99"], 0.9901)
+        self.assertEqual(summarize([0.5])["p95"], 0.5)
+
+    def test_parse_server_timing(self):
+        self.assertEqual(parse_server_timing("shuffle;dur=12.5, start_playback;desc=\"x\";dur=80, cache, bad;dur=x"),
+                         {"shuffle": 0.0125, "start_playback": 0.08})
+        self.assertEqual(parse_server_timing(""), {})
+
+    def test_collector_keeps_recent_spans(self):
+        collector = SpanCollector(samples=3)
+        for i in range(5):
+            collector.record("press", i, trace_id=str(i))
+        with self.assertRaises(KeyError), collector.span("lookup", trace_id="4"):
+            raise KeyError
+        self.assertEqual(collector.stats()["press"]["iterations"], 3)
+        self.assertEqual(collector.stats()["press"]["max"], 4)
+        self.assertEqual(set(collector.trace("4")), {"press", "lookup"})
+        self.assertEqual(collector.trace("0"), {})
+        collector.clear()
+        self.assertEqual(collector.stats(), {})
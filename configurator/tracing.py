@@ -0,0 +1,113 @@
+import contextlib
+import secrets
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+
+# Header carrying the id of the trace of a button press, from the GPIO listener via Django to the music daemon
+TRACE_HEADER = "X-Trace-Id"
+# Header of the GPIO listener telling how long a press waited in its queue, in seconds
+QUEUED_HEADER = "X-Trace-Queued"
+# The number of most recent spans kept per stage
+SPAN_SAMPLES = 1000
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(8)
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    Summarize timing samples.
+
+    :param samples: Durations in seconds.
+    :return: A dictionary with the number of samples and mean, p50, p95, p99 and max durations in seconds.
+    """
+    if len(samples) > 1:
+        quantiles = statistics.quantiles(samples, n=100, method="inclusive")
+    else:
+        quantiles = samples * 99
+    return {"iterations": len(samples),
+            "mean": statistics.fmean(samples),
+            "p50": quantiles[49],
+            "p95": quantiles[94],
+            "p99": quantiles[98],
+            "max": max(samples)}
+
+
+def parse_server_timing(header: str) -> dict[str, float]:
+    """
+    Parse a Server-Timing header, e.g. "shuffle;dur=12.5, start_playback;dur=80".
+
+    :param header: The value of the header.
+    :return: The durations by metric name in seconds, metrics without duration are left out.
+    """
+    timings = {}
+    for metric in header.split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "dur":
+                try:
+                    timings[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return timings
+
+
+class SpanCollector:
+    """
+    Collects the durations of the stages of button presses in the memory of the current process.
+
+    Only the most recent `samples` spans of every stage are kept, so recording is cheap and memory bounded.
+    """
+    def __init__(self, samples: int = SPAN_SAMPLES):
+        self._lock = threading.Lock()
+        self._durations: defaultdict[str, deque[float]] = defaultdict(lambda: deque(maxlen=samples))
+        self._spans: deque[tuple[str, str, float]] = deque(maxlen=samples)
+
+    def record(self, stage: str, duration: float, trace_id: str | None = None):
+        """
+        :param stage: The name of the stage, e.g. "daemon.play".
+        :param duration: The duration of the stage in seconds.
+        :param trace_id: The trace the span belongs to.
+        """
+        with self._lock:
+            self._durations[stage].append(duration)
+            if trace_id is not None:
+                self._spans.append((trace_id, stage, duration))
+
+    @contextlib.contextmanager
+    def span(self, stage: str, trace_id: str | None = None):
+        """
+        Record the duration of the enclosed block as a span of a stage, also if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, trace_id)
+
+    def stats(self) -> dict[str, dict]:
+        """
+        :return: The summary of the recent durations of every stage, see `summarize`.
+        """
+        with self._lock:
+            durations = {stage: list(samples) for stage, samples in self._durations.items()}
+        return {stage: summarize(samples) for stage, samples in sorted(durations.items())}
+
+    def trace(self, trace_id: str) -> dict[str, float]:
+        """
+        :return: The durations of the recent spans of a trace by stage.
+        """
+        with self._lock:
+            return {stage: duration for span_trace_id, stage, duration in self._spans if span_trace_id == trace_id}
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._spans.clear()
+
+
+collector = SpanCollector()
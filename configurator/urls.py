@@ -17,7 +17,12 @@ urlpatterns += [
     path('api/shelf/add/', views.add_shelfspot, name="add_shelfspot_json"),
     path('api/shelf/remove/', views.remove_shelfspot, name="add_shelfspot_json"),
     path('api/album/library/', views.playable_library, name="album_library"),
+    path('api/album/library/search/', views.playable_library_search, name="album_library_search"),
+    path('api/album/library/search/<slug:token>', views.playable_library_search_result,
+         name="album_library_search_result"),
     path('api/shelfspot/set/', views.set_playable, name="set_playable"),
+    path('api/shelf/batch/<int:shelf_id>', views.batch_edit_shelf, name="batch_edit_shelf"),
+    path('api/cover/<slug:variant>/<slug:cover_hash>.jpg', views.album_cover, name="album_cover"),
     path('api/shelves', views.pick_shelf_json, name="pick_shelf_json"),
     # path('shelfpicker', views.pick_shelf, name="pick_shelf"),
     path('api/devices/', views.devices, name='devices'),
@@ -29,6 +34,8 @@ urlpatterns += [
     path('api/shelfspot/remove/<int:shelfspot_id>', views.remove_playable, name="remove_playable"),
 
     path('api/handle_button/', views.handle_button, name="handle_button"),
+    path('api/traces/', views.press_traces, name="press_traces"),
+    path('metrics', views.metrics, name="metrics"),
 
     path('test_buttons', views.dummy_buttons, name='test_buttons'),
     path('login', views.login_spotify, name='login'),
@@ -1,24 +1,56 @@
 import json
 import math
+import os
 import re
 from pprint import pprint
 from typing import Iterable
 
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, Http404, FileResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-
-from VinylWallConfig.settings import MUSIC_DAEMON_PATH
-from configurator.models import Playable, ShelfSpot, Shelf, Album, Playlist, Device, VWCSetting
-
-
-def album_cover(request, playable_id):
-    playable = get_object_or_404(Playable, pk=playable_id)
-    return HttpResponse(playable.image, content_type='image/jpeg')
+from django.views.decorators.http import condition, require_POST
+
+from configurator import dispatch, library_search, covers, broadcasts, shelf_batch, tracing
+from configurator.daemon_client import music_daemon, async_music_daemon, MusicDaemonError
+from configurator.library import library_queryset, library_page, InvalidCursor, PAGE_LIMIT
+from configurator.metrics import registry as metrics_registry
+from configurator.models import Playable, ShelfSpot, Shelf, Album, Playlist, Device
+from configurator.serializers import serialize_shelf, serialize_shelves, serialize_shelf_delta, spot_queryset
+from configurator.shelf_cache import get_shelf_payload, shelf_etag
+from helper_services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from VinylWallConfig.settings import COVER_CACHE_X_ACCEL
+
+# Seconds the answer to a press is kept to answer resent copies of it, longer than the GPIO listener resends a press
+PRESS_ANSWER_TIMEOUT = 120
+# Cached instead of the answer while a press is being handled
+PRESS_PENDING = "pending"
+
+
+@cache_control(public=True, max_age=covers.MAX_AGE, immutable=True)
+def album_cover(request, variant, cover_hash):
+    """
+    Serve a cached cover. Its URL contains the hash of the image, so it can be cached forever.
+
+    With COVER_CACHE_X_ACCEL, only the location of the file is returned and nginx sends it.
+    """
+    if variant not in covers.VARIANTS or not covers.HASH_PATTERN.fullmatch(cover_hash):
+        raise Http404("Unknown cover")
+    path = covers.cover_path(variant, cover_hash)
+    if not os.path.exists(path):
+        raise Http404("Unknown cover")
+    if COVER_CACHE_X_ACCEL:
+        response = HttpResponse(content_type="image/jpeg")
+        response["X-Accel-Redirect"] = covers.X_ACCEL_PREFIX + covers.cover_relpath(variant, cover_hash)
+        return response
+    return FileResponse(open(path, "rb"), content_type="image/jpeg")
 
 
 def shelf_view(request, shelf_id):
@@ -42,11 +74,29 @@ def react_view(request):
         return render(request, 'configurator/index.html', {})
 
 
+def shelf_json_etag(request, shelf_id):
+    version = Shelf.objects.filter(pk=shelf_id).values_list("revision", "updated_at").first()
+    if version is not None:
+        return shelf_etag(shelf_id, *version)
+
+
+def active_shelf_json_etag(request):
+    shelf_version = Shelf.objects.filter(active=1).values_list("id", "revision", "updated_at").first()
+    if shelf_version is not None:
+        return shelf_etag(*shelf_version)
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=shelf_json_etag)
 def shelf_json(request, shelf_id):
     shelf = get_object_or_404(Shelf, pk=shelf_id)
+    if request_since(request) is not None:
+        return render_shelf_change(request, shelf)
     return render_shelf_json(request, shelf)
 
 
+@cache_control(no_cache=True)
+@condition(etag_func=active_shelf_json_etag)
 def active_shelf_json(request):
     shelf = get_object_or_404(Shelf, active=1)
     return render_shelf_json(request, shelf)
@@ -84,9 +134,10 @@ def activate_device(request):
     for currently_active_device in currently_active_devices:
         currently_active_device.save()
     new_active_device.save()
+    dispatch.rebuild()
 
     devices: Iterable[Device] = Device.objects.all()
-    return JsonResponse([d.to_dict() for d in devices])
+    return JsonResponse([d.to_dict() for d in devices], safe=False)
     # return HttpResponseRedirect(reverse("configurator:devices"))
 
 
@@ -98,35 +149,19 @@ def activate_shelf(request, shelf_id):
 
     currently_active_shelf.save()
     new_active_shelf.save()
+    Shelf.bump_revision(currently_active_shelf.id, new_active_shelf.id)
+    dispatch.rebuild()
+    broadcasts.shelf_activated(currently_active_shelf.id, False)
+    broadcasts.shelf_activated(new_active_shelf.id, True)
     return JsonResponse({"active_shelf": new_active_shelf.id})
     # return render_shelf(request, shelf=new_active_shelf)
 
 
 def duplicate_shelf(request, shelf_id):
     shelf = get_object_or_404(Shelf, pk=shelf_id)
-    match = re.search(r" ?\((\d+)\)$", shelf.name)
-    ctd = 2
-    base_name = shelf.name
-    if match:
-        ctd = int(match.group(1)) + 1
-        base_name = shelf.name[:match.span()[0]]
-    while True:
-        new_name = f"{base_name} ({ctd})"
-        try:
-            Shelf.objects.get(name=new_name)
-        except Shelf.DoesNotExist:
-            break
-        else:
-            ctd += 1
-    new_shelf = Shelf(name=new_name, active=False)
-
-    spot_list = shelf.shelfspot_set.all()
-    new_shelf.save()
-    for shelfspot in spot_list:
-        ss_copy = ShelfSpot(row_index=shelfspot.row_index, col_index=shelfspot.col_index,
-                            playable_id=shelfspot.playable_id, shelf_id=new_shelf.id
-                            )
-        ss_copy.save()
+    with_keys = request.GET.get("with_keys", "0").lower() in ("1", "true")
+    new_shelf = Shelf.duplicate(shelf, with_keys=with_keys)
+    Shelf.bump_revision(new_shelf.id)
 
     return JsonResponse({"id": new_shelf.id})
     # return HttpResponseRedirect(reverse("configurator:shelf", args=(new_shelf.id,)))
@@ -139,8 +174,27 @@ def render_shelf(request, shelf):
 
 
 def render_shelf_json(request, shelf):
-    spot_list = shelf.shelfspot_set.all()
-    return JsonResponse(shelf.to_dict())
+    return HttpResponse(get_shelf_payload(shelf), content_type="application/json")
+
+
+def request_since(request) -> int | None:
+    try:
+        return int(request.GET["since"])
+    except (KeyError, ValueError):
+        return None
+
+
+def render_shelf_change(request, shelf):
+    """
+    Answer with a shelf after it changed, or only with the changes if the client sent the revision it knows as `since`.
+
+    The whole shelf is sent if the changes since that revision are not known anymore, clients tell both responses
+    apart by the "since" key of the delta.
+    """
+    since = request_since(request)
+    if since is not None and (delta := serialize_shelf_delta(shelf, since)) is not None:
+        return JsonResponse(delta)
+    return JsonResponse(serialize_shelf(shelf))
 
 def add_shelfspot(request):
     try:
@@ -159,7 +213,9 @@ def add_shelfspot(request):
         raise Exception("Shelf exists already")
     new_spot = ShelfSpot(row_index=row_id, col_index=col_id, shelf_id=shelf_id, playable_id=1)
     new_spot.save()
-    return JsonResponse(new_spot.shelf.to_dict())
+    revision = Shelf.record_change(shelf_id, changed_spot_ids=[new_spot.id])
+    broadcasts.spots_changed(shelf_id, revision, [new_spot])
+    return render_shelf_change(request, new_spot.shelf)
     # return HttpResponseRedirect(reverse("configurator:shelf_json", args=(shelf_id,)))
 
 
@@ -180,11 +236,41 @@ def remove_shelfspot(request):
         raise Exception("Shelf does not exist")
     shelfspot = get_object_or_404(ShelfSpot, shelf_id=shelf_id, row_index=row_id, col_index=col_id)
     shelf = shelfspot.shelf
+    shelfspot_id = shelfspot.id
     shelfspot.delete()
-    return JsonResponse(shelf.to_dict())
+    shelf.revision = Shelf.record_change(shelf.id, removed_spot_ids=[shelfspot_id])
+    dispatch.rebuild()
+    broadcasts.spot_removed(shelf.id, shelf.revision, shelfspot_id)
+    return render_shelf_change(request, shelf)
     # return HttpResponseRedirect(reverse("configurator:shelf_json", args=(shelf_id,)))
 
 
+@require_POST
+def batch_edit_shelf(request, shelf_id):
+    """
+    Apply a JSON list of spot edits {"operations": [...]} to a shelf at once, see `shelf_batch.apply_batch`.
+
+    Answers like the single edits, so with only the changes if the client sent the revision it knows as `since`.
+    """
+    try:
+        operations = json.loads(request.body.decode("utf-8"))["operations"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected a JSON object with a list of operations"}, status=400)
+    try:
+        result = shelf_batch.apply_batch(shelf_id, operations)
+    except Shelf.DoesNotExist:
+        raise Http404("Shelf does not exist")
+    except shelf_batch.BatchError as e:
+        return JsonResponse({"error": str(e), "operation": e.index}, status=400)
+
+    if result.changed_spot_ids or result.removed_spot_ids:
+        dispatch.rebuild()
+        broadcasts.spots_changed(shelf_id, result.revision,
+                                 spot_queryset().filter(pk__in=result.changed_spot_ids),
+                                 removed_spot_ids=result.removed_spot_ids)
+    return render_shelf_change(request, get_object_or_404(Shelf, pk=shelf_id))
+
+
 def set_playable(request):
     try:
         playable_id = request.POST["playable_id"]
@@ -198,12 +284,15 @@ def set_playable(request):
     shelfspot = get_object_or_404(ShelfSpot, pk=shelfspot_id)
     playable = get_object_or_404(Playable, pk=playable_id)
 
-    shelfspot.playable_id = playable.id
+    shelfspot.playable = playable
 
     playable.in_library = True
     shelfspot.save()
     playable.save()
-    return JsonResponse(shelfspot.shelf.to_dict())
+    revision = Shelf.record_change(shelfspot.shelf_id, changed_spot_ids=[shelfspot.id])
+    dispatch.rebuild()
+    broadcasts.spots_changed(shelfspot.shelf_id, revision, [shelfspot])
+    return render_shelf_change(request, shelfspot.shelf)
     # return HttpResponseRedirect(reverse("configurator:shelf_json", args=(shelfspot.shelf_id,)))
 
 
@@ -211,33 +300,44 @@ def remove_playable(request, shelfspot_id):
     shelfspot = get_object_or_404(ShelfSpot, pk=shelfspot_id)
     shelfspot.playable_id = 1
     shelfspot.save()
-    return JsonResponse(shelfspot.shelf.to_dict())
+    revision = Shelf.record_change(shelfspot.shelf_id, changed_spot_ids=[shelfspot.id])
+    dispatch.rebuild()
+    broadcasts.spots_changed(shelfspot.shelf_id, revision, [shelfspot])
+    return render_shelf_change(request, shelfspot.shelf)
     # return HttpResponseRedirect(reverse("configurator:shelf", args=(shelfspot.shelf_id,)))
 
 
-def add_albums_from_daemon(search_txt):
-    answer = requests.get(MUSIC_DAEMON_PATH + "/search_album/" + search_txt)
-    albums = answer.json()
-    for album in albums:
-        album_uri = album["uri"]  # spotify:album:1NLRh73eGolvxR1lenP5nQ
-        query = Playable.objects.filter(uri=album_uri)
-        if query.count() == 0:
-            Album.from_json(album, save=True)
+def add_devices_from_demon():
+    return Device.upsert_from_json(music_daemon.devices())
 
 
-def add_devices_from_demon():
-    answer = requests.get(MUSIC_DAEMON_PATH + "/devices")
-    devices = answer.json()
-    for device in devices:
-        device_id = device["id"]
-        query = Device.objects.filter(device_id=device_id)
-        if query.count() == 0:
-            Device.from_json(device, save=True)
+def legacy_library_page(search_txt: str, page: int) -> tuple[list[Playable], int]:
+    """
+    Return the playables of all pages up to `page` and the number of pages.
+    """
+    sorted_playables = library_queryset(search_txt)
+    page_playables: list[Playable] = list(sorted_playables[0:page * PAGE_LIMIT])
+    return page_playables, math.ceil(sorted_playables.count() / PAGE_LIMIT)
+
 
+async def playable_library(request):
+    """
+    List the library, answering from the local database only.
 
-def playable_library(request):
-    PAGE_LIMIT = 20
+    Searching for the first page also starts a Spotify search in the background like `playable_library_search` does,
+    the returned search_token identifies it.
+    """
     search_txt = request.GET.get("search_txt", "")
+
+    if "cursor" in request.GET:
+        try:
+            page_playables, next_cursor = await sync_to_async(library_page)(search_txt, request.GET["cursor"])
+        except InvalidCursor:
+            return JsonResponse({'error': "Invalid cursor"}, status=400)
+        return JsonResponse({'album_list': [p.to_dict() for p in page_playables],
+                             'next_cursor': next_cursor})
+
+    # Legacy pagination, returning all pages up to the requested one
     page_txt = request.GET.get("page", "1")
     try:
         page = int(page_txt)
@@ -246,26 +346,42 @@ def playable_library(request):
     except:
         page = 1
 
-    if search_txt == "":
-        library_playables = set(Playable.objects.filter(in_library=True))
-        sorted_playables = sorted([p for p in library_playables if p.id != 1], key=lambda x: x.created_at)
-
-    else:
-        add_albums_from_daemon(search_txt)
-        relevant_playables = Playable.objects.filter(name__icontains=search_txt)
-        relevant_playables = (set(relevant_playables)
-                              .union(set(Album.objects.filter(artist__icontains=search_txt)))
-                              .union(set(Playlist.objects.filter(owner__icontains=search_txt)))
-                              .union(set(Playlist.objects.filter(description__icontains=search_txt))))
-
-        sorted_playables = sorted([p for p in relevant_playables if p.id != 1],
-                                  key=lambda x: (1 - x.in_library, x.created_at))
-        # playables_in_lib = {p for p in relevant_playables if p.id != 1 and p.in_library}
-        # playables_not_in_lib = {p for p in relevant_playables if p.id != 1 and not p.in_library}
-    page_playables: list[Playable] = sorted_playables[0:page * PAGE_LIMIT]
+    page_playables, max_page = await sync_to_async(legacy_library_page)(search_txt, page)
+    search_token = None
+    if search_txt != "" and page == 1:
+        search_token = library_search.start_remote_search(search_txt)
     return JsonResponse({'page': page,
-                         'max_page': math.ceil(len(sorted_playables) / PAGE_LIMIT),
-                         'album_list': [p.to_dict() for p in page_playables]})
+                         'max_page': max_page,
+                         'album_list': [p.to_dict() for p in page_playables],
+                         'search_token': search_token})
+
+
+async def playable_library_search(request):
+    """
+    Search the library, answering from the local database only.
+
+    Spotify is searched in the background. The albums it finds are sent over the websocket
+    ws/library_search/<search_token>/ and can also be fetched from `playable_library_search_result`.
+    """
+    search_txt = request.GET.get("search_txt", "")
+    try:
+        page_playables, next_cursor = await sync_to_async(library_page)(search_txt, request.GET.get("cursor", ""))
+    except InvalidCursor:
+        return JsonResponse({'error': "Invalid cursor"}, status=400)
+
+    search_token = None
+    if search_txt != "" and "cursor" not in request.GET:
+        search_token = library_search.start_remote_search(search_txt)
+    return JsonResponse({'album_list': [p.to_dict() for p in page_playables],
+                         'next_cursor': next_cursor,
+                         'search_token': search_token})
+
+
+def playable_library_search_result(request, token):
+    result = library_search.get_result(token)
+    if result is None:
+        raise Http404("Unknown search token")
+    return JsonResponse(result)
 
 
 def dummy_buttons(request):
@@ -301,7 +417,7 @@ def pick_shelf_json(request):
     except:
         page = 1
 
-    sorted_shelves = sorted(Shelf.objects.all(), key=lambda x: (x.active, x.updated_at), reverse=True)
+    sorted_shelves = Shelf.objects.order_by("-active", "-updated_at")
 
     paginator = Paginator(sorted_shelves, PAGE_LIMIT)
 
@@ -313,7 +429,7 @@ def pick_shelf_json(request):
         current_page = paginator.page(paginator.num_pages)
 
     # Serialize the objects for the current page
-    serialized_data = [shelf.to_dict() for shelf in current_page.object_list]
+    serialized_data = serialize_shelves(current_page.object_list)
 
     return JsonResponse({"data": serialized_data,
                          "previous_page": current_page.has_previous() and current_page.previous_page_number() or None,
@@ -326,7 +442,7 @@ def pick_shelf_json(request):
 
 
 @csrf_exempt
-def handle_button(request):
+async def handle_button(request):
     pprint(request.POST)
     pprint(request.body)
     sent_key = None
@@ -338,15 +454,60 @@ def handle_button(request):
             pprint(json_body)
             sent_key = int(json_body["key"])
     if sent_key is not None:
-        if VWCSetting.get_listening_shelfspot() is None:
-            return play_from_key(sent_key)
-        else:
-            return assign_from_key(sent_key)
+        trace_id = request.headers.get(tracing.TRACE_HEADER) or tracing.new_trace_id()
+        response = await press_key(sent_key, trace_id, request.headers.get(tracing.QUEUED_HEADER))
+        response[tracing.TRACE_HEADER] = trace_id
+        return response
+
+
+async def press_key(sent_key: int, trace_id: str | None = None, queued: float | str | None = None):
+    """
+    Play the playable associated with a pressed key, or assign the key to the shelf spot waiting for one.
+
+    Shared by `handle_button` and the websocket ingress of the GPIO listener, `consumers.ButtonConsumer`.
+    The stages of the press are recorded as spans of its trace, see `tracing.collector`.
+
+    The listener resends a press if it got no answer, so presses are identified by their trace id and handled once.
+    A resent press is answered with the answer to the original, or with 409 while the original is still handled.
+
+    :param sent_key: The bitmask of the pressed keys.
+    :param trace_id: The trace of the press, created by the GPIO listener.
+    :param queued: The seconds the press waited in the queue of the GPIO listener.
+    :return: The JSON response describing the outcome.
+    :raises Http404: If no spot is associated with the key or no device is active.
+    """
+    if trace_id is None:
+        trace_id = tracing.new_trace_id()
+    answer_key = f"press_answer:{trace_id}"
+    if not await cache.aadd(answer_key, PRESS_PENDING, PRESS_ANSWER_TIMEOUT):
+        answer = await cache.aget(answer_key)
+        if answer is None or answer == PRESS_PENDING:
+            return JsonResponse({"error": "The press is still being handled."}, status=409)
+        status, content = answer
+        return HttpResponse(content, status=status, content_type="application/json")
+
+    try:
+        tracing.collector.record("listener.queue", float(queued), trace_id)
+    except (TypeError, ValueError):
+        pass
+    try:
+        with tracing.collector.span("press", trace_id):
+            if await dispatch.alistening_shelfspot() is None:
+                response = await play_from_key(sent_key, trace_id)
+            else:
+                response = await sync_to_async(assign_from_key)(sent_key)
+    except BaseException:
+        # nothing happened, so the press may be handled again
+        await cache.adelete(answer_key)
+        raise
+    await cache.aset(answer_key, (response.status_code, response.content), PRESS_ANSWER_TIMEOUT)
+    return response
 
 
 def assign_from_key(sent_key: int):
-    selected_shelfspot = get_object_or_404(ShelfSpot, pk=VWCSetting.get_listening_shelfspot())
-    former_shelfspots_for_key = selected_shelfspot.shelf.shelfspot_set.filter(associated_key=sent_key)
+    selected_shelfspot = get_object_or_404(ShelfSpot, pk=dispatch.listening_shelfspot())
+    former_shelfspots_for_key = list(selected_shelfspot.shelf.shelfspot_set.filter(associated_key=sent_key)
+                                     .select_related("playable"))
     for shelfspot in former_shelfspots_for_key:
         shelfspot.associated_key = None
     selected_shelfspot.associated_key = sent_key
@@ -354,30 +515,58 @@ def assign_from_key(sent_key: int):
     for shelfspot in former_shelfspots_for_key:
         shelfspot.save()
     selected_shelfspot.save()
-
-    VWCSetting.reset_listening_shelfspot()
+    changed_shelfspots = former_shelfspots_for_key + [selected_shelfspot]
+    revision = Shelf.record_change(selected_shelfspot.shelf_id,
+                                   changed_spot_ids=[shelfspot.id for shelfspot in changed_shelfspots])
+    dispatch.rebuild()
+
+    dispatch.reset_listening_shelfspot()
+    broadcasts.key_assigned(selected_shelfspot.id, sent_key)
+    broadcasts.spots_changed(selected_shelfspot.shelf_id, revision, changed_shelfspots)
     return JsonResponse({'selected_playable': selected_shelfspot.playable.to_dict(),
                          "key": sent_key})
 
 
-def play_from_key(sent_key):
-    active_device = get_object_or_404(Device, active=True)
-    active_shelfpots = ShelfSpot.objects.filter(shelf__active=True)
-    selected_shelfspot: ShelfSpot = get_object_or_404(active_shelfpots, associated_key=sent_key)
-    selected_playable: Playable = get_object_or_404(Playable, pk=selected_shelfspot.playable_id)
-    post_data = {"device": active_device.device_id, "playable_uri": selected_playable.uri}
-    pprint(post_data)
-    requests.post(MUSIC_DAEMON_PATH + "/play",
-                  data=json.dumps(post_data),
-                  headers={'Content-Type': 'application/json'})
-    return JsonResponse({'selected_playable': selected_playable.uri, "device": active_device.device_id})
+async def play_from_key(sent_key, trace_id: str | None = None):
+    with tracing.collector.span("dispatch.lookup", trace_id):
+        target = await dispatch.alookup(int(sent_key))
+    if target is None:
+        raise Http404("No shelf spot of the active shelf is associated with this key.")
+    if target.device_id is None:
+        raise Http404("No active device.")
+    pprint({"device": target.device_id, "playable_uri": target.playable_uri, "trace_id": trace_id})
+    try:
+        with tracing.collector.span("daemon.play", trace_id):
+            daemon_timings = await async_music_daemon.play(target.device_id, target.playable_uri, trace_id=trace_id)
+    except (MusicDaemonError, httpx.HTTPError) as e:
+        # not a 5xx, which the GPIO listener would resend although the daemon may have started playing
+        return JsonResponse({'error': str(e)}, status=424)
+    for stage, duration in daemon_timings.items():
+        tracing.collector.record("daemon." + stage, duration, trace_id)
+    return JsonResponse({'selected_playable': target.playable_uri, "device": target.device_id})
+
+
+def press_traces(request):
+    """
+    Report the p50/p95/p99 durations of the recent button presses per stage, or the spans of a single press if a
+    trace_id is given.
+    """
+    trace_id = request.GET.get("trace_id")
+    if trace_id is not None:
+        return JsonResponse({"trace_id": trace_id, "spans": tracing.collector.trace(trace_id)})
+    return JsonResponse({"stages": tracing.collector.stats()})
+
+
+def metrics(request):
+    """
+    Report the metrics of this process in the Prometheus text format.
+    """
+    return HttpResponse(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 
 def login_if_necessary(request):
-    resp = requests.get(MUSIC_DAEMON_PATH + "/isLoggedIn")
-    if resp.status_code != 200:
-        resp = requests.get(MUSIC_DAEMON_PATH + "/auth_url")
-        verification_url = resp.text
+    if not music_daemon.is_logged_in():
+        verification_url = music_daemon.auth_url()
         return render(request, 'configurator/verify_url.html', {'verification_url': verification_url})
 
 def login_spotify(request):
@@ -412,21 +601,14 @@ def login_spotify(request):
 
 def apply_code(code, request):
     success = False
-    # Construct the daemon URL with the code as a query parameter
-    daemon_url = f"{MUSIC_DAEMON_PATH}?code={code}"
-    # Make a GET request to the daemon URL
     try:
-        response = requests.get(daemon_url)
-
-        # Check if the response status is 200 (success)
-        if response.status_code == 200:
-            # Redirect to the homepage
-            success = True
-        else:
-            # Handle non-200 responses from the daemon URL
-            messages.error(
-                request, f"Daemon returned status code {response.status_code}. Please try again."
-            )
+        music_daemon.apply_code(code)
+        success = True
+    except MusicDaemonError as e:
+        # Handle non-200 responses from the daemon
+        messages.error(
+            request, f"Daemon returned status code {e.status_code}. Please try again."
+        )
     except requests.RequestException as e:
         # Handle connection errors or other request exceptions
         messages.error(
@@ -1,5 +1,5 @@
 import { create } from 'zustand'
-import { ShelfData, AlbumLibraryData, Device, WebSocketMessage, PaginatedShelfData } from '../types'
+import { ShelfData, AlbumLibraryData, Device, WebSocketMessage, PaginatedShelfData, LibrarySearchResult } from '../types'
 
 interface StoreState {
   // Shelf data
@@ -14,6 +14,7 @@ interface StoreState {
   // Album library
   albumLibrary: AlbumLibraryData | null;
   searchQuery: string;
+  librarySearchSocket: WebSocket | null;
 
   // Devices
   devices: Device[];
@@ -31,6 +32,7 @@ interface StoreState {
   fetchActiveShelf: () => Promise<ShelfData>;
   fetchShelves: (page?: number) => Promise<void>;
   fetchAlbumLibrary: (query?: string, page?: number) => Promise<void>;
+  followLibrarySearch: (query: string, searchToken: string) => void;
   fetchDevices: () => Promise<void>;
 
   toggleEditMode: () => void;
@@ -67,6 +69,7 @@ export const useStore = create<StoreState>((set, get) => ({
 
   albumLibrary: null,
   searchQuery: '',
+  librarySearchSocket: null,
 
   devices: [],
 
@@ -126,14 +129,57 @@ export const useStore = create<StoreState>((set, get) => ({
     try {
       const url = `/api/album/library/?search_txt=${query}&page=${page}`;
       const response = await fetch(url);
-      const data = await response.json();
+      const data = await response.json() as AlbumLibraryData;
       set({ albumLibrary: data, searchQuery: query, isLoading: false });
+      // The answer only holds the albums already in the database, Spotify is searched in the background
+      if (data.search_token) {
+        get().followLibrarySearch(query, data.search_token);
+      }
     } catch (error) {
       console.error('Error fetching album library:', error);
       set({ isLoading: false });
     }
   },
 
+  followLibrarySearch: (query: string, searchToken: string) => {
+    get().librarySearchSocket?.close();
+
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    const ws = new WebSocket(`${protocol}//${window.location.host}/ws/library_search/${searchToken}/`);
+
+    // The server sends the albums found by Spotify once, then closes the connection
+    ws.onmessage = (e) => {
+      const result: LibrarySearchResult = JSON.parse(e.data);
+      if (result.error) {
+        console.error('Error searching Spotify:', result.error);
+      }
+
+      const { albumLibrary, searchQuery } = get();
+      // Skip results of a search that was replaced by a newer one
+      if (!albumLibrary || searchQuery !== query || result.album_list.length === 0) {
+        return;
+      }
+      const knownIds = new Set(albumLibrary.album_list.map(album => album.id));
+      const newAlbums = result.album_list.filter(album => !knownIds.has(album.id));
+      set({
+        albumLibrary: {
+          ...albumLibrary,
+          album_list: [...albumLibrary.album_list, ...newAlbums],
+          // The new albums may add pages, fetching the next one returns the albums in library order again
+          max_page: Math.max(albumLibrary.max_page, albumLibrary.page + 1),
+        }
+      });
+    };
+
+    ws.onclose = () => {
+      if (get().librarySearchSocket === ws) {
+        set({ librarySearchSocket: null });
+      }
+    };
+
+    set({ librarySearchSocket: ws });
+  },
+
   fetchDevices: async () => {
     set({ isLoading: true });
     try {
@@ -27,6 +27,14 @@ export interface AlbumLibraryData {
   page: number;
   max_page: number;
   album_list: Playable[];
+  search_token: string | null; // identifies the Spotify search started in the background
+}
+
+// Types for the results of a Spotify search of the album library
+export interface LibrarySearchResult {
+  done: boolean;
+  album_list: Playable[];
+  error?: string;
 }
 
 // Types for paginated shelf data
@@ -0,0 +1,404 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import urlsplit, parse_qs, unquote
+
+DEVICES = [
+    {"id": "fake-speaker", "is_active": False, "is_private_session": False, "is_restricted": False,
+     "name": "Fake Speaker", "type": "Speaker", "volume_percent": 50},
+    {"id": "fake-computer", "is_active": False, "is_private_session": False, "is_restricted": False,
+     "name": "Fake Computer", "type": "Computer", "volume_percent": 100},
+]
+
+# Samplers of request latencies by name, taking a random generator and the parameters of the distribution in seconds
+LATENCY_DISTRIBUTIONS: dict[str, Callable[..., float]] = {
+    "const": lambda rng, seconds: seconds,
+    "uniform": lambda rng, low, high: rng.uniform(low, high),
+    "normal": lambda rng, mean, stddev: max(rng.gauss(mean, stddev), 0.0),
+    "lognormal": lambda rng, median, sigma: median * math.exp(rng.gauss(0, sigma)),
+    "exponential": lambda rng, mean: rng.expovariate(1 / mean),
+}
+# Checks of the parameters of the latency distributions, by the same names
+LATENCY_PARAMETER_CHECKS: dict[str, tuple[Callable[..., bool], str]] = {
+    "const": (lambda seconds: seconds >= 0, "seconds >= 0"),
+    "uniform": (lambda low, high: 0 <= low <= high, "0 <= low <= high"),
+    "normal": (lambda mean, stddev: mean >= 0 and stddev >= 0, "mean >= 0 and stddev >= 0"),
+    "lognormal": (lambda median, sigma: median >= 0 and sigma >= 0, "median >= 0 and sigma >= 0"),
+    "exponential": (lambda mean: mean > 0, "mean > 0"),
+}
+# Words the names of the albums and artists of a `Catalog` are made of
+CATALOG_WORDS = ("Blue", "Night", "River", "Electric", "Silent", "Golden", "Wild", "Paper", "Velvet", "Broken",
+                 "Summer", "Echo", "Glass", "Midnight", "Northern", "Lights", "Dreams", "Fire", "Stone", "Garden")
+
+
+class Latency:
+    """
+    A distribution of request latencies, parsed from specs like "0.1", "uniform:0.05,0.2", "normal:0.1,0.02",
+    "lognormal:0.1,0.5" (median and sigma) or "exponential:0.1" (mean). Durations are given in seconds.
+    """
+    def __init__(self, spec: str):
+        name, _, params = spec.partition(":") if ":" in spec else ("const", "", spec)
+        if name not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {name}, use one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.spec = spec
+        self._sample = LATENCY_DISTRIBUTIONS[name]
+        self._params = [float(param) for param in params.split(",")]
+        check, condition = LATENCY_PARAMETER_CHECKS[name]
+        try:
+            valid = all(math.isfinite(param) for param in self._params) and check(*self._params)
+        except TypeError:
+            raise ValueError(f"Wrong number of parameters for the {name} latency distribution: {spec}")
+        if not valid:
+            raise ValueError(f"Invalid parameters for the {name} latency distribution, expected {condition}: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        return self._sample(rng, *self._params)
+
+    def __repr__(self):
+        return f"Latency({self.spec!r})"
+
+
+class Catalog:
+    """
+    A deterministic catalog of albums and playlists, the same for the same size and seed.
+
+    Searches match the query case-insensitively against the names and artists, in catalog order.
+    """
+    def __init__(self, size: int, seed: int = 0):
+        rng = random.Random(seed)
+        self.albums = []
+        for index in range(size):
+            artist = " ".join(rng.sample(CATALOG_WORDS, 2))
+            name = " ".join(rng.sample(CATALOG_WORDS, rng.randint(1, 3)))
+            self.albums.append(_album(f"{seed}-{index}", name, artist, f"{rng.randint(1960, 2024)}-01-01"))
+        self.playlists = [_playlist(f"{seed}-{index}", f"{album['artists'][0]['name']} Mix", "Mix of the catalog")
+                          for index, album in enumerate(self.albums[::10])]
+
+    @staticmethod
+    def _search(items: list[dict], query: str, limit: int, text: Callable[[dict], str]) -> list[dict]:
+        query = query.lower()
+        return [item for item in items if query in text(item).lower()][:limit]
+
+    def search_albums(self, query: str, limit: int) -> list[dict]:
+        return self._search(self.albums, query, limit, lambda album: album["name"] + " " + album["artists"][0]["name"])
+
+    def search_playlists(self, query: str, limit: int) -> list[dict]:
+        return self._search(self.playlists, query, limit, lambda playlist: playlist["name"])
+
+
+def _album(album_id: str, name: str, artist: str, release_date: str) -> dict:
+    album_id = album_id.replace(" ", "_")
+    return {"name": name,
+            "images": [{"url": f"https://example.com/{album_id}/640.jpg", "height": 640, "width": 640},
+                       {"url": f"https://example.com/{album_id}/64.jpg", "height": 64, "width": 64}],
+            "artists": [{"name": artist}],
+            "uri": f"spotify:album:{album_id}",
+            "external_urls": {"spotify": f"https://example.com/album/{album_id}"},
+            "href": f"https://example.com/v1/albums/{album_id}",
+            "release_date": release_date}
+
+
+def _playlist(playlist_id: str, name: str, description: str) -> dict:
+    playlist_id = playlist_id.replace(" ", "_")
+    return {"name": name,
+            "images": [{"url": f"https://example.com/{playlist_id}/300.jpg", "height": 300, "width": 300}],
+            "owner": {"display_name": "Fake Owner"},
+            "description": description,
+            "public": True,
+            "uri": f"spotify:playlist:{playlist_id}",
+            "external_urls": {"spotify": f"https://example.com/playlist/{playlist_id}"},
+            "href": f"https://example.com/v1/playlists/{playlist_id}"}
+
+
+def fake_album(query: str, index: int) -> dict:
+    """
+    Create an album search result shaped like the ones of the Spotify API.
+
+    :param query: The search query, it becomes part of the name and the URI of the album.
+    :param index: The position of the album within the search result.
+    :return: A dictionary as returned by the Spotify search endpoint for albums.
+    """
+    return _album(f"{query}-{index}", f"{query} Album {index}", f"{query} Artist {index % 5}",
+                  f"{1960 + index % 60}-01-01")
+
+
+def fake_playlist(query: str, index: int) -> dict:
+    return _playlist(f"{query}-{index}", f"{query} Playlist {index}", f"Playlist about {query}")
+
+
+class FakeMusicDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with Nagle's algorithm the body would wait for the delayed ACK
+    disable_nagle_algorithm = True
+    server: "FakeMusicDaemonServer"
+
+    def setup(self):
+        super().setup()
+        self.server.fake.connections += 1
+
+    @staticmethod
+    def route(path: str) -> str:
+        """
+        :return: The name of the route of a path, as used for `FakeMusicDaemon.route_latency`.
+        """
+        if path == "/":
+            return "code"
+        return path.strip("/").split("/")[0]
+
+    def before_route(self, route: str) -> bool:
+        """
+        Delay the request and inject an error or rate limit if configured.
+
+        :return: Whether the request should be answered normally, False if an error was sent.
+        """
+        fake = self.server.fake
+        self.current_route = route
+        status, delay = fake.before_request(route)
+        if delay:
+            time.sleep(delay)
+        if status == 429:
+            self.send_json({"error": {"status": 429, "message": "API rate limit exceeded"}}, status=429,
+                           headers={"Retry-After": str(fake.retry_after)})
+        elif status is not None:
+            self.send_json({"error": {"status": status, "message": "Injected error"}}, status=status)
+        return status is None
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        route = self.route(url.path)
+        if not self.before_route(route):
+            return
+        if url.path == "/isLoggedIn":
+            if fake.logged_in:
+                self.send_json({"id": "fake-user", "display_name": "Fake User"})
+            else:
+                self.send_text("Not logged in", status=401)
+        elif url.path == "/auth_url":
+            self.send_text("https://example.com/authorize?client_id=fake")
+        elif url.path == "/devices":
+            self.send_json(DEVICES)
+        elif url.path.startswith("/search_album/"):
+            query = unquote(url.path.removeprefix("/search_album/"))
+            if fake.catalog is not None:
+                self.send_json(fake.catalog.search_albums(query, fake.search_limit))
+            else:
+                self.send_json([fake_album(query, i) for i in range(fake.search_limit)])
+        elif url.path.startswith("/search_playlist/"):
+            query = unquote(url.path.removeprefix("/search_playlist/"))
+            if fake.catalog is not None:
+                self.send_json(fake.catalog.search_playlists(query, 10))
+            else:
+                self.send_json([fake_playlist(query, i) for i in range(10)])
+        elif url.path == "/":
+            code = parse_qs(url.query).get("code")
+            if code:
+                fake.logged_in = True
+                self.send_json({"message": f"Code is: {code[0]}"})
+            else:
+                self.send_json({"message": "No code provided in the URL"}, status=400)
+        else:
+            self.send_text("Not found", status=404)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        url = urlsplit(self.path)
+        start = time.perf_counter()
+        if not self.before_route(self.route(url.path)):
+            return
+        if url.path == "/play":
+            fake.plays.append(json.loads(body or b"{}"))
+            duration = time.perf_counter() - start
+            self.send_json({"status": "success"},
+                           headers={"Server-Timing": f"shuffle;dur=0, start_playback;dur={duration * 1000:.3f}"})
+        else:
+            self.send_text("Not found", status=404)
+
+    def send_json(self, data, status=200, headers: dict | None = None):
+        self.send_body(json.dumps(data).encode(), "application/json", status, headers)
+
+    def send_text(self, text, status=200):
+        self.send_body(text.encode(), "text/html; charset=utf-8", status)
+
+    def send_body(self, body: bytes, content_type: str, status: int, headers: dict | None = None):
+        # recorded before answering, so clients see their request counted once they got the answer
+        self.server.fake.record(self.current_route, status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.fake.verbose:
+            super().log_message(format, *args)
+
+
+class FakeMusicDaemonServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # bursts of concurrent connections must not overflow the listen backlog
+    request_queue_size = 128
+
+    def __init__(self, address, fake: "FakeMusicDaemon"):
+        super().__init__(address, FakeMusicDaemonHandler)
+        self.fake = fake
+
+
+class FakeMusicDaemon:
+    """
+    A local stand-in for the spotipy daemon that serves the same routes without Spotify credentials.
+
+    Usable as a context manager running the server in a background thread:
+
+        with FakeMusicDaemon() as daemon:
+            requests.get(daemon.url + "/devices")
+
+    Latencies, injected errors and rate limits are drawn from a generator seeded with `seed`, so a load test can be
+    repeated with the same delays and failures as long as the requests arrive in the same order.
+
+    Attributes:
+        logged_in (bool): Whether /isLoggedIn reports a logged in user.
+        search_limit (int): The number of albums returned by /search_album.
+        latency (float | Latency): Seconds every request is delayed before it is answered, or their distribution.
+        route_latency (dict[str, float | Latency]): Latencies overriding `latency` per route, e.g. "play" or
+            "search_album".
+        error_rate (float): The share of requests answered with `error_status` instead.
+        error_status (int): The status of injected errors.
+        rate_limit (float): The number of requests per second answered before further requests are answered with
+            429, unlimited if 0. Bursts of up to one second of requests are allowed.
+        retry_after (int): The seconds sent in the Retry-After header of 429 responses.
+        catalog (Catalog): The catalog searched, if None searches return albums made up from the query.
+        plays (list[dict]): The payloads received by /play, in order.
+        requests (Counter): The number of answered requests by route and status.
+        connections (int): The number of connections accepted so far.
+        verbose (bool): Whether requests are logged to stderr.
+    """
+    def __init__(self, host="127.0.0.1", port=0, verbose=False, seed: int = 0):
+        self.logged_in = True
+        self.search_limit = 50
+        self.latency: float | Latency = 0.0
+        self.route_latency: dict[str, float | Latency] = {}
+        self.error_rate = 0.0
+        self.error_status = 500
+        self.rate_limit = 0.0
+        self.retry_after = 1
+        self.catalog: Catalog | None = None
+        self.plays: list[dict] = []
+        self.requests: Counter[tuple[str, int]] = Counter()
+        self.connections = 0
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        # the bucket of the rate limit starts full
+        self._tokens: float | None = None
+        self._tokens_at = time.monotonic()
+        self.server = FakeMusicDaemonServer((host, port), self)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _take_token(self) -> bool:
+        """Take a token from the bucket of the rate limit, the lock has to be held."""
+        now = time.monotonic()
+        capacity = max(self.rate_limit, 1)
+        tokens = capacity if self._tokens is None else self._tokens + (now - self._tokens_at) * self.rate_limit
+        self._tokens = min(tokens, capacity)
+        self._tokens_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def before_request(self, route: str) -> tuple[int | None, float]:
+        """
+        Decide how a request is answered.
+
+        :param route: The name of the route, see `FakeMusicDaemonHandler.route`.
+        :return: The status of the error to answer with, None to answer normally, and the seconds to wait before.
+        """
+        latency = self.route_latency.get(route, self.latency)
+        with self._lock:
+            delay = latency.sample(self._rng) if isinstance(latency, Latency) else latency
+            if self.rate_limit and not self._take_token():
+                return 429, delay
+            if self.error_rate and self._rng.random() < self.error_rate:
+                return self.error_status, delay
+        return None, delay
+
+    def record(self, route: str, status: int):
+        with self._lock:
+            self.requests[route, status] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def route_latency(spec: str) -> tuple[str, Latency]:
+    route, _, latency = spec.partition("=")
+    return route, Latency(latency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake music daemon for offline development and testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=Latency, default=Latency("0"),
+                        help="The delay of every request in seconds, or its distribution, e.g. 0.1, "
+                             "uniform:0.05,0.2, normal:0.1,0.02, lognormal:0.1,0.5 or exponential:0.1.")
+    parser.add_argument("--route-latency", type=route_latency, action="append", default=[],
+                        help="The delay of the requests of a route, e.g. play=lognormal:0.2,0.3. Repeatable.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="The share of requests failing.")
+    parser.add_argument("--error-status", type=int, default=500, help="The status of failing requests.")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Requests per second answered before answering with 429, unlimited if 0.")
+    parser.add_argument("--catalog-size", type=int, default=0,
+                        help="The number of albums of a synthetic catalog searched instead of making up results.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the catalog, latencies and errors.")
+    args = parser.parse_args()
+
+    fake = FakeMusicDaemon(args.host, args.port, verbose=True, seed=args.seed)
+    fake.latency = args.latency
+    fake.route_latency = dict(args.route_latency)
+    fake.error_rate = args.error_rate
+    fake.error_status = args.error_status
+    fake.rate_limit = args.rate_limit
+    if args.catalog_size:
+        fake.catalog = Catalog(args.catalog_size, args.seed)
+    print(f"Serving fake music daemon on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        print("Gracefully shutting down...")
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
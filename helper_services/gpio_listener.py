@@ -1,22 +1,55 @@
 # GPIO-Bibliothek laden
 import json
+import secrets
+import signal
 import threading
-from time import sleep, time
+from collections import deque
+from contextlib import ExitStack
+from time import time
 import os
 
-import lgpio
-from gpiozero.pins.lgpio import LGPIOPin, LGPIOHardwareSPI, LGPIOHardwareSPIShared
 from gpiozero.pins.local import LocalPiFactory
 
-from signal_handler import SignalHandler
+from helper_services.signal_handler import SignalHandler
 # import RPi.GPIO as GPIO
 from gpiozero import Button
 import requests
 
 # Fetching the GPIO pin configuration and endpoint from environment variables
-PIN_STR = os.getenv("GPIO_CONFIGURATION")  # e.g., "4, 5, 6, 7, 8, 9, 11, 12"
-PINS = [int(s.strip()) for s in PIN_STR.split(",")]
+PIN_STR = os.getenv("GPIO_CONFIGURATION", default="")  # e.g., "4, 5, 6, 7, 8, 9, 11, 12"
+PINS = [int(s.strip()) for s in PIN_STR.split(",") if s.strip()]
 ENDPOINT = os.getenv("BUTTON_ENDPOINT")  # e.g., "http://192.168.2.107:80/handle_button/"
+# Websocket of the button ingress, presses are sent there first and to ENDPOINT if it is unavailable
+WS_ENDPOINT = os.getenv("BUTTON_WS_ENDPOINT")  # e.g., "ws://VWC:8000/ws/buttons/"
+# Time after the first key of a chord went down in which further keys are added to it, in seconds. Bounds the latency
+# from pressing a key to sending it.
+CHORD_WINDOW = float(os.getenv("GPIO_CHORD_WINDOW", default=0.02))
+# Time after all keys were released in which edges are ignored as bouncing, in seconds
+BOUNCE_TIME = float(os.getenv("GPIO_BOUNCE_TIME", default=0.005))
+# Presses waiting to be sent, the oldest are dropped beyond that
+SEND_QUEUE_SIZE = int(os.getenv("GPIO_SEND_QUEUE_SIZE", default=32))
+# File keeping the presses waiting to be sent across restarts of the listener, e.g. "/app/spool/presses.json"
+SPOOL_PATH = os.getenv("GPIO_SPOOL_PATH")
+# Presses of the same key following each other closer than this are sent once, in seconds
+COALESCE_WINDOW = float(os.getenv("GPIO_COALESCE_WINDOW", default=0.5))
+# Presses that could not be sent for that long are dropped instead of starting music unexpectedly, in seconds
+MAX_PRESS_AGE = float(os.getenv("GPIO_MAX_PRESS_AGE", default=60))
+# Delays between the attempts to send a press, doubled after every failed attempt, in seconds
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 5
+# (connect, read) timeouts of sending a press, in seconds. Reading waits longer than Django waits for the music daemon to
+# start playing, so a slow press is not sent again while it is still handled.
+REQUEST_TIMEOUT = (3, 20)
+# Time after the websocket failed in which presses are sent to the HTTP endpoint without trying it, in seconds
+WS_RETRY_INTERVAL = 10
+# Headers carrying the trace id of a press and the time it waited in the queue, see configurator.tracing
+TRACE_HEADER = "X-Trace-Id"
+TRACE_QUEUED_HEADER = "X-Trace-Queued"
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(8)
+
 
 class LGPIOFactory(LocalPiFactory):
     """
@@ -45,9 +78,14 @@ class LGPIOFactory(LocalPiFactory):
     .. _lgpio: http://abyz.me.uk/lg/py_lgpio.html
     """
     def __init__(self, chip=0):
+        # lgpio is only available where GPIO chips are, it is not needed with the mock pin factory of the tests
+        import lgpio
+        from gpiozero.pins.lgpio import LGPIOPin
+
         super().__init__()
         if chip is None:
             chip = 4 if (self._get_revision() & 0xff0) >> 4 == 0x17 else 0
+        self._lgpio = lgpio
         self._handle = lgpio.gpiochip_open(chip)
         self._chip = chip
         self.pin_class = LGPIOPin
@@ -55,7 +93,7 @@ class LGPIOFactory(LocalPiFactory):
     def close(self):
         super().close()
         if self._handle is not None:
-            lgpio.gpiochip_close(self._handle)
+            self._lgpio.gpiochip_close(self._handle)
             self._handle = None
 
     @property
@@ -65,60 +103,322 @@ class LGPIOFactory(LocalPiFactory):
     def _get_spi_class(self, shared, hardware):
         # support via lgpio instead of spidev
         if hardware:
+            from gpiozero.pins.lgpio import LGPIOHardwareSPI, LGPIOHardwareSPIShared
             return [LGPIOHardwareSPI, LGPIOHardwareSPIShared][shared]
         return super()._get_spi_class(shared, hardware=False)
 
-pf = LGPIOFactory(chip=0)
 
-# Initialize Button objects for each GPIO pin
-buttons = [Button(pin, pin_factory=pf) for pin in PINS]
+class PressSender:
+    """
+    Sends the pressed keys to the endpoint from a single thread, reusing one HTTPS connection.
 
+    Presses are queued, so a slow or restarting server neither blocks the GPIO listener nor loses them. Failed
+    attempts are retried with exponential backoff until the press is older than `max_age`. Only server errors and
+    unreachable servers are retried, other responses finish a press.
 
-def make_request(key):
-    """Send a POST request with the key of the button pressed."""
-    data = {'key': key}
-    data_json = json.dumps(data)
-    print(time(), "SENDING", key)
-    try:
-        r = requests.post(ENDPOINT,
-                          data=data_json,
-                          headers={'Content-Type': 'application/json'},
-                          verify=False
-                          )
-    except Exception as e:
-        print(time(), "Exception while sending request", e)
-    else:
+    With a spool path, the queue is written to that file whenever it changes and read when the sender is created.
+
+    With a websocket endpoint, presses are sent over a persistent websocket to `ButtonConsumer`, avoiding TLS, nginx
+    and the middleware of Django. The HTTP endpoint is used while the websocket can not be reached.
+
+    Every press gets a trace id that is sent along with it and the time it waited in the queue, so Django and the
+    music daemon can record the stages of the press under the same trace.
+    """
+    def __init__(self, endpoint: str, queue_size: int = SEND_QUEUE_SIZE, spool_path: str | None = SPOOL_PATH,
+                 coalesce_window: float = COALESCE_WINDOW, max_age: float = MAX_PRESS_AGE,
+                 session: requests.Session | None = None, ws_endpoint: str | None = WS_ENDPOINT):
+        self.endpoint = endpoint
+        self.ws_endpoint = ws_endpoint
+        self._ws = None
+        self._ws_stack = None
+        self._ws_retry_at = 0.0
+        self._message_id = 0
+        self.queue_size = queue_size
+        self.spool_path = spool_path
+        self.coalesce_window = coalesce_window
+        self.max_age = max_age
+        self.session = session or requests.Session()
+        self.session.verify = False
+        self._pending: deque[tuple[int, float, str]] = deque(self._load_spool(), maxlen=queue_size)
+        self._last_press = (None, 0.0)
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_spool(self) -> list[tuple[int, float, str]]:
+        if self.spool_path is None or not os.path.exists(self.spool_path):
+            return []
+        try:
+            with open(self.spool_path) as f:
+                # spools written before presses were traced lack the trace id
+                return [(int(key), float(pressed_at), str(trace_id[0]) if trace_id else new_trace_id())
+                        for key, pressed_at, *trace_id in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            print(time(), "Ignoring unreadable spool", self.spool_path, e)
+            return []
+
+    def _write_spool(self):
+        """Write the queue to the spool, the condition has to be held."""
+        if self.spool_path is None:
+            return
+        tmp_path = f"{self.spool_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(list(self._pending), f)
+            os.replace(tmp_path, self.spool_path)
+        except OSError as e:
+            print(time(), "Could not write spool", self.spool_path, e)
+
+    def submit(self, key: int) -> bool:
+        """
+        Queue a press to be sent.
+
+        :param key: The bitmask of the pressed keys.
+        :return: Whether the press was queued, False if it repeats the previous press within the coalescing window.
+        """
+        now = time()
+        with self._condition:
+            last_key, last_at = self._last_press
+            self._last_press = (key, now)
+            if key == last_key and now - last_at < self.coalesce_window:
+                return False
+            if len(self._pending) == self.queue_size:
+                print(time(), "Queue full, dropping", self._pending[0][0])
+            self._pending.append((key, now, new_trace_id()))
+            self._write_spool()
+            self._condition.notify()
+        return True
+
+    def _send(self, key: int, trace_id: str | None = None, queued: float = 0.0) -> bool:
+        """
+        :param key: The bitmask of the pressed keys.
+        :param trace_id: The trace of the press.
+        :param queued: The seconds the press waited in the queue.
+        :return: Whether the press is done, False if it should be retried.
+        """
+        if self.ws_endpoint is not None and time() >= self._ws_retry_at:
+            # only needed with a websocket endpoint
+            from websockets.exceptions import WebSocketException
+            try:
+                self._send_ws(key, trace_id, queued)
+            except (OSError, ValueError, WebSocketException) as e:
+                print(time(), "Websocket unavailable, falling back to HTTP", e)
+                self._close_ws()
+                self._ws_retry_at = time() + WS_RETRY_INTERVAL
+            else:
+                try:
+                    status = self._receive_ws()
+                except (OSError, ValueError, WebSocketException) as e:
+                    # the press arrived and may still be handled, so it is not sent over HTTP right away but retried
+                    # later with the same trace id, which Django answers without handling the press again
+                    print(time(), "No answer via websocket", key, e)
+                    self._close_ws()
+                    return False
+                print(time(), "SENT", key, status)
+                return status < 500 and status != 429
+        return self._send_http(key, trace_id, queued)
+
+    def _send_ws(self, key: int, trace_id: str | None = None, queued: float = 0.0):
+        """
+        Send a press over the websocket, connecting it first if necessary. The answer is read by `_receive_ws`.
+        """
+        if self._ws is None:
+            from websockets.sync.client import connect
+            # the connection is kept open across presses, the exit stack closes it in `_close_ws`
+            self._ws_stack = ExitStack()
+            self._ws = self._ws_stack.enter_context(connect(self.ws_endpoint, open_timeout=REQUEST_TIMEOUT[0]))
+        self._message_id += 1
+        print(time(), "SENDING", key, "via websocket", trace_id)
+        self._ws.send(json.dumps({"id": self._message_id, "key": key, "trace_id": trace_id, "queued": queued}))
+
+    def _receive_ws(self) -> int:
+        """
+        :return: The status of handling the press sent last.
+        """
+        while True:
+            answer = json.loads(self._ws.recv(timeout=REQUEST_TIMEOUT[1]))
+            # answers of presses that timed out before may still arrive
+            if answer.get("id") == self._message_id:
+                return answer.get("status", 500)
+
+    def _close_ws(self):
+        if self._ws is not None:
+            self._ws_stack.close()
+            self._ws = None
+
+    def _send_http(self, key: int, trace_id: str | None = None, queued: float = 0.0) -> bool:
+        print(time(), "SENDING", key, trace_id)
+        headers = {'Content-Type': 'application/json', TRACE_QUEUED_HEADER: f"{queued:.6f}"}
+        if trace_id is not None:
+            headers[TRACE_HEADER] = trace_id
+        try:
+            r = self.session.post(self.endpoint, data=json.dumps({'key': key}), headers=headers,
+                                  timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            print(time(), "Exception while sending request", e)
+            return False
         print(time(), "SENT", key, r.status_code)
+        return r.status_code < 500 and r.status_code != 429
+
+    def _run(self):
+        delay = RETRY_BASE_DELAY
+        while not self._stop.is_set():
+            with self._condition:
+                while not self._pending and not self._stop.is_set():
+                    self._condition.wait()
+                if self._stop.is_set():
+                    return
+                press = self._pending[0]
+            key, pressed_at, trace_id = press
+
+            if time() - pressed_at > self.max_age:
+                print(time(), "Dropping outdated press", key, trace_id)
+            elif not self._send(key, trace_id, time() - pressed_at):
+                self._stop.wait(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+                continue
+            delay = RETRY_BASE_DELAY
+            with self._condition:
+                # the press may have been dropped from a full queue in the meantime
+                if self._pending and self._pending[0] is press:
+                    self._pending.popleft()
+                    self._write_spool()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="press-sender", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sending, presses still queued remain in the spool."""
+        self._stop.set()
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._close_ws()
+        self.session.close()
+
+
+def create_pin_factory():
+    """
+    Create the pin factory selected by GPIOZERO_PIN_FACTORY, lgpio on gpiochip 0 by default.
+
+    :return: The pin factory, None to let gpiozero create the selected one, e.g. "mock" to run without GPIO pins.
+    """
+    if os.getenv("GPIOZERO_PIN_FACTORY", default="lgpio") != "lgpio":
+        return None
+    return LGPIOFactory(chip=0)
+
+
+class ChordListener:
+    """
+    Forms the bitmask of the keys pressed together from the edges of the buttons, without polling the pins.
+
+    The first key going down opens a chord, every key going down within `chord_window` is added to it. When the
+    window closes, the chord is passed to `on_chord` once. Keys pressed afterwards are ignored until all keys are
+    released, so holding a key sends it only once. Releasing keys may bounce for `bounce_time`, edges in that time
+    do not open a new chord.
+
+    The edge callbacks of gpiozero only record the keys and wake a worker thread, which sleeps while no key changes.
+
+    The receiver of the wall drives a pin high while its key is pressed, which the pulled up buttons report as
+    released. Key i is therefore down while buttons[i].value is 0 and adds 2 ** i to the chord.
+    """
+    def __init__(self, buttons: list[Button], on_chord, chord_window: float = CHORD_WINDOW,
+                 bounce_time: float = BOUNCE_TIME):
+        """
+        :param buttons: The buttons, the index of a button is the bit of its key in the chord.
+        :param on_chord: Called with the bitmask of every chord, in the thread of the listener.
+        :param chord_window: The time in seconds in which keys are collected into a chord.
+        :param bounce_time: The time in seconds after releasing all keys in which edges are ignored.
+        """
+        self.buttons = buttons
+        self.on_chord = on_chord
+        self.chord_window = chord_window
+        self.bounce_time = bounce_time
+        self._bits = {button: 2 ** i for i, button in enumerate(buttons)}
+        self._lock = threading.Lock()
+        self._down = 0
+        self._edge = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        for button in buttons:
+            button.when_released = self._key_down
+            button.when_pressed = self._key_up
+
+    def _key_down(self, button):
+        with self._lock:
+            self._down |= self._bits[button]
+        self._edge.set()
+
+    def _key_up(self, button):
+        self._edge.set()
+
+    def held(self) -> int:
+        """
+        :return: The bitmask of the keys currently held down.
+        """
+        return sum(bit for button, bit in self._bits.items() if not button.value)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._edge.wait()
+            if self._stop.wait(self.chord_window):
+                break
+            with self._lock:
+                chord = self._down | self.held()
+                self._down = 0
+            if chord:
+                print(time(), "registered", chord)
+                self.on_chord(chord)
+
+            # a held chord is sent once, wait for every key to be released
+            while True:
+                self._edge.clear()
+                if not self.held() or self._stop.is_set():
+                    break
+                self._edge.wait()
+            if self._stop.wait(self.bounce_time):
+                break
+            with self._lock:
+                self._down = 0
+                self._edge.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="chord-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._edge.set()
+        if self._thread is not None:
+            self._thread.join()
 
 
 def monitor_pins():
-    """Monitor the GPIO pins for button presses."""
+    """Monitor the GPIO pins for button presses, sending every chord of keys to the endpoint."""
     signal_handler = SignalHandler()
-    registered = False
-    former_t = 0
-
-    while signal_handler.can_run():
-        t = 0
-        for i, button in enumerate(buttons):
-            if not button.value:
-                t += 2 ** i
-        # print([b.pin for b in buttons if not b.value])
-        if t > 0:
-            if former_t == t and not registered:
-                print(time(), "registered", t)
-                thread = threading.Thread(target=make_request, args=(t,))
-                thread.start()
-                registered = True
-        else:
-            registered = False
-            sleep(0.01)
-
-        former_t = t
+    pin_factory = create_pin_factory()
+    buttons = [Button(pin, pin_factory=pin_factory, bounce_time=BOUNCE_TIME or None) for pin in PINS]
+    sender = PressSender(ENDPOINT)
+    sender.start()
+    listener = ChordListener(buttons, sender.submit)
+    listener.start()
+    print("Initialized Button Listeners")
+    try:
+        while signal_handler.can_run():
+            signal.pause()
+    finally:
+        listener.stop()
+        sender.stop()
+        for button in buttons:
+            button.close()
+        if pin_factory is not None:
+            pin_factory.close()
 
 
 def main():
     try:
-        print("Initialized Button Listeners")
         monitor_pins()
     except KeyboardInterrupt:
         print("Gracefully shutting down...")
@@ -0,0 +1,344 @@
+import bisect
+import contextlib
+import copy
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Iterable
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def state(self):
+        with self._lock:
+            return self.value
+
+    def merge(self, state):
+        self.inc(state)
+
+
+class _Gauge(_Counter):
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def state(self):
+        with self._lock:
+            return [list(self.counts), self.sum]
+
+    def merge(self, state):
+        counts, total = state
+        if len(counts) != len(self.counts):
+            # written with other buckets, e.g. by a process running an older version
+            return
+        with self._lock:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.sum += total
+
+    @contextlib.contextmanager
+    def time(self):
+        """Observe the duration of the enclosed block in seconds, also if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Metric:
+    """
+    A metric with a value per combination of label values, e.g. one counter per view and status.
+
+    The values are created on first use by `labels` and kept for the lifetime of the process, so the label values must
+    come from a small set, e.g. route names and not paths.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        :param values: The values of the labels, in the order of `labelnames`.
+        :return: The value of the metric for these labels, e.g. a counter with `inc`.
+        """
+        key = tuple(str(value) for value in values)
+        value = self._values.get(key)
+        if value is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {key}")
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def _samples(self, value) -> Iterable[tuple[str, dict[str, str], float]]:
+        yield self.name, {}, value.value
+
+    def snapshot(self) -> list:
+        """
+        :return: The JSON serializable state of the values of all labels, see `merge`.
+        """
+        with self._lock:
+            values = list(self._values.items())
+        return [[list(key), value.state()] for key, value in values]
+
+    def merge(self, snapshot: list):
+        """
+        Add the values of a snapshot, e.g. one taken by another process, to the values of this metric.
+        """
+        for key, state in snapshot:
+            self.labels(*key).merge(state)
+
+    def empty_copy(self) -> "Metric":
+        metric = copy.copy(self)
+        metric._lock = threading.Lock()
+        metric._values = {}
+        return metric
+
+    def render(self, const_labels: dict[str, str]) -> list[str]:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in sorted(values):
+            labels = {**const_labels, **dict(zip(self.labelnames, key))}
+            for name, extra_labels, sample in self._samples(value):
+                lines.append(f"{name}{_format_labels({**labels, **extra_labels})} {_format_value(sample)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return _Counter()
+
+    def _samples(self, value):
+        yield self.name + "_total", {}, value.value
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_value(self):
+        return _Gauge()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _Histogram(self.buckets)
+
+    def _samples(self, value):
+        with value._lock:
+            counts = list(value.counts)
+            total = value.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield self.name + "_bucket", {"le": _format_value(bound)}, cumulative
+        yield self.name + "_sum", {}, total
+        yield self.name + "_count", {}, cumulative
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class Registry:
+    """
+    Metrics of a process, rendered in the Prometheus text format.
+
+    Updating a metric costs a dictionary lookup and a lock, so the metrics can stay enabled on a Raspberry Pi.
+
+    Attributes:
+        const_labels (dict[str, str]): Labels added to every sample, e.g. the pid of a worker process.
+    """
+    def __init__(self, const_labels: dict[str, str] | None = None):
+        self.const_labels = const_labels or {}
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """
+        :param name: The name of the counter without the "_total" suffix.
+        """
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, list]:
+        """
+        :return: The JSON serializable state of all metrics by name.
+        """
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def merged(self, snapshots: Iterable[dict[str, list]]) -> "Registry":
+        """
+        :param snapshots: Snapshots of registries with the same metrics as this one, e.g. taken by several processes.
+        :return: A registry with the metrics of this one, holding the sums of the snapshots.
+        """
+        snapshots = list(snapshots)
+        registry = Registry(dict(self.const_labels))
+        for metric in self._metrics:
+            merged = registry.register(metric.empty_copy())
+            for snapshot in snapshots:
+                merged.merge(snapshot.get(metric.name, []))
+        return registry
+
+
+class SharedMetrics:
+    """
+    Metrics of a registry summed over several processes, e.g. gunicorn workers, which share a directory.
+
+    Every process writes snapshots of its registry to its own file in `directory`, periodically and before rendering.
+    Whichever process answers a scrape renders the sums over all files, so the metrics of the other processes are at
+    most `interval` seconds old. Files are replaced atomically like the shared results of the search cache. Files of
+    exited processes are kept, so the counters do not go backwards when a worker is replaced.
+
+    Attributes:
+        registry (Registry): The metrics of the current process.
+        directory (str): The directory the snapshots are shared in.
+        interval (float): The seconds between two snapshots of a process.
+    """
+    def __init__(self, registry: Registry, directory: str | None = None, interval: float = 5):
+        self.registry = registry
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "vwc_metrics")
+        os.makedirs(self.directory, exist_ok=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._writer_pid = None
+
+    def start(self):
+        """
+        Start writing snapshots in the background, unless this process already does. Cheap enough to be called on
+        every request, which also covers processes forked after the registry was created.
+        """
+        pid = os.getpid()
+        if self._writer_pid == pid:
+            return
+        with self._lock:
+            if self._writer_pid != pid:
+                self._writer_pid = pid
+                threading.Thread(target=self._write_periodically, daemon=True, name="metrics-writer").start()
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError as e:
+                print(time.time(), "Could not write metrics to", self.directory, e)
+
+    def write(self):
+        """
+        Write a snapshot of the metrics of this process.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, os.path.join(self.directory, f"{os.getpid()}.json"))
+
+    def render(self) -> str:
+        """
+        :return: The metrics summed over all processes in the Prometheus text format.
+        """
+        self.write()
+        snapshots = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    with open(entry.path) as f:
+                        snapshots.append(json.load(f))
+                except (FileNotFoundError, ValueError):
+                    pass
+        return self.registry.merged(snapshots).render()
@@ -0,0 +1,154 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class SearchCache:
+    """
+    Bounded LRU cache with TTL for search results, coalescing identical concurrent searches.
+
+    Within a process, concurrent lookups of the same key wait for the first one to fetch the result. Across
+    processes (e.g. gunicorn workers) fetched results are shared through files in `shared_dir`, guarded by an
+    exclusive file lock per key, so only one worker asks Spotify while the others wait and read its result.
+
+    Attributes:
+        maxsize (int): The maximum number of results kept in memory.
+        ttl (float): The number of seconds a result stays valid.
+        shared_dir (str): The directory results are shared between processes in.
+        hits (int): Lookups answered from memory.
+        shared_hits (int): Lookups answered from a result another process fetched.
+        misses (int): Lookups that had to fetch the result.
+        on_lookup (Callable[[str], None]): Called with the outcome of every lookup, "hits", "shared_hits" or "misses".
+    """
+    def __init__(self, maxsize: int = 256, ttl: float = 300, shared_dir: str | None = None,
+                 on_lookup: Callable[[str], None] | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_dir = shared_dir or os.path.join(tempfile.gettempdir(), "vwc_search_cache")
+        os.makedirs(self.shared_dir, exist_ok=True)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.on_lookup = on_lookup
+        self._entries: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: dict[Hashable, threading.Lock] = {}
+        self._pruned_at = time.time()
+
+    @staticmethod
+    def make_key(query: str, search_type: str, limit: int) -> tuple[str, str, int]:
+        return " ".join(query.lower().split()), search_type, limit
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pid": os.getpid(), "size": len(self._entries), "maxsize": self.maxsize, "ttl": self.ttl,
+                    "hits": self.hits, "shared_hits": self.shared_hits, "misses": self.misses}
+
+    def _count(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        if self.on_lookup is not None:
+            self.on_lookup(outcome)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, expires_at: float, value):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _shared_path(self, key) -> str:
+        return os.path.join(self.shared_dir, hashlib.sha256(json.dumps(key).encode()).hexdigest())
+
+    def _read_shared(self, path: str):
+        try:
+            with open(path + ".json") as f:
+                expires_at, value = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if expires_at < time.time():
+            return None
+        return expires_at, value
+
+    def _write_shared(self, path: str, expires_at: float, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.shared_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump([expires_at, value], f)
+        os.replace(tmp_path, path + ".json")
+
+    def _prune_shared(self):
+        """
+        Remove shared results (and their lock files) that expired, at most once per TTL.
+        """
+        now = time.time()
+        if self._pruned_at + self.ttl > now:
+            return
+        self._pruned_at = now
+        for entry in os.scandir(self.shared_dir):
+            try:
+                if entry.stat().st_mtime + self.ttl < now:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def get_or_fetch(self, query: str, search_type: str, limit: int, fetch: Callable[[], object]):
+        """
+        Return the cached result of a search, fetching it if it is not cached or expired.
+
+        :param query: The search query, normalized to lower case with collapsed whitespace.
+        :param search_type: The type of the searched items, e.g. "album".
+        :param limit: The maximum number of results of the search.
+        :param fetch: Callable performing the search, its result has to be JSON serializable.
+        :return: The search result.
+        """
+        key = self.make_key(query, search_type, limit)
+        if (entry := self._get_local(key)) is not None:
+            self._count("hits")
+            return entry[1]
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                if (entry := self._get_local(key)) is not None:
+                    self._count("hits")
+                    return entry[1]
+
+                path = self._shared_path(key)
+                with open(path + ".lock", "w") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        if (entry := self._read_shared(path)) is not None:
+                            self._count("shared_hits")
+                        else:
+                            value = fetch()
+                            entry = (time.time() + self.ttl, value)
+                            self._write_shared(path, *entry)
+                            self._count("misses")
+                            self._prune_shared()
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._set_local(key, *entry)
+                return entry[1]
+        finally:
+            # Also when the fetch failed, so failing queries do not pile up locks
+            with self._lock:
+                self._key_locks.pop(key, None)
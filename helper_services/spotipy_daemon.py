@@ -1,16 +1,44 @@
 import datetime
 import os
+import re
+import threading
+import time
 from pprint import pprint
 
 import spotipy
-from spotipy import SpotifyOAuth, CacheFileHandler
-from flask import Flask, jsonify, Response, redirect, request
+from spotipy import SpotifyOAuth, CacheFileHandler, SpotifyException
+from flask import Flask, jsonify, Response, redirect, request, g
+
+from helper_services import metrics
+from helper_services.search_cache import SearchCache
 
 # from VinylWallConfig.settings import MUSIC_DAEMON_PORT
 MUSIC_DAEMON_PORT = os.getenv("MUSIC_DAEMON_PORT")
 
 app = Flask(__name__)
 
+# Metrics of the worker process, summed over all workers by `get_metrics`
+metrics_registry = metrics.Registry()
+shared_metrics = metrics.SharedMetrics(metrics_registry, os.getenv("METRICS_DIR"))
+REQUESTS = metrics_registry.counter("spotipy_daemon_http_requests", "HTTP requests handled by the daemon",
+                                    ("route", "method", "status"))
+REQUEST_DURATION = metrics_registry.histogram("spotipy_daemon_http_request_duration_seconds",
+                                              "Duration of the HTTP requests", ("route",))
+SPOTIFY_CALLS = metrics_registry.counter("spotipy_daemon_spotify_calls",
+                                         "Calls of the Spotify API, status is error if it was unreachable",
+                                         ("endpoint", "status"))
+SPOTIFY_CALL_DURATION = metrics_registry.histogram("spotipy_daemon_spotify_call_duration_seconds",
+                                                   "Duration of the calls of the Spotify API", ("endpoint",))
+SEARCH_CACHE_LOOKUPS = metrics_registry.counter("spotipy_daemon_search_cache_lookups",
+                                                "Lookups of the search cache by outcome", ("outcome",))
+# Spotify ids in the paths of the API, replaced to keep the number of endpoint labels small
+SPOTIFY_ID = re.compile(r"(?<=/)[0-9A-Za-z]{22}(?=/|$)")
+
+search_cache = SearchCache(maxsize=int(os.getenv("SEARCH_CACHE_SIZE", 256)),
+                           ttl=float(os.getenv("SEARCH_CACHE_TTL", 300)),
+                           shared_dir=os.getenv("SEARCH_CACHE_DIR"),
+                           on_lookup=lambda outcome: SEARCH_CACHE_LOOKUPS.labels(outcome).inc())
+
 SCOPE = "playlist-read-private playlist-read-collaborative user-read-playback-state streaming app-remote-control user-modify-playback-state"
 
 
@@ -18,19 +46,134 @@ SCOPE = "playlist-read-private playlist-read-collaborative user-read-playback-st
 # playlist-read-collaborative
 # user-read-playback-state
 
+class MemoryCacheFileHandler(CacheFileHandler):
+    """
+    Token cache keeping the token in memory.
+
+    The cache file is only read again if it was modified since it was last read, e.g. because another worker
+    refreshed the token.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._token_info = None
+        self._mtime = None
+
+    def _cache_mtime(self):
+        try:
+            return os.stat(self.cache_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get_cached_token(self):
+        mtime = self._cache_mtime()
+        with self._lock:
+            if self._token_info is None or mtime != self._mtime:
+                self._token_info = super().get_cached_token()
+                self._mtime = mtime
+            return self._token_info
+
+    def save_token_to_cache(self, token_info):
+        with self._lock:
+            super().save_token_to_cache(token_info)
+            self._token_info = token_info
+            self._mtime = self._cache_mtime()
+
+
+class InstrumentedSpotify(spotipy.Spotify):
+    """
+    Spotify client counting the calls of the API per endpoint and status.
+    """
+    def _internal_call(self, method, url, payload, params):
+        endpoint = method + " " + SPOTIFY_ID.sub(":id", url.split("?")[0].removeprefix(self.prefix))
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = super()._internal_call(method, url, payload, params)
+            status = 200
+            return result
+        except SpotifyException as e:
+            status = e.http_status
+            raise
+        finally:
+            SPOTIFY_CALLS.labels(endpoint, status).inc()
+            SPOTIFY_CALL_DURATION.labels(endpoint).observe(time.perf_counter() - start)
+
+
+_client_lock = threading.Lock()
+_auth_manager: SpotifyOAuth | None = None
+_spotify: spotipy.Spotify | None = None
+
+
 def get_auth_manager() -> SpotifyOAuth:
     """
-    Return the authentication manager for Spotify.
+    Return the authentication manager for Spotify, shared by all requests of this worker process.
 
     :return: SpotifyOAuth authentication manager object.
     :rtype: SpotifyOAuth
     """
-    return SpotifyOAuth(scope=SCOPE, open_browser=False, cache_handler=CacheFileHandler())
+    global _auth_manager
+    with _client_lock:
+        if _auth_manager is None:
+            _auth_manager = SpotifyOAuth(scope=SCOPE, open_browser=False, cache_handler=MemoryCacheFileHandler())
+        return _auth_manager
+
+
+def get_spotify() -> spotipy.Spotify:
+    """
+    Return the Spotify client of this worker process, reusing its HTTP connection pool across requests.
+
+    :return: Spotify client object.
+    :rtype: spotipy.Spotify
+    """
+    global _spotify
+    auth_manager = get_auth_manager()
+    with _client_lock:
+        if _spotify is None:
+            _spotify = InstrumentedSpotify(auth_manager=auth_manager)
+        return _spotify
+
+
+def search_items(query: str, search_type: str, limit: int) -> list:
+    """
+    Search Spotify for items of a single type.
+
+    :param query: The search query.
+    :param search_type: The type of the items, e.g. "album" or "playlist".
+    :param limit: The maximum number of items.
+    :return: The list of found items.
+    """
+    res = get_spotify().search(q=query, limit=limit, type=search_type)
+    return res.get(search_type + "s", dict()).get("items", [])
+
+
+@app.before_request
+def start_request_timer():
+    shared_metrics.start()
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response: Response) -> Response:
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUESTS.labels(route, request.method, response.status_code).inc()
+    REQUEST_DURATION.labels(route).observe(time.perf_counter() - g.request_start)
+    return response
+
+
+@app.get("/metrics")
+def get_metrics() -> Response:
+    """
+    Get the metrics of all gunicorn workers in the Prometheus text format, see `metrics.SharedMetrics`.
+
+    :return: The metrics as plain text.
+    """
+    return Response(shared_metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/isLoggedIn")
 def is_logged_in() -> Response:
-    sp = spotipy.Spotify(auth_manager=get_auth_manager())
+    sp = get_spotify()
     try:
         me = sp.me()
         return jsonify(me)
@@ -58,7 +201,7 @@ def get_devices():
 
     :return: A list of dictionaries representing the devices.
     """
-    sp = spotipy.Spotify(auth_manager=get_auth_manager())
+    sp = get_spotify()
     return jsonify(sp.devices()["devices"])
 
 
@@ -70,16 +213,24 @@ def get_album(query):
     :param query: The search query.
     :return: A JSON response containing the album search results.
     """
-    print(f"Est AUTH: {datetime.datetime.now()}")
-    sp = spotipy.Spotify(auth_manager=get_auth_manager())
     print(f"Searching: {datetime.datetime.now()}")
-    res = sp.search(q=query, limit=50, type=",".join(["album"]))
+    items = search_cache.get_or_fetch(query, "album", 50, lambda: search_items(query, "album", 50))
 
-    js_result = jsonify(res.get("albums", dict()).get("items", dict()))
+    js_result = jsonify(items)
     print(f"Outgoing: {datetime.datetime.now()}")
     return js_result
 
 
+@app.get("/search_cache")
+def get_search_cache_stats() -> Response:
+    """
+    Get the hit and miss counters of the search cache of the worker answering the request.
+
+    :return: A JSON response containing the counters.
+    """
+    return jsonify(search_cache.stats())
+
+
 @app.route('/', methods=['GET'])
 def get_code():
     code = request.args.get('code', default=None)
@@ -98,10 +249,9 @@ def get_playlist(query):
     :param query: The search query.
     :return: A list of playlists matching the search query.
     """
-    sp = spotipy.Spotify(auth_manager=get_auth_manager())
-    res = sp.search(q=query, limit=10, type=",".join(["playlist"]))
+    items = search_cache.get_or_fetch(query, "playlist", 10, lambda: search_items(query, "playlist", 10))
 
-    return jsonify(res.get("playlists", dict()).get("items", dict()))
+    return jsonify(items)
 
 
 @app.post("/play")
@@ -109,18 +259,29 @@ def play() -> Response:
     """
     Start playback on a specified device with the given URI.
 
+    The durations of the Spotify calls are logged with the X-Trace-Id of the request and reported in the
+    Server-Timing header of the response, in milliseconds.
+
     :return: JSON response indicating the playback status
     :rtype: Response
     """
+    timings = {}
     if request.method == "POST":
         js = request.get_json()
         pprint(js)
-        print(f"Est AUTH: {datetime.datetime.now()}")
-        sp = spotipy.Spotify(auth_manager=get_auth_manager())
+        sp = get_spotify()
+        start = time.perf_counter()
         sp.shuffle(state=False, device_id=js["device"])
+        timings["shuffle"] = time.perf_counter() - start
+        start = time.perf_counter()
         sp.start_playback(device_id=js["device"], context_uri=js["playable_uri"])
+        timings["start_playback"] = time.perf_counter() - start
+        pprint({"trace_id": request.headers.get("X-Trace-Id"), **timings})
 
-    return jsonify({"status": "success"})
+    response = jsonify({"status": "success"})
+    response.headers["Server-Timing"] = ", ".join(f"{stage};dur={duration * 1000:.3f}"
+                                                  for stage, duration in timings.items())
+    return response
 
 
 if __name__ == '__main__':
@@ -0,0 +1,105 @@
+import random
+import time
+from unittest import TestCase
+
+import requests
+
+from helper_services.fake_music_daemon import Catalog, FakeMusicDaemon, Latency
+
+
+class TestLatency(TestCase):
+
+    def test_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(Latency("0.25").sample(rng), 0.25)
+        self.assertTrue(all(0.1 <= Latency("uniform:0.1,0.2").sample(rng) <= 0.2 for _ in range(100)))
+        self.assertTrue(all(Latency("normal:0.01,1").sample(rng) >= 0 for _ in range(100)))
+        samples = sorted(Latency("lognormal:0.1,0.5").sample(rng) for _ in range(1001))
+        self.assertAlmostEqual(samples[500], 0.1, delta=0.01)
+        self.assertEqual([Latency("exponential:0.1").sample(random.Random(3)) for _ in range(2)],
+                         [Latency("exponential:0.1").sample(random.Random(3)) for _ in range(2)])
+
+    def test_invalid_spec(self):
+        for spec in ("gamma:1,2", "uniform:0.1", "normal:a,b", "exponential:0", "-0.1", "uniform:0.2,0.1",
+                     "normal:0.1,-1", "lognormal:0.1,-0.5", "const:inf"):
+            with self.assertRaises(ValueError):
+                Latency(spec)
+
+
+class TestCatalog(TestCase):
+
+    def test_deterministic(self):
+        self.assertEqual(Catalog(100, seed=4).albums, Catalog(100, seed=4).albums)
+        self.assertNotEqual(Catalog(100, seed=4).albums, Catalog(100, seed=5).albums)
+
+    def test_search(self):
+        catalog = Catalog(500)
+        albums = catalog.search_albums("night", 20)
+        self.assertEqual(len(albums), 20)
+        self.assertTrue(all("night" in (album["name"] + album["artists"][0]["name"]).lower() for album in albums))
+        self.assertEqual(catalog.search_albums("nothing like this", 20), [])
+        self.assertEqual(len(catalog.search_playlists("mix", 10)), 10)
+
+
+class TestFakeMusicDaemon(TestCase):
+
+    def setUp(self):
+        self.fake = FakeMusicDaemon(seed=1).start()
+        self.addCleanup(self.fake.stop)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+
+    def get(self, path):
+        return self.session.get(self.fake.url + path, timeout=5)
+
+    def test_route_latency(self):
+        self.fake.route_latency["devices"] = Latency("uniform:0.1,0.15")
+        start = time.perf_counter()
+        self.assertEqual(self.get("/devices").status_code, 200)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+        start = time.perf_counter()
+        self.get("/isLoggedIn")
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+    def test_play_reports_timing(self):
+        self.fake.latency = 0.05
+        response = self.session.post(self.fake.url + "/play", json={"device": "d", "playable_uri": "u"}, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        start_playback = float(response.headers["Server-Timing"].split("start_playback;dur=")[1])
+        self.assertGreaterEqual(start_playback, 50)
+        self.assertEqual(self.fake.plays, [{"device": "d", "playable_uri": "u"}])
+
+    def test_records_sent_status(self):
+        self.fake.logged_in = False
+        self.assertEqual(self.get("/isLoggedIn").status_code, 401)
+        self.assertEqual(self.get("/unknown").status_code, 404)
+        self.assertEqual(self.get("/devices").status_code, 200)
+        self.assertEqual(self.fake.requests, {("isLoggedIn", 401): 1, ("unknown", 404): 1, ("devices", 200): 1})
+
+    def test_error_injection(self):
+        self.fake.error_rate = 0.5
+        self.fake.error_status = 503
+        statuses = [self.get("/devices").status_code for _ in range(40)]
+        self.assertEqual(set(statuses), {200, 503})
+        self.assertEqual(self.fake.requests["devices", 503], statuses.count(503))
+
+        repeated = FakeMusicDaemon(seed=1)
+        self.addCleanup(repeated.server.server_close)
+        repeated.error_rate = 0.5
+        repeated.error_status = 503
+        self.assertEqual([repeated.before_request("devices")[0] or 200 for _ in range(40)], statuses)
+
+    def test_rate_limit(self):
+        self.fake.rate_limit = 5
+        responses = [self.get("/devices") for _ in range(10)]
+        self.assertEqual([response.status_code for response in responses[:5]], [200] * 5)
+        self.assertEqual(responses[-1].status_code, 429)
+        self.assertEqual(responses[-1].headers["Retry-After"], "1")
+        time.sleep(0.25)
+        self.assertEqual(self.get("/devices").status_code, 200)
+
+    def test_catalog_search(self):
+        self.fake.catalog = Catalog(200)
+        albums = self.get("/search_album/golden").json()
+        self.assertEqual(albums, self.fake.catalog.search_albums("golden", 50))
+        self.assertEqual(self.get("/search_playlist/golden").json(), self.fake.catalog.search_playlists("golden", 10))
@@ -0,0 +1,272 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+import requests
+from gpiozero import Button
+from gpiozero.pins.mock import MockFactory
+from websockets.sync.server import serve
+
+from helper_services import gpio_listener
+from helper_services.gpio_listener import ChordListener, PressSender
+
+PINS = [4, 5, 6, 7]
+
+
+class TestChordListener(TestCase):
+
+    def setUp(self):
+        self.factory = MockFactory()
+        self.addCleanup(self.factory.close)
+        self.pins = [self.factory.pin(pin) for pin in PINS]
+        self.buttons = [Button(pin, pin_factory=self.factory) for pin in PINS]
+        # the receiver drives the pins low while no key is pressed
+        for pin in self.pins:
+            pin.drive_low()
+        self.chords = []
+        self.received = threading.Event()
+        self.listener = ChordListener(self.buttons, self.on_chord, chord_window=0.05, bounce_time=0.01)
+        self.listener.start()
+        self.addCleanup(self.listener.stop)
+
+    def on_chord(self, chord):
+        self.chords.append((time.perf_counter(), chord))
+        self.received.set()
+
+    def press(self, *keys):
+        for key in keys:
+            self.pins[key].drive_high()
+
+    def release(self, *keys):
+        for key in keys:
+            self.pins[key].drive_low()
+
+    def wait_for_chord(self):
+        self.assertTrue(self.received.wait(1))
+        self.received.clear()
+        return self.chords[-1][1]
+
+    def test_single_key(self):
+        start = time.perf_counter()
+        self.press(2)
+        self.assertEqual(self.wait_for_chord(), 4)
+        # bounded by the chord window, not by a polling interval
+        self.assertLess(self.chords[-1][0] - start, 0.5)
+        self.release(2)
+
+    def test_chord_within_window(self):
+        self.press(0)
+        time.sleep(0.01)
+        self.press(3)
+        self.assertEqual(self.wait_for_chord(), 9)
+
+    def test_short_tap_is_registered(self):
+        self.press(1)
+        self.release(1)
+        self.assertEqual(self.wait_for_chord(), 2)
+
+    def test_held_chord_sent_once(self):
+        self.press(0, 1)
+        self.assertEqual(self.wait_for_chord(), 3)
+        self.press(2)
+        self.release(2)
+        self.assertFalse(self.received.wait(0.15))
+        self.release(0, 1)
+        time.sleep(0.05)
+        self.press(1)
+        self.assertEqual(self.wait_for_chord(), 2)
+        self.assertEqual([chord for _, chord in self.chords], [3, 2])
+
+    def test_bouncing_release_ignored(self):
+        self.press(0)
+        self.assertEqual(self.wait_for_chord(), 1)
+        self.release(0)
+        self.press(0)
+        self.release(0)
+        self.assertFalse(self.received.wait(0.15))
+        self.assertEqual(len(self.chords), 1)
+
+    def test_no_cpu_while_idle_or_held(self):
+        start = time.process_time()
+        time.sleep(0.2)
+        self.press(0)
+        self.wait_for_chord()
+        time.sleep(0.2)
+        self.assertTrue(self.listener._thread.is_alive())
+        self.assertLess(time.process_time() - start, 0.1)
+
+
+class TestPressSender(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool_dir.cleanup)
+        self.spool_path = os.path.join(self.spool_dir.name, "presses.json")
+        self.session = mock.Mock()
+        self.sent = []
+        self.all_sent = threading.Event()
+        self.expected = 1
+        self.responses = []
+        self.session.post.side_effect = self.post
+
+    def post(self, url, data, headers, timeout):
+        response = self.responses.pop(0) if self.responses else 200
+        if isinstance(response, Exception):
+            raise response
+        self.sent.append((json.loads(data)["key"], response))
+        if len([status for _, status in self.sent if status == 200]) >= self.expected:
+            self.all_sent.set()
+        return mock.Mock(status_code=response)
+
+    def create_sender(self, **kwargs):
+        sender = PressSender("https://nginx/api/handle_button/", spool_path=self.spool_path, session=self.session,
+                             **kwargs)
+        self.addCleanup(sender.stop)
+        return sender
+
+    def test_sends_with_one_session(self):
+        sender = self.create_sender()
+        sender.start()
+        self.expected = 2
+        self.assertTrue(sender.submit(3))
+        self.assertTrue(sender.submit(5))
+        self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual(self.sent, [(3, 200), (5, 200)])
+        self.assertEqual(self.session.post.call_count, 2)
+
+    def test_sends_trace_of_press(self):
+        sender = self.create_sender()
+        sender.submit(3)
+        trace_id = sender._pending[0][2]
+        sender.start()
+        self.assertTrue(self.all_sent.wait(1))
+        headers = self.session.post.call_args.kwargs["headers"]
+        self.assertEqual(headers["X-Trace-Id"], trace_id)
+        self.assertGreaterEqual(float(headers["X-Trace-Queued"]), 0)
+
+    def test_coalesces_repeated_presses(self):
+        sender = self.create_sender(coalesce_window=10)
+        self.assertTrue(sender.submit(3))
+        self.assertFalse(sender.submit(3))
+        self.assertTrue(sender.submit(4))
+        self.assertTrue(sender.submit(3))
+        sender.start()
+        self.expected = 3
+        self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual([key for key, _ in self.sent], [3, 4, 3])
+
+    def test_retries_until_server_is_back(self):
+        self.responses = [requests.ConnectionError("restarting"), 502, 503]
+        with mock.patch.object(gpio_listener, "RETRY_BASE_DELAY", 0.01):
+            sender = self.create_sender()
+            sender.start()
+            sender.submit(7)
+            self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual(self.sent, [(7, 502), (7, 503), (7, 200)])
+
+    def test_client_errors_not_retried(self):
+        self.responses = [404]
+        sender = self.create_sender()
+        sender.start()
+        sender.submit(7)
+        sender.submit(8)
+        self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual(self.sent, [(7, 404), (8, 200)])
+
+    def test_bounded_queue_drops_oldest(self):
+        sender = self.create_sender(queue_size=2)
+        for key in (1, 2, 3):
+            sender.submit(key)
+        sender.start()
+        self.expected = 2
+        self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual([key for key, _ in self.sent], [2, 3])
+
+    def test_spool_survives_restart(self):
+        sender = self.create_sender()
+        sender.submit(9)
+        with open(self.spool_path) as f:
+            self.assertEqual([key for key, *_ in json.load(f)], [9])
+
+        restarted = self.create_sender()
+        restarted.start()
+        self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual(self.sent, [(9, 200)])
+        restarted.stop()
+        with open(self.spool_path) as f:
+            self.assertEqual(json.load(f), [])
+
+    def test_outdated_presses_dropped(self):
+        with open(self.spool_path, "w") as f:
+            json.dump([[9, time.time() - 120], [10, time.time()]], f)
+        sender = self.create_sender(max_age=60)
+        sender.start()
+        self.assertTrue(self.all_sent.wait(1))
+        self.assertEqual(self.sent, [(10, 200)])
+
+
+class TestPressSenderWebsocket(TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.traces = []
+        self.server = serve(self.handle, "127.0.0.1", 0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+        self.session = mock.Mock()
+        self.session.post.return_value = mock.Mock(status_code=200)
+
+    def handle(self, connection):
+        for message in connection:
+            press = json.loads(message)
+            self.received.append(press["key"])
+            self.traces.append(press["trace_id"])
+            if press["key"] == 9:
+                # a press taking longer than the sender waits
+                continue
+            connection.send(json.dumps({"id": press["id"], "status": 200}))
+
+    def create_sender(self):
+        port = self.server.socket.getsockname()[1]
+        sender = PressSender("https://nginx/api/handle_button/", spool_path=None, session=self.session,
+                             ws_endpoint=f"ws://127.0.0.1:{port}/ws/buttons/", coalesce_window=0)
+        self.addCleanup(sender.stop)
+        return sender
+
+    def test_sends_over_persistent_websocket(self):
+        sender = self.create_sender()
+        self.assertTrue(sender._send(3, "abc"))
+        ws = sender._ws
+        self.assertTrue(sender._send(5))
+        self.assertIs(sender._ws, ws)
+        self.assertEqual(self.received, [3, 5])
+        self.assertEqual(self.traces, ["abc", None])
+        self.session.post.assert_not_called()
+
+    def test_falls_back_to_http(self):
+        sender = self.create_sender()
+        self.assertTrue(sender._send(3))
+        self.server.shutdown()
+        sender._ws.close()
+        self.assertTrue(sender._send(5))
+        self.assertEqual(self.received, [3])
+        self.session.post.assert_called_once()
+        self.assertIsNone(sender._ws)
+        # the websocket is not tried again right away
+        self.assertTrue(sender._send(6))
+        self.assertEqual(self.session.post.call_count, 2)
+
+    def test_no_http_fallback_after_sending(self):
+        sender = self.create_sender()
+        with mock.patch.object(gpio_listener, "REQUEST_TIMEOUT", (3, 0.1)):
+            self.assertFalse(sender._send(9, "abc"))
+        self.assertEqual(self.received, [9])
+        self.session.post.assert_not_called()
+        self.assertIsNone(sender._ws)
+        # the retry goes over a new websocket again
+        self.assertTrue(sender._send(3, "def"))
+        self.assertEqual(self.received, [9, 3])
+        self.session.post.assert_not_called()
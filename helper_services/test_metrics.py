@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import spotipy
+from spotipy import SpotifyException
+
+from helper_services import spotipy_daemon
+from helper_services.metrics import Registry, SharedMetrics
+
+
+class TestRegistry(TestCase):
+
+    def test_render(self):
+        registry = Registry(const_labels={"pid": "1"})
+        requests = registry.counter("requests", "Handled requests", ("view",))
+        sessions = registry.gauge("sessions", "Open sessions")
+        duration = registry.histogram("duration_seconds", "Duration", ("view",), buckets=(0.1, 1))
+        requests.labels("play").inc()
+        requests.labels("play").inc(2)
+        requests.labels('a "b"').inc()
+        sessions.inc()
+        sessions.inc()
+        sessions.dec()
+        for value in (0.05, 0.1, 0.5, 3):
+            duration.labels("play").observe(value)
+
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP requests Handled requests",
+            "# TYPE requests counter",
+            'requests_total{pid="1",view="a \\"b\\""} 1',
+            'requests_total{pid="1",view="play"} 3',
+            "# HELP sessions Open sessions",
+            "# TYPE sessions gauge",
+            'sessions{pid="1"} 1',
+            "# HELP duration_seconds Duration",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{pid="1",view="play",le="0.1"} 2',
+            'duration_seconds_bucket{pid="1",view="play",le="1"} 3',
+            'duration_seconds_bucket{pid="1",view="play",le="+Inf"} 4',
+            'duration_seconds_sum{pid="1",view="play"} 3.65',
+            'duration_seconds_count{pid="1",view="play"} 4',
+        ])
+
+    def test_wrong_labels(self):
+        counter = Registry().counter("requests", "Handled requests", ("view", "status"))
+        with self.assertRaises(ValueError):
+            counter.labels("play")
+
+
+class TestSharedMetrics(TestCase):
+
+    @staticmethod
+    def create_registry():
+        registry = Registry()
+        registry.counter("requests", "Handled requests", ("view",))
+        registry.histogram("duration_seconds", "Duration", buckets=(1,))
+        return registry
+
+    def test_sums_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        registry = self.create_registry()
+        requests, duration = registry._metrics
+        requests.labels("play").inc()
+        duration.observe(0.5)
+        # the last snapshot of another worker
+        other = self.create_registry()
+        other._metrics[0].labels("play").inc(2)
+        other._metrics[0].labels("stop").inc()
+        other._metrics[1].observe(2)
+        with open(os.path.join(directory.name, "1.json"), "w") as f:
+            json.dump(other.snapshot(), f)
+
+        lines = SharedMetrics(registry, directory.name).render().splitlines()
+        self.assertIn('requests_total{view="play"} 3', lines)
+        self.assertIn('requests_total{view="stop"} 1', lines)
+        self.assertIn('duration_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn('duration_seconds_sum 2.5', lines)
+        # the metrics of the process itself stay as they are
+        self.assertIn('requests_total{view="play"} 1', registry.render().splitlines())
+
+
+class TestDaemonMetrics(TestCase):
+
+    def setUp(self):
+        self.client = spotipy_daemon.app.test_client()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(spotipy_daemon.shared_metrics, "directory", directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_and_spotify_calls(self):
+        sp = spotipy_daemon.InstrumentedSpotify(auth_manager=mock.Mock())
+        with mock.patch.object(spotipy_daemon, "get_spotify", return_value=sp), \
+                mock.patch.object(spotipy.Spotify, "_internal_call", return_value={"devices": []}):
+            self.assertEqual(self.client.get("/devices").status_code, 200)
+        with mock.patch.object(spotipy.Spotify, "_internal_call", side_effect=SpotifyException(429, -1, "slow")), \
+                self.assertRaises(SpotifyException):
+            sp.album("4aawyAB9vmqN3uQ7FjRGTy")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn('spotipy_daemon_http_requests_total{route="/devices",method="GET",status="200"} 1', text)
+        self.assertIn('spotipy_daemon_spotify_calls_total{endpoint="GET me/player/devices",status="200"} 1', text)
+        self.assertIn('spotipy_daemon_spotify_calls_total{endpoint="GET albums/:id",status="429"} 1', text)
+        self.assertIn('# TYPE spotipy_daemon_search_cache_lookups counter', text)
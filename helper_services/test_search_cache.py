@@ -0,0 +1,78 @@
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from helper_services.search_cache import SearchCache
+
+
+class TestSearchCache(TestCase):
+
+    def setUp(self):
+        self.shared_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.shared_dir.cleanup)
+        self.cache = SearchCache(maxsize=2, ttl=60, shared_dir=self.shared_dir.name)
+
+    def test_normalized_hit(self):
+        self.cache.get_or_fetch("Pink  Floyd", "album", 50, lambda: ["result"])
+        self.assertEqual(self.cache.get_or_fetch(" pink floyd", "album", 50, lambda: ["other"]), ["result"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_type_and_limit_are_part_of_key(self):
+        self.cache.get_or_fetch("queen", "album", 50, lambda: ["album"])
+        self.assertEqual(self.cache.get_or_fetch("queen", "playlist", 50, lambda: ["playlist"]), ["playlist"])
+        self.assertEqual(self.cache.get_or_fetch("queen", "album", 10, lambda: ["10"]), ["10"])
+
+    def test_lru_eviction(self):
+        for query in ["a", "b", "c"]:
+            self.cache.get_or_fetch(query, "album", 50, lambda: [query])
+        self.assertEqual(self.cache.stats()["size"], 2)
+        self.assertIsNone(self.cache._get_local(self.cache.make_key("a", "album", 50)))
+
+    def test_ttl_expiry(self):
+        cache = SearchCache(ttl=0.01, shared_dir=self.shared_dir.name)
+        cache.get_or_fetch("queen", "album", 50, lambda: ["old"])
+        time.sleep(0.02)
+        self.assertEqual(cache.get_or_fetch("queen", "album", 50, lambda: ["new"]), ["new"])
+
+    def test_concurrent_fetches_coalesce(self):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return ["result"]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get_or_fetch("x", "album", 50, fetch)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [["result"]] * 5)
+
+    def test_shared_between_processes(self):
+        other_worker = SearchCache(ttl=60, shared_dir=self.shared_dir.name)
+        self.cache.get_or_fetch("queen", "album", 50, lambda: ["result"])
+        self.assertEqual(other_worker.get_or_fetch("queen", "album", 50, lambda: ["other"]), ["result"])
+        self.assertEqual(other_worker.shared_hits, 1)
+
+    def test_lookups_reported(self):
+        outcomes = []
+        other_worker = SearchCache(ttl=60, shared_dir=self.shared_dir.name, on_lookup=outcomes.append)
+        self.cache.get_or_fetch("queen", "album", 50, lambda: ["result"])
+        for _ in range(2):
+            other_worker.get_or_fetch("queen", "album", 50, lambda: ["other"])
+        other_worker.get_or_fetch("abba", "album", 50, lambda: ["abba"])
+        self.assertEqual(outcomes, ["shared_hits", "hits", "misses"])
+
+    def test_failed_fetch_releases_key_lock(self):
+        def fetch():
+            raise TimeoutError
+
+        with self.assertRaises(TimeoutError):
+            self.cache.get_or_fetch("queen", "album", 50, fetch)
+        self.assertEqual(self.cache._key_locks, {})
+        self.assertEqual(self.cache.get_or_fetch("queen", "album", 50, lambda: ["result"]), ["result"])